@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 PROGRAM = 'PDF2CBZ'
 
+from scripts.startup_profile import StartupProfiler
+PROFILER = StartupProfiler() # python launcher.py profile, prints where the startup time goes
+
 import os
 import platform
 
@@ -31,12 +34,66 @@ def set_program_root_folder_in_eviorment():
 
 set_enviorment_variables()
 set_program_root_folder_in_eviorment()
+PROFILER.mark('environment')
 
-from scripts.main import PDF2CBZmain
-from PyQt5 import QtWidgets
 import sys
 
 if __name__ == "__main__":
+    # the modes without a window branch before PyQt5, the database and scripts.main are loaded
+    if 'compile' in sys.argv:
+        # python launcher.py compile, builds the .pyx kernels in scripts (needs cython and a c compiler)
+        from script_pack.compiler_software import CythonCompiler
+        CythonCompiler(__file__, subfolder='scripts')
+        sys.exit()
+
+    elif 'worker' in sys.argv:
+        # python launcher.py worker [once], drains the queue without a window
+        from scripts.worker import run_worker
+        run_worker(once='once' in sys.argv)
+        sys.exit()
+
+    elif 'duplicates' in sys.argv:
+        # python launcher.py duplicates, full content hashes of the source folder and what is in there twice
+        from scripts.worker import run_duplicates_report
+        run_duplicates_report()
+        sys.exit()
+
+    elif 'coordinator' in sys.argv:
+        # python launcher.py coordinator [local worker count] [cbz], queues the source folder
+        from scripts.worker import run_coordinator
+        counts = [int(x) for x in sys.argv if x.isdigit()]
+        run_coordinator(workers=counts[0] if counts else 0, archives='cbz' in sys.argv)
+        sys.exit()
+
+    from PyQt5 import QtCore, QtGui, QtWidgets
+    PROFILER.mark('import PyQt5')
+
+    # something is on screen before the schema upgrade, the column discovery and the imports
+    # behind scripts.main run, the window itself needs the settings row so it waits for them
     app = QtWidgets.QApplication(sys.argv)
+    pixmap = QtGui.QPixmap(360, 90)
+    pixmap.fill(QtGui.QColor('black'))
+    splash = QtWidgets.QSplashScreen(pixmap)
+    splash.showMessage(f'{PROGRAM} LOADING', QtCore.Qt.AlignCenter, QtGui.QColor('white'))
+    splash.show()
+    app.processEvents()
+    PROFILER.mark('first paint')
+
+    import scripts.database_stuff
+    PROFILER.mark('database connection and schema')
+
+    from scripts.main import PDF2CBZmain
+    PROFILER.mark('import scripts.main')
+
     window = PDF2CBZmain()
-    app.exec_()
\ No newline at end of file
+    splash.finish(window)
+    PROFILER.mark('window built')
+
+    if 'profile' in sys.argv:
+        def startup_report():
+            PROFILER.mark('event loop running')
+            print(PROFILER.report())
+
+        QtCore.QTimer.singleShot(0, startup_report)
+
+    app.exec_()
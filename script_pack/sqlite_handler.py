@@ -1,5 +1,5 @@
 from PyQt5.Qt     import QObject, QRunnable, QThreadPool
-from PyQt5.QtCore import pyqtSignal, pyqtSlot
+from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot
 from functools    import partial
 from sqlite3      import Error
 import os
@@ -7,7 +7,7 @@ import pathlib
 import platform
 import sqlite3
 import sys
-import time
+import threading
 import traceback
 
 class SQLite:
@@ -33,12 +33,11 @@ class SQLite:
         self.techdict = {}
         self.sqliteconnection = None
         self.sqlitecursor = None
-        self.release_grip = False
         self.threadpool = QThreadPool(maxThreadCount=1, expiryTimeout=-1)
+        # not waited for, the pool has a single thread so every read and write
+        # queued after this one runs once the connection exists
         thread = self.Worker(partial(self.init_connection_and_cursor))
         self.threadpool.start(thread)
-        while not self.release_grip:
-            time.sleep(0.01)
 
     def init_connection_and_cursor(self):
         """
@@ -178,8 +177,6 @@ class SQLite:
                 print('HARD QUIT!')
                 sys.exit()
 
-        self.release_grip = True
-
     def sqlite_superfunction(self, connection, table, column, type):
         """
         if table isnt found one will be created for you, same is true for columns
@@ -217,7 +214,7 @@ class SQLite:
         """
         close to unnessesary, but when you have a ton of DB.things it actually helps
         """
-        return self.sqlite_superfunction(self.sqliteconnection, table, column, type)
+        return self.sqlite_superfunction('local_database', table, column, type)
 
     def empty_insert_query(self, table):
         rv = self.road(empty_query_table=table)
@@ -279,6 +276,7 @@ class SQLite:
         :return: data or bool
         """
         rd = dict(return_value=[])
+        done = threading.Event()
 
         if description:
             def thread_description(self, rd):
@@ -300,18 +298,12 @@ class SQLite:
         else:
             thread = self.Worker(partial(self.read_master, rd, query, values, fetch))
 
+        thread.signals.finished.connect(done.set, type=Qt.DirectConnection)
         self.threadpool.start(thread)
+        done.wait()
 
-        counter = -1
-        while rd['return_value'] == []:
-            if counter < 1:
-                time.sleep(0.01)
-            elif counter < 2:
-                time.sleep(0.05)
-            elif counter < 5:
-                time.sleep(0.10)
-            else:
-                time.sleep(0.20)
+        if not rd['return_value']:
+            return False # the read raised, the traceback is printed by the worker
 
         return rd['return_value'][0]
 
@@ -340,8 +332,6 @@ class SQLite:
             self.init_connection_and_cursor()
             self.sqliteconnection.commit()
 
-        time.sleep(0.05)
-
     def write_many_master(self, query, values):
         """
         Write Many (executemany instead of execute)
@@ -0,0 +1,150 @@
+import os
+import shutil
+import threading
+import time
+
+JPEG_BYTES_PER_PIXEL = 0.45 # pdftoppm jpeg at quality=100, measured on our comics
+WEBP_BYTES_PER_PIXEL = 0.08 # method=6 quality=70, generous
+GRAYSCALE_SHRINK = 2 # gray jpegs lose the chroma planes, conservative
+SAFETY_MARGIN_MB = 100 # same threshold the old HDD FULL check used
+
+def page_pixels(page_size, dpi):
+    """
+    :param page_size: tuple with width, height in pts (1/72 inch)
+    :param dpi: integer
+    :return: integer
+    """
+    width, height = page_size
+    return int((width / 72) * dpi) * int((height / 72) * dpi)
+
+def estimate_job_footprint(page_count, page_size, dpi, grayscale=False):
+    """
+    estimates how much tmp space a job needs, one jpeg is alive per page
+    until its webp is written, all webp pages stay until the archive is made
+    :param page_count: integer
+    :param page_size: tuple with width, height in pts
+    :param dpi: integer
+    :param grayscale: bool, one channel jpegs from pdftoppm -gray
+    :return: dictionary with bytes per jpeg, per webp and the webp total
+    """
+    pixels = page_pixels(page_size, dpi)
+    jpeg = int(pixels * JPEG_BYTES_PER_PIXEL / (GRAYSCALE_SHRINK if grayscale else 1))
+    webp = int(pixels * WEBP_BYTES_PER_PIXEL)
+    return dict(jpeg=jpeg, webp=webp, webp_total=webp * page_count, pixels=pixels)
+
+def folder_usage(path):
+    """
+    :param path: string
+    :return: integer bytes used by files directly inside path
+    """
+    total = 0
+    if not os.path.exists(path):
+        return total
+
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file():
+                    total += entry.stat().st_size
+            except FileNotFoundError:
+                continue
+
+    return total
+
+class TmpBudget:
+    def __init__(self, base_dir, margin_mb=SAFETY_MARGIN_MB):
+        """
+        jobs and page batches reserve their estimated footprint before writing
+        into base_dir, capacity is what the disk has free plus what our own
+        jobs already wrote, minus a safety margin. Reservations live in this
+        process only, processes sharing base_dir set share to how many of them
+        there are and each plans with that part of the capacity
+        :param base_dir: string (TMP_DIR or systems tmp-folder)
+        :param margin_mb: integer
+        """
+        self.base_dir = base_dir
+        self.margin = margin_mb * 1000000
+        self.share = 1
+        self.condition = threading.Condition()
+        self.jobs = {}
+
+    def register(self, job, folders):
+        """
+        :param job: string, any unique key (tmp_jpeg_folder is used)
+        :param folders: list with folders belonging to this job
+        """
+        with self.condition:
+            self.jobs[job] = dict(reserved=0, folders=folders, peak=0)
+
+    def used(self, job=None):
+        """
+        :param job: string or None for every job
+        :return: integer bytes actually on disk
+        """
+        jobs = [job] if job else list(self.jobs)
+        return sum(folder_usage(x) for j in jobs if j in self.jobs for x in self.jobs[j]['folders'])
+
+    def reserved(self, job=None):
+        if job:
+            return self.jobs[job]['reserved'] if job in self.jobs else 0
+
+        return sum(x['reserved'] for x in self.jobs.values())
+
+    def capacity(self):
+        if not os.path.exists(self.base_dir):
+            return 0
+
+        _, __, free = shutil.disk_usage(self.base_dir)
+        return (free + self.used() - self.margin) // self.share
+
+    def fits(self, nbytes):
+        return self.reserved() + nbytes <= self.capacity()
+
+    def admit(self, job, nbytes, wait=True, timeout=None):
+        """
+        reserves nbytes for job, when wait is True this blocks until another
+        job releases a reservation, returns False if it can never fit (only
+        job's own bytes are reserved, nothing else is going to make room)
+        :param job: string
+        :param nbytes: integer
+        :param wait: bool
+        :param timeout: float or None
+        :return: bool
+        """
+        started = time.time()
+        with self.condition:
+            while not self.fits(nbytes):
+                if not wait or self.reserved() - self.reserved(job) == 0:
+                    return False
+
+                if timeout and time.time() - started > timeout:
+                    return False
+
+                self.condition.wait(timeout=0.5)
+
+            self.jobs[job]['reserved'] += nbytes
+            return True
+
+    def release(self, job, nbytes):
+        with self.condition:
+            if job in self.jobs:
+                self.jobs[job]['reserved'] = max(0, self.jobs[job]['reserved'] - nbytes)
+                self.condition.notify_all()
+
+    def report(self, job):
+        """
+        :param job: string
+        :return: dictionary with reserved, used and peak bytes for job
+        """
+        with self.condition:
+            if job not in self.jobs:
+                return dict(reserved=0, used=0, peak=0)
+
+            used = self.used(job)
+            self.jobs[job]['peak'] = max(self.jobs[job]['peak'], used)
+            return dict(reserved=self.jobs[job]['reserved'], used=used, peak=self.jobs[job]['peak'])
+
+    def finish(self, job):
+        with self.condition:
+            self.jobs.pop(job, None)
+            self.condition.notify_all()
@@ -0,0 +1,162 @@
+from PIL import Image
+from scripts.page_analysis import choose_encoding
+from scripts.preview import prepare_page
+import concurrent.futures
+import io
+
+# off: the WEBP QUALITY slider decides, ssim: the lowest quality whose sample pages reach
+# the target score, size: the highest quality whose sample pages fit the MB per page budget
+AUTOTUNE_MODES = ['off', 'ssim', 'size']
+DEFAULT_AUTOTUNE = 'off'
+DEFAULT_TARGET_SSIM = 0.97
+DEFAULT_TARGET_MB_PAGE = 0.4
+AUTOTUNE_SAMPLES = 6
+AUTOTUNE_MIN_QUALITY = 20
+AUTOTUNE_MAX_QUALITY = 95
+SSIM_WIDTH = 1600 # pages are compared about as wide as a tablet shows them, full 485 dpi costs gigabytes of floats
+SSIM_WINDOW = 8
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+def ssim_luma(image):
+    """
+    :param image: PIL image
+    :return: numpy float64 array (height, width), luma no wider than SSIM_WIDTH
+    """
+    import numpy as np
+
+    luma = image.convert('L')
+    factor = -(-luma.size[0] // SSIM_WIDTH)
+    if factor > 1:
+        luma = luma.reduce(factor)
+
+    return np.asarray(luma, dtype=np.float64)
+
+def box_mean(array, window=SSIM_WINDOW):
+    """
+    mean of every window x window block through a summed area table, no python loops
+    :param array: numpy float64 array (height, width)
+    :param window: integer
+    :return: numpy array (height - window + 1, width - window + 1)
+    """
+    import numpy as np
+
+    table = np.pad(array, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+    rv = table[window:, window:] - table[:-window, window:] - table[window:, :-window] + table[:-window, :-window]
+    return rv / (window * window)
+
+def ssim(reference, distorted, window=SSIM_WINDOW):
+    """
+    structural similarity with a uniform window (Wang et al. 2004 use a gaussian one, the
+    ranking of webp qualities comes out the same and this needs no scipy)
+    :param reference: numpy float64 array from ssim_luma
+    :param distorted: numpy float64 array, same shape
+    :param window: integer
+    :return: float, 1.0 is identical
+    """
+    if min(reference.shape) < window:
+        return 1.0
+
+    mu_a, mu_b = box_mean(reference, window), box_mean(distorted, window)
+    var_a = box_mean(reference * reference, window) - mu_a * mu_a
+    var_b = box_mean(distorted * distorted, window) - mu_b * mu_b
+    covariance = box_mean(reference * distorted, window) - mu_a * mu_b
+
+    rv = (2 * mu_a * mu_b + SSIM_C1) * (2 * covariance + SSIM_C2)
+    rv /= (mu_a * mu_a + mu_b * mu_b + SSIM_C1) * (var_a + var_b + SSIM_C2)
+    return float(rv.mean())
+
+def tune_job(job):
+    """
+    process job, encodes one sample page like a conversion would and scores the
+    result against the image that went into the encoder. Pages classify sends to
+    lossless (bilevel, palette) look the same at every quality and get no score
+    :param job: tuple -> image_path, webp_options, resize, classify, margin_trim
+    :return: tuple -> webp bytes, ssim or None for a lossless page
+    """
+    image_path, options, resize, classify, margin_trim = job
+    image = prepare_page(image_path, resize, margin_trim)
+
+    if classify:
+        image, options, _ = choose_encoding(image, options)
+
+    buffer = io.BytesIO()
+    image.save(buffer, 'webp', **options)
+    if options.get('lossless'):
+        return len(buffer.getvalue()), None
+
+    with Image.open(io.BytesIO(buffer.getvalue())) as encoded:
+        score = ssim(ssim_luma(image), ssim_luma(encoded))
+
+    return len(buffer.getvalue()), score
+
+def tune_quality(image_paths, options, mode, target, resize=None, classify=False, margin_trim=None, workers=None):
+    """
+    binary search over AUTOTUNE_MIN_QUALITY - AUTOTUNE_MAX_QUALITY, every step encodes all
+    sample pages at once on a process pool, both size and ssim grow with quality. Only
+    the lossy pages are scored, with none of them the slider quality is kept, a target
+    the search cannot reach is reported as missed
+    :param image_paths: list with rendered sample pages
+    :param options: dictionary from webp_options, only quality is searched
+    :param mode: string, 'ssim' or 'size'
+    :param target: float, mean ssim or MB per page
+    :param resize: None or dictionary -> width, quality
+    :param classify: bool
+    :param margin_trim: None or tuple from margins.book_trim
+    :param workers: integer or None
+    :return: dictionary -> quality, ssim (mean over lossy pages or None), mb_page, steps, missed
+    """
+    measured = {}
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        def measure(quality):
+            if quality not in measured:
+                jobs = [(x, dict(options, quality=quality), resize, classify, margin_trim,) for x in image_paths]
+                rv = list(executor.map(tune_job, jobs))
+                scores = [x[1] for x in rv if x[1] is not None]
+                measured[quality] = dict(
+                    quality=quality,
+                    ssim=round(sum(scores) / len(scores), 4) if scores else None,
+                    mb_page=round(sum(x[0] for x in rv) / len(rv) / 1000000, 3),
+                )
+
+            return measured[quality]
+
+        if measure(options['quality'])['ssim'] is None:
+            # every sample page is lossless, no quality would change what was measured
+            return dict(measured[options['quality']], missed=False, steps=1)
+
+        low, high = AUTOTUNE_MIN_QUALITY, AUTOTUNE_MAX_QUALITY
+        while low < high:
+            if mode == 'size':
+                middle = (low + high + 1) // 2
+                if measure(middle)['mb_page'] <= target:
+                    low = middle
+                else:
+                    high = middle - 1
+            else:
+                middle = (low + high) // 2
+                if measure(middle)['ssim'] >= target:
+                    high = middle
+                else:
+                    low = middle + 1
+
+        rv = dict(measure(low))
+
+    if mode == 'size':
+        rv['missed'] = rv['mb_page'] > target
+    else:
+        rv['missed'] = rv['ssim'] < target
+
+    rv['steps'] = len(measured)
+    return rv
+
+def autotune_summary(result, mode):
+    """
+    :param result: dictionary from tune_quality
+    :param mode: string
+    :return: string -> 'AUTO SSIM Q62 | SSIM 0.971 | 0.31MB/PAGE', ' | TARGET MISSED' when the search
+             ended at its limit, 'SSIM LOSSLESS' when no sample page was lossy and the slider quality was kept
+    """
+    rv = f"AUTO {mode.upper()} Q{result['quality']} | SSIM {result['ssim'] or 'LOSSLESS'} | {result['mb_page']}MB/PAGE"
+    return rv + (' | TARGET MISSED' if result.get('missed') else '')
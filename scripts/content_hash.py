@@ -0,0 +1,176 @@
+from scripts.database_stuff import sqlite
+import concurrent.futures
+import hashlib
+import mmap
+import os
+
+# the fingerprint (main.fingerprint) only reads the first few kb and the size, good enough
+# to find a file again but not to tell two files apart. These hashes read every byte
+
+HASH_CHUNK = 8 * 1024 * 1024
+HASH_WORKERS = max(1, min(4, (os.cpu_count() or 1) // 2)) # hashing is mostly disk bound
+
+# convert: duplicates are converted like any other file, skip: a file whose content is
+# already converted under another name is finished without output, link: it gets a hard
+# link (or copy) of that cbz under its own name
+DUPLICATE_RULES = ['convert', 'skip', 'link']
+DEFAULT_DUPLICATE_RULE = 'convert'
+
+def content_hash(path):
+    """
+    blake2b over the whole file, read through a memory map so the pages come
+    straight from the page cache without a copy into python for every read
+    :param path: string
+    :return: string, hex digest
+    """
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return digest.hexdigest()
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, len(mapped), HASH_CHUNK):
+                    digest.update(view[offset:offset + HASH_CHUNK])
+            finally:
+                view.release()
+
+    return digest.hexdigest()
+
+def hash_job(job):
+    """
+    process job
+    :param job: tuple -> path, size, mtime
+    :return: tuple -> path, size, mtime, hex digest or None when the file cannot be read
+    """
+    path, size, mtime = job
+    try:
+        return path, size, mtime, content_hash(path)
+    except (OSError, ValueError):
+        return path, size, mtime, None
+
+def stale_paths(paths):
+    """
+    :param paths: list with paths
+    :return: list with (path, size, mtime) for the paths without a hash of their current version
+    """
+    rv = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+
+        row = sqlite.ro('select size, mtime from hashes where path = (?)', path)
+        if not row or row[0] != stat.st_size or row[1] != stat.st_mtime:
+            rv.append((path, stat.st_size, stat.st_mtime,))
+
+    return rv
+
+def store_hash(path, size, mtime, digest, md5):
+    """
+    :param path: string
+    :param size: integer
+    :param mtime: float
+    :param digest: string
+    :param md5: string, fingerprint
+    """
+    query = 'insert into hashes (path, size, mtime, content_hash, md5) values (?,?,?,?,?) on conflict (path) '
+    query += 'do update set size = excluded.size, mtime = excluded.mtime, content_hash = excluded.content_hash, '
+    query += 'md5 = excluded.md5, converted = case when content_hash = excluded.content_hash then converted end'
+    sqlite.w(query, (path, size, mtime, digest, md5,))
+
+def hash_files(paths, fingerprint, workers=HASH_WORKERS):
+    """
+    hashes every path that changed since it was last hashed on a process pool and stores the result
+    :param paths: list with paths
+    :param fingerprint: function(path) -> md5, stored next to the hash
+    :param workers: integer
+    :return: integer, files hashed
+    """
+    jobs = stale_paths(paths)
+    if not jobs:
+        return 0
+
+    count = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for path, size, mtime, digest in executor.map(hash_job, jobs, chunksize=4):
+            if digest:
+                store_hash(path, size, mtime, digest, fingerprint(path))
+                count += 1
+
+    return count
+
+def ensure_hash(path, fingerprint):
+    """
+    :param path: string
+    :param fingerprint: function(path) -> md5
+    :return: string, hex digest of path as it is now or None
+    """
+    for path, size, mtime in stale_paths([path]):
+        _, _, _, digest = hash_job((path, size, mtime,))
+        if digest:
+            store_hash(path, size, mtime, digest, fingerprint(path))
+
+    rv = sqlite.ro('select content_hash from hashes where path = (?)', path)
+    return rv[0] if rv else None
+
+def mark_converted(path):
+    """
+    :param path: string, source file of a successful conversion
+    """
+    sqlite.w('update hashes set converted = 1 where path = (?)', path)
+
+def converted_duplicate(path, digest):
+    """
+    :param path: string
+    :param digest: string
+    :return: string, path of another file with the same content that has been converted, or None
+    """
+    query = 'select path from hashes where content_hash = (?) and path != (?) and converted = 1'
+    rv = sqlite.ra(query, (digest, path,)) or []
+    return next((x[0] for x in rv if os.path.exists(x[0])), None)
+
+def same_content_converted(path, md5):
+    """
+    the fingerprint says md5 has been converted, the hashes tell if it really was this content
+    :param path: string
+    :param md5: string
+    :return: bool or None when the hashes dont know
+    """
+    rv = sqlite.ro('select content_hash from hashes where path = (?)', path)
+    if not rv or not rv[0]:
+        return None
+
+    if sqlite.ro('select 1 from hashes where content_hash = (?) and converted = 1', rv[0]):
+        return True
+
+    # only a false positive if the conversion under this fingerprint was hashed as well
+    if sqlite.ro('select 1 from hashes where md5 = (?) and converted = 1', md5):
+        return False
+
+    return None
+
+def duplicates_report(limit=60):
+    """
+    :param limit: integer, groups listed
+    :return: string
+    """
+    query = 'select content_hash, count(*), sum(size) from hashes where content_hash is not null '
+    query += 'group by content_hash having count(*) > 1 order by sum(size) desc'
+    groups = sqlite.ra(query) or []
+
+    query = 'select md5 from hashes where md5 is not null group by md5 having count(distinct content_hash) > 1'
+    collisions = sqlite.ra(query) or []
+
+    wasted = sum(size - size // count for _, count, size in groups)
+    lines = [f'{len(groups)} GROUPS OF IDENTICAL FILES | {int(wasted / 1000000)}MB DUPLICATED | '
+             f'{len(collisions)} QUICK FINGERPRINTS SHARED BY DIFFERENT FILES']
+
+    for digest, count, size in groups[0:limit]:
+        lines.append('')
+        for path, converted in sqlite.ra('select path, converted from hashes where content_hash = (?)', digest) or []:
+            lines.append(f"{'CONVERTED ' if converted else ''}{path}")
+
+    return '\n'.join(lines)
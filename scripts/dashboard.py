@@ -0,0 +1,112 @@
+from collections import deque
+import os
+import psutil
+import threading
+import time
+
+STAGES = ['render', 'encode', 'archive']
+DASHBOARD_WINDOW = 30 # seconds the page rates are averaged over
+DASHBOARD_INTERVAL = 1000 # ms between refreshes while the dashboard is open
+DASHBOARD_ETA_SECONDS = 10 # the queue projection reads the database, it is refreshed less often
+
+class PipelineStats:
+    def __init__(self, window=DASHBOARD_WINDOW):
+        """
+        the pipelines count pages as they pass a stage, the dashboard turns that into
+        pages/sec. Counting is an append under a lock, nothing is computed until read
+        :param window: integer, seconds
+        """
+        self.window = window
+        self.events = {x: deque(maxlen=100000) for x in STAGES}
+        self.counted = dict.fromkeys(STAGES, 0)
+        self.lock = threading.Lock()
+
+    def count(self, stage, pages=1):
+        """
+        :param stage: string, key in STAGES
+        :param pages: integer
+        """
+        if not pages:
+            return
+
+        with self.lock:
+            self.events[stage].append((time.time(), pages,))
+            self.counted[stage] += pages
+
+    def rates(self):
+        """
+        :return: dictionary with stage: pages per second over the last window
+        """
+        cutoff = time.time() - self.window
+        rv = {}
+        with self.lock:
+            for stage, events in self.events.items():
+                while events and events[0][0] < cutoff:
+                    events.popleft()
+
+                rv[stage] = sum(x[1] for x in events) / self.window
+
+        return rv
+
+    def totals(self):
+        """
+        :return: dictionary with stage: pages since start
+        """
+        with self.lock:
+            return dict(self.counted)
+
+class ProcessMonitor:
+    def __init__(self):
+        """
+        cpu and memory of this process and every process below it (render, encode and
+        thumbnail pools). psutil measures cpu between two calls on the same Process
+        object, so they are kept between samples
+        """
+        self.root = psutil.Process()
+        self.known = {self.root.pid: self.root}
+
+    def sample(self):
+        """
+        :return: list with dictionaries -> pid, main (bool), cpu (percent of one core), rss (bytes)
+        """
+        try:
+            processes = [self.root] + self.root.children(recursive=True)
+        except psutil.Error:
+            processes = [self.root]
+
+        rv = []
+        for process in processes:
+            process = self.known.setdefault(process.pid, process)
+            try:
+                with process.oneshot():
+                    rv.append(dict(pid=process.pid, main=process.pid == self.root.pid,
+                                   cpu=process.cpu_percent(None), rss=process.memory_info().rss))
+            except psutil.Error:
+                continue
+
+        alive = [x['pid'] for x in rv]
+        self.known = {k: v for k, v in self.known.items() if k in alive}
+        return rv
+
+def format_seconds(seconds):
+    """
+    :param seconds: float
+    :return: string -> '2h 05m' or '4m 10s'
+    """
+    seconds = int(max(0, seconds))
+    if seconds >= 3600:
+        return f'{seconds // 3600}h {str(seconds % 3600 // 60).zfill(2)}m'
+
+    return f'{seconds // 60}m {str(seconds % 60).zfill(2)}s'
+
+def disk_text(label, path):
+    """
+    :param label: string
+    :param path: string
+    :return: string or None when path doesnt exist
+    """
+    if not path or not os.path.exists(path):
+        return None
+
+    total, used, free = psutil.disk_usage(path)[0:3]
+    return f'{label}: {int(used / 1000000)}/{int(total / 1000000)}mb USED | {int(free / 1000000)}mb FREE'
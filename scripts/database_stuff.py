@@ -21,10 +21,97 @@ class DB:
         poppler_path = sqlite.db_sqlite('settings', 'poppler_path')
         resize_4k = sqlite.db_sqlite('settings', 'resize_4k', 'integer')
         store_covers = sqlite.db_sqlite('settings', 'store_covers', 'integer')
+        in_memory = sqlite.db_sqlite('settings', 'in_memory', 'integer')
+        memory_cap_mb = sqlite.db_sqlite('settings', 'memory_cap_mb', 'integer')
+        webp_preset = sqlite.db_sqlite('settings', 'webp_preset')
+        classify_pages = sqlite.db_sqlite('settings', 'classify_pages', 'integer')
+        resize_quality = sqlite.db_sqlite('settings', 'resize_quality')
+        verify_cbz = sqlite.db_sqlite('settings', 'verify_cbz', 'integer')
+        job_order = sqlite.db_sqlite('settings', 'job_order')
+        schema_version = sqlite.db_sqlite('settings', 'schema_version', 'integer')
+        renderer = sqlite.db_sqlite('settings', 'renderer')
+        page_policy = sqlite.db_sqlite('settings', 'page_policy')
+        trim_margins = sqlite.db_sqlite('settings', 'trim_margins', 'integer')
+        duplicate_rule = sqlite.db_sqlite('settings', 'duplicate_rule')
+        page_cache_mb = sqlite.db_sqlite('settings', 'page_cache_mb', 'integer')
+        autotune = sqlite.db_sqlite('settings', 'autotune')
+        autotune_ssim = sqlite.db_sqlite('settings', 'autotune_ssim', 'float')
+        autotune_mb_page = sqlite.db_sqlite('settings', 'autotune_mb_page', 'float')
 
     class files:
         md5 = sqlite.db_sqlite('files', 'md5')
-        cover = sqlite.db_sqlite('files', 'cover', 'blob')
+        cover = sqlite.db_sqlite('files', 'cover', 'blob') # before schema 2, emptied by upgrade_schema
         converted = sqlite.db_sqlite('files', 'converted', 'integer')
         cover_data = sqlite.db_sqlite('files', 'cover_data')
+        page_encodings = sqlite.db_sqlite('files', 'page_encodings')
+        render_mode = sqlite.db_sqlite('files', 'render_mode')
+        monochrome = sqlite.db_sqlite('files', 'monochrome', 'integer')
+        pages = sqlite.db_sqlite('files', 'pages', 'integer')
+        page_width = sqlite.db_sqlite('files', 'page_width', 'float')
+        page_height = sqlite.db_sqlite('files', 'page_height', 'float')
+        blank_pages = sqlite.db_sqlite('files', 'blank_pages', 'integer')
+        duplicate_pages = sqlite.db_sqlite('files', 'duplicate_pages', 'integer')
+        skipped_pages = sqlite.db_sqlite('files', 'skipped_pages', 'integer')
+        margin_trim = sqlite.db_sqlite('files', 'margin_trim')
+        autotune_key = sqlite.db_sqlite('files', 'autotune_key')
+        autotune_quality = sqlite.db_sqlite('files', 'autotune_quality', 'integer')
+        autotune_data = sqlite.db_sqlite('files', 'autotune_data')
 
+    class covers:
+        md5 = sqlite.db_sqlite('covers', 'md5')
+        cover = sqlite.db_sqlite('covers', 'cover', 'blob')
+
+    class hashes:
+        path = sqlite.db_sqlite('hashes', 'path')
+        size = sqlite.db_sqlite('hashes', 'size', 'integer')
+        mtime = sqlite.db_sqlite('hashes', 'mtime', 'float')
+        content_hash = sqlite.db_sqlite('hashes', 'content_hash')
+        md5 = sqlite.db_sqlite('hashes', 'md5')
+        converted = sqlite.db_sqlite('hashes', 'converted', 'integer')
+
+    class queue:
+        path = sqlite.db_sqlite('queue', 'path')
+        md5 = sqlite.db_sqlite('queue', 'md5')
+        state = sqlite.db_sqlite('queue', 'state')
+        retries = sqlite.db_sqlite('queue', 'retries', 'integer')
+        priority = sqlite.db_sqlite('queue', 'priority', 'integer')
+        mtime = sqlite.db_sqlite('queue', 'mtime', 'float')
+        queued_at = sqlite.db_sqlite('queue', 'queued_at', 'float')
+        started_at = sqlite.db_sqlite('queue', 'started_at', 'float')
+        finished_at = sqlite.db_sqlite('queue', 'finished_at', 'float')
+        error = sqlite.db_sqlite('queue', 'error')
+        worker = sqlite.db_sqlite('queue', 'worker')
+        lease_until = sqlite.db_sqlite('queue', 'lease_until', 'float')
+
+SCHEMA_VERSION = 3
+
+def upgrade_schema():
+    """
+    schema 2: covers move from files into their own table so fingerprint lookups never
+    drag blobs along, files.md5 gets a unique index (duplicate rows from racing inserts
+    are merged first) and queue.path an index.
+    schema 3: hashes (full content hash per path) gets a unique path index for upserts
+    and indexes for the duplicate lookups. Every step is safe to run again, the version
+    is written last
+    """
+    rv = sqlite.ro('select schema_version from settings where id is 1')
+    if rv and (rv[0] or 0) >= SCHEMA_VERSION:
+        return
+
+    sqlite.w('create unique index if not exists covers_md5 on covers (md5)')
+    sqlite.w('insert or ignore into covers (md5, cover) select md5, cover from files where cover is not null')
+    sqlite.w('update files set cover = null where cover is not null')
+
+    sqlite.w('update files set converted = 1 where md5 in (select md5 from files where converted)')
+    sqlite.w('delete from files where md5 is not null and id not in (select min(id) from files group by md5)')
+    sqlite.w('create unique index if not exists files_md5 on files (md5)')
+    sqlite.w('create index if not exists queue_path on queue (path)')
+
+    sqlite.w('delete from hashes where path is not null and id not in (select min(id) from hashes group by path)')
+    sqlite.w('create unique index if not exists hashes_path on hashes (path)')
+    sqlite.w('create index if not exists hashes_content_hash on hashes (content_hash)')
+    sqlite.w('create index if not exists hashes_md5 on hashes (md5)')
+
+    sqlite.w('update settings set schema_version = (?) where id is 1', SCHEMA_VERSION)
+
+upgrade_schema()
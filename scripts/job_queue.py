@@ -0,0 +1,256 @@
+from collections            import deque
+from contextlib             import closing
+from scripts.database_stuff import sqlite
+import os
+import platform
+import random
+import sqlite3
+import threading
+import time
+
+ORDERING_POLICIES = ['shortest-first', 'oldest-first', 'manual', 'random']
+DEFAULT_ORDERING = 'shortest-first'
+LETTER_AREA = 612 * 792 # pts², used for cost when page size is unknown
+DEFAULT_PAGES_PER_SECOND = 1.0 # until a job has finished and taught us better
+MAX_RETRIES = 2
+LEASE_SECONDS = 120 # a worker that hasnt renewed its lease this long is considered dead
+GUI_WORKER = f'{platform.node()}:gui'
+
+def job_cost(pages, page_size=None):
+    """
+    work estimate for a pdf, render and encode time scale with pixels
+    :param pages: integer
+    :param page_size: tuple with width, height in pts or None
+    :return: float
+    """
+    area = page_size[0] * page_size[1] if page_size else LETTER_AREA
+    return (pages or 0) * area
+
+def order_jobs(candidates, policy=DEFAULT_ORDERING):
+    """
+    :param candidates: list with dictionaries -> cost, mtime, priority (anything else is passed along)
+    :param policy: string, key in ORDERING_POLICIES
+    :return: list, the same dictionaries in the order they should run
+    """
+    if policy == 'shortest-first':
+        return sorted(candidates, key=lambda x: (x['cost'], x['mtime']))
+
+    elif policy == 'oldest-first':
+        return sorted(candidates, key=lambda x: (x['mtime'], x['cost']))
+
+    elif policy == 'manual':
+        # higher priority first, ties fall back to shortest-first
+        return sorted(candidates, key=lambda x: (-x['priority'], x['cost']))
+
+    candidates = list(candidates)
+    random.shuffle(candidates)
+    return candidates
+
+class ThroughputMeter:
+    def __init__(self, window=20):
+        """
+        remembers the last few finished jobs to project how long the queue takes
+        :param window: integer, number of jobs to average over
+        """
+        self.jobs = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, cost, pages, seconds):
+        with self.lock:
+            self.jobs.append(dict(cost=cost, pages=pages, seconds=max(seconds, 0.001), finished=time.time()))
+
+    def cost_per_second(self):
+        with self.lock:
+            if not self.jobs:
+                return DEFAULT_PAGES_PER_SECOND * LETTER_AREA
+
+            return sum(x['cost'] for x in self.jobs) / sum(x['seconds'] for x in self.jobs)
+
+    def items_per_hour(self):
+        with self.lock:
+            if not self.jobs:
+                return 0
+
+            return len(self.jobs) / sum(x['seconds'] for x in self.jobs) * 3600
+
+    def project(self, ordered, started=None):
+        """
+        :param ordered: list from order_jobs
+        :param started: float, when the first job in ordered can start (now if None)
+        :return: list with (job, finishing_timestamp) tuples
+        """
+        rate = self.cost_per_second()
+        clock = started or time.time()
+        rv = []
+        for job in ordered:
+            clock += job['cost'] / rate
+            rv.append((job, clock))
+
+        return rv
+
+class PersistentQueue:
+    def __init__(self, max_retries=MAX_RETRIES, worker=GUI_WORKER):
+        """
+        the conversion queue lives in the queue table so it survives restarts,
+        one row per pdf path with its state and timestamps. Several processes
+        (or hosts sharing the database file) can drain the same queue, a row is
+        claimed atomically and held by a lease that its worker keeps renewing
+        :param max_retries: integer, failed conversions are queued again this many times
+        :param worker: string, name written into queue.worker for rows this process claims
+        """
+        self.max_retries = max_retries
+        self.worker = worker
+
+    def connection(self):
+        """
+        claims need a transaction of their own, sqlite.w is fire and forget. The read
+        through sqlite also waits for every write queued before it to be committed
+        :return: sqlite3 connection in autocommit mode
+        """
+        database = sqlite.ro('pragma database_list')[2]
+        return sqlite3.connect(database, timeout=30, isolation_level=None)
+
+    def get(self, path):
+        """
+        :param path: string
+        :return: tuple -> state, retries, worker or None
+        """
+        return sqlite.ro('select state, retries, worker from queue where path = (?)', path)
+
+    def enqueue(self, path, md5, priority=0, force=False):
+        """
+        :param path: string
+        :param md5: string
+        :param priority: integer
+        :param force: bool, also queue files that are done or failed (never running ones)
+        """
+        rv = self.get(path)
+        mtime = os.path.getmtime(path) if os.path.exists(path) else time.time()
+
+        if not rv:
+            query = 'insert into queue (path, md5, state, retries, priority, mtime, queued_at) values (?,?,?,?,?,?,?)'
+            sqlite.w(query, (path, md5, 'queued', 0, priority, mtime, time.time(),))
+
+        elif rv[0] != 'running' and (force or rv[0] not in ['done', 'failed']):
+            query = 'update queue set md5 = (?), state = (?), retries = (?), error = (?), queued_at = (?) where path = (?)'
+            sqlite.w(query, (md5, 'queued', 0, None, time.time(), path,))
+
+    def claim(self, path, lease=None):
+        """
+        :param path: string
+        :param lease: integer seconds or None, rows without lease are held until finished
+        :return: bool, False if another worker holds a live lease on path
+        """
+        now = time.time()
+        query = 'update queue set state = (?), worker = (?), started_at = (?), lease_until = (?) where path = (?) '
+        query += 'and (state != (?) or (lease_until is not null and lease_until < (?)))'
+
+        with closing(self.connection()) as connection:
+            cursor = connection.execute(query, ('running', self.worker, now, now + lease if lease else None,
+                                                path, 'running', now,))
+            return cursor.rowcount > 0
+
+    def claim_next(self, policy=DEFAULT_ORDERING, lease=LEASE_SECONDS):
+        """
+        takes the first queued row (see ordered) or a running row whose lease has
+        run out, the latter is how jobs from dead workers come back
+        :param policy: string
+        :param lease: integer seconds
+        :return: dictionary (see ordered) or None
+        """
+        now = time.time()
+        expired = sqlite.ra('select path, md5 from queue where state = (?) and lease_until < (?)', ('running', now,))
+        candidates = [dict(path=x[0], md5=x[1]) for x in expired or []] + self.ordered(policy)
+
+        for job in candidates:
+            if self.claim(job['path'], lease=lease):
+                return job
+
+    def renew(self, path, lease=LEASE_SECONDS):
+        """
+        heartbeat, extends the lease as long as this worker still holds path
+        :param path: string
+        :param lease: integer seconds
+        :return: bool, False when the lease was lost to another worker
+        """
+        query = 'update queue set lease_until = (?) where path = (?) and state = (?) and worker = (?)'
+        with closing(self.connection()) as connection:
+            cursor = connection.execute(query, (time.time() + lease, path, 'running', self.worker,))
+            return cursor.rowcount > 0
+
+    def finish(self, path, ok, error=None, retry=True):
+        """
+        a running row is only finished by the worker holding it
+        :param path: string
+        :param ok: bool
+        :param error: string or None
+        :param retry: bool, False for errors that wont go away by trying again
+        """
+        rv = self.get(path)
+        retries = (rv[1] or 0) if rv else 0
+
+        if ok:
+            state = 'done'
+        elif retry and retries < self.max_retries:
+            state = 'queued'
+            retries += 1
+        else:
+            state = 'failed'
+
+        query = 'update queue set state = (?), retries = (?), error = (?), finished_at = (?), lease_until = (?) '
+        query += 'where path = (?) and (state != (?) or worker = (?))'
+        sqlite.w(query, (state, retries, error, time.time(), None, path, 'running', self.worker,))
+
+    def settle(self, path):
+        """
+        finished signal, a job this worker still has running by now has crashed
+        :param path: string
+        """
+        rv = self.get(path)
+        if rv and rv[0] == 'running' and rv[2] == self.worker:
+            self.finish(path, ok=False, error='CRASHED')
+
+    def resume(self):
+        """
+        jobs that were running when the program was closed are queued again,
+        rows leased by workers that are still alive are left alone
+        """
+        query = 'update queue set state = (?) where state = (?) and (worker = (?) or lease_until is null or lease_until < (?))'
+        sqlite.w(query, ('queued', 'running', self.worker, time.time(),))
+
+    def counts(self):
+        """
+        :return: dictionary with state: count
+        """
+        rv = sqlite.ra('select state, count(*) from queue group by state')
+        return {x[0]: x[1] for x in rv or []}
+
+    def ordered(self, policy=DEFAULT_ORDERING):
+        """
+        :param policy: string, key in ORDERING_POLICIES
+        :return: list with queued jobs as dictionaries -> path, md5, cost, mtime, priority
+        """
+        query = 'select queue.path, queue.md5, queue.priority, queue.mtime, files.pages, files.page_width, '
+        query += 'files.page_height from queue left join files on files.md5 = queue.md5 where queue.state = (?)'
+
+        candidates = []
+        for path, md5, priority, mtime, pages, width, height in sqlite.ra(query, 'queued') or []:
+            if not os.path.exists(path):
+                self.finish(path, ok=False, error='INPUT FILE MISSING', retry=False)
+                continue
+
+            page_size = (width, height) if width and height else None
+            candidates.append(dict(
+                path=path, md5=md5, priority=priority or 0, mtime=mtime or 0,
+                cost=job_cost(pages, page_size) if pages else float('inf'),
+            ))
+
+        return order_jobs(candidates, policy)
+
+    def next_queued(self, policy=DEFAULT_ORDERING):
+        """
+        :param policy: string
+        :return: dictionary (see ordered) or None
+        """
+        rv = self.ordered(policy)
+        return rv[0] if rv else None
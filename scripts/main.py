@@ -1,105 +1,582 @@
 from PIL                    import Image
 from PyQt5                  import QtCore, QtWidgets
 from PyQt5.QtGui            import QPixmap
+from collections            import deque
 from functools              import partial
 from pdf2image              import convert_from_path, pdfinfo_from_path
+from scripts.admission      import TmpBudget, estimate_job_footprint
+from scripts.autotune       import AUTOTUNE_MODES, AUTOTUNE_SAMPLES, DEFAULT_AUTOTUNE, DEFAULT_TARGET_MB_PAGE, DEFAULT_TARGET_SSIM, autotune_summary, tune_quality
+from scripts.content_hash   import DEFAULT_DUPLICATE_RULE, DUPLICATE_RULES, converted_duplicate, duplicates_report, ensure_hash, hash_files, mark_converted, same_content_converted
+from scripts.dashboard      import DASHBOARD_ETA_SECONDS, STAGES, PipelineStats, ProcessMonitor, disk_text, format_seconds
 from scripts.database_stuff import DB, sqlite
+from scripts.job_queue      import DEFAULT_ORDERING, ORDERING_POLICIES, PersistentQueue, ThroughputMeter, job_cost, order_jobs
+from scripts.thumbnails     import ThumbnailPipeline
 from scripts.tricks         import tech as t
-from scripts.widgets        import DevLabel, PDFWidget
-from zipfile                import BadZipFile, ZipFile
+from scripts.widgets        import Dashboard, DevLabel, PDFWidget
+from scripts.margins        import TRIM_SAMPLE_DPI, TRIM_SAMPLES, book_trim, page_margins, trim_from_text, trim_page, trim_to_text
+from scripts.page_cache     import DEFAULT_PAGE_CACHE_MB, PageCache, evict_pages, link_or_copy
+from scripts.page_analysis  import DEFAULT_PAGE_POLICY, ENCODING_CODES, PAGE_POLICIES, PageFilter, choose_encoding, classify_page, drops_blank, page_signature, signature_from_file
+from scripts.page_store     import PageStore
+from scripts.preview        import PREVIEW_COLUMNS, preview_caption, preview_page, preview_variants
+from scripts.renderers      import PageStream, benchmark_renderers, close_documents, render_to_files, renderer_or_default
+from scripts.resize         import DEFAULT_RESIZE_QUALITY, MAX_WIDTH_4K, RESIZE_QUALITY, benchmark_resize, downscale, open_for_size
+from scripts.webp_presets   import DEFAULT_PRESET, WEBP_PRESETS, benchmark_presets, benchmark_report, webp_options
+from zipfile                import BadZipFile, ZipFile, ZIP_DEFLATED
 import concurrent.futures
+import contextlib
+import io
 import math
 import os
+import pathlib
 import platform
 import psutil
+import re
 import shutil
-import string
 import sys
 import time
 
 
 FIGURE_HEIGHT = 300
+POPPLER_PATH_WIDTH = 250 # the rest of that row holds the newer settings
 TITLE = 'PDF to WEBP-compressed CBZ v0.3 build:776'
+RENDER_DPI = 485
+PAGES_PER_BATCH = 8
+MEMORY_PAGES_PER_BATCH = PAGES_PER_BATCH # streamed, a worker holds STREAM_LOOKAHEAD + 1 raw pages whatever the batch
+DEFAULT_MEMORY_CAP_MB = 1000
+DEFAULT_PAGE_SIZE = 612, 792 # pts, used when pdfinfo cannot tell
+MONOCHROME_SAMPLES = 8
+MONOCHROME_SAMPLE_DPI = 36
+RENDER_MODES = ['color', 'grayscale'] # files.render_mode, anything else means auto
+ARCHIVE_EXTENSIONS = ['cbz'] # recompressed from the archive itself, no pdf rendering involved
+ARCHIVE_IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'webp', 'gif', 'bmp', 'tif', 'tiff']
+PREFETCH_SCREENS = 2 # screens of files past the visible one that get fingerprints, page counts and covers
+PREFETCH_DELAY = 500 # ms the gui has to be left alone before prefetching (re)starts
+
+TMP_BUDGET = TmpBudget(t.tmp_folder(create_dir=False, return_base=True))
+PIPELINE_STATS = PipelineStats()
 
 def pdf_to_jpeg(job):
     """
     thread job that requires a starting and ending index
-    :param job: tuple
+    :param job: tuple -> source_file, output_folder, first_page, last_page, output_file, poppler_path, grayscale, renderer,
+                         cache (PageCache or None)
     :return: list with paths as strings
     """
-    source_file, output_folder, first_page, last_page, output_file, poppler_path = job
-
-    image_list = convert_from_path(
-        source_file,
-        dpi=485,
-        first_page=first_page,
-        last_page=last_page,
-        fmt='jpeg',
-        output_file=output_file,
-        output_folder=output_folder,
-        paths_only=True,
-        jpegopt=dict(quality=100, optimize=True),
-        poppler_path=poppler_path,
-    )
+    source_file, output_folder, first_page, last_page, output_file, poppler_path, grayscale, renderer, cache = job
+
+    if cache and cache.has(first_page, last_page):
+        rv = []
+        for page in range(first_page, last_page + 1):
+            cached = cache.get(page)
+            path = os.path.join(output_folder, f"{output_file}-{t.zero_prefiller(page, lenght=5)}.{cached.split('.')[-1]}")
+            link_or_copy(cached, path)
+            rv.append(path)
+
+        return rv
+
+    rv = render_to_files(source_file, output_folder, first_page, last_page, output_file, RENDER_DPI,
+                         grayscale=grayscale, poppler_path=poppler_path, renderer=renderer)
 
-    return image_list
-def convert_files_to_jpeg(joblist, inputpath, tmp_jpeg_folder, poppler_path=None):
+    if cache:
+        for count, path in enumerate(rv):
+            cache.put_file(first_page + count, path)
+
+    return rv
+
+def pdf_to_jpeg_signed(job):
     """
-    if tmp_folder goes below 100mb False is returned
-    :param joblist: dictionary with letters as keys containing list indexes (int)
-    :param inputpath: string to pdf file-path
-    :param tmp_jpeg_folder: string
-    :return: list with image paths, or False if hdd full
+    pdf_to_jpeg that also signs every page for PageFilter, in the render worker
+    :param job: tuple, see pdf_to_jpeg
+    :return: list with (jpeg_path, signature) tuples
     """
-    image_list = []
-    threadlist = []
-    for letter in joblist:
-        threadlist.append((inputpath, tmp_jpeg_folder, joblist[letter][0], joblist[letter][-1], letter, poppler_path,))
+    return [(path, signature_from_file(path)) for path in pdf_to_jpeg(job)]
 
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        for _, rv in zip(joblist, executor.map(pdf_to_jpeg, threadlist)):
-            for path in rv:
-                image_list.append(path)
-
-            _, __, tmp_free = shutil.disk_usage(tmp_jpeg_folder)
-            if (tmp_free/1000000) < 100:
+def is_monochrome_pdf(source_file, page_count, poppler_path=None, samples=MONOCHROME_SAMPLES):
+    """
+    renders a few evenly spread pages at a low dpi and tells if all of them are gray
+    :param source_file: string
+    :param page_count: integer
+    :param samples: integer
+    :return: bool
+    """
+    pages = sorted(set(1 + int(x * page_count / samples) for x in range(min(samples, page_count))))
+
+    for page in pages:
+        images = convert_from_path(
+            source_file,
+            dpi=MONOCHROME_SAMPLE_DPI,
+            first_page=page,
+            last_page=page,
+            poppler_path=poppler_path,
+        )
+
+        for image in images:
+            if classify_page(image) not in ['grayscale', 'bilevel']:
                 return False
 
-    image_list.sort()
-    return image_list
+    return True
 
 def jpeg_to_webp(job):
     """
     jpeg to webp
-    :param job: tuple -> 0:jpeg_file_path, 1:save_webp_file_path, 2:webp_quality
-    :return: string -> webp_file_location
+    :param job: tuple -> 0:jpeg_file_path, 1:save_webp_file_path, 2:webp_options (see webp_presets),
+                         3:resize (None or dictionary -> width, quality), 4:classify, 5:margin_trim (None or tuple)
+    :return: dictionary -> source, destination, encoding
     """
-    source_path, destination_path, _, webp_quality, resize_4k = job
-    image = Image.open(source_path)
+    source_path, destination_path, options, resize, classify, margin_trim = job
+
+    if resize:
+        image = open_for_size(source_path, width=resize['width'], quality=resize['quality'])
+    else:
+        image = Image.open(source_path)
 
-    if resize_4k and image.size[0] > 3840:
-        image_size = 3840, round(image.size[1] * (3840 / image.size[0]))
-        image.thumbnail(image_size, Image.ANTIALIAS)
+    if margin_trim:
+        image, _ = trim_page(image, margin_trim)
 
-    image.save(destination_path, 'webp', method=6, quality=webp_quality)
-    return dict(source=source_path, destination=destination_path)
-def convert_files_to_webp(joblist):
+    if resize:
+        image = downscale(image, width=resize['width'], quality=resize['quality'])
+
+    encoding = 'color'
+    if classify:
+        image, options, encoding = choose_encoding(image, options)
+
+    image.save(destination_path, 'webp', **options)
+    return dict(source=source_path, destination=destination_path, encoding=encoding)
+
+def pdf_to_webp_in_memory(job):
     """
-    :param joblist: list with jpeg_files
-    :return:
+    streams a batch of pages and encodes each one while the next renders, only
+    STREAM_LOOKAHEAD + 1 raw pages are alive at once and nothing touches the tmp folder
+    :param job: tuple -> source_file, first_page, last_page, poppler_path, webp_options, resize, classify, grayscale,
+                         renderer, page_policy, margin_trim, cache (PageCache or None)
+    :return: list with (page, webp_bytes, encoding, signature) tuples, webp_bytes is None for blank pages left out
     """
-    count = 0
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        for _, rv in zip(joblist, executor.map(jpeg_to_webp, joblist)):
-            count += 1
-            if rv and os.path.getsize(rv['destination']) > 0:
-                os.remove(rv['source'])
+    (source_file, first_page, last_page, poppler_path, options, resize, classify, grayscale, renderer, policy,
+     margin_trim, cache) = job
+
+    # pages are only signed here, duplicates depend on every page before this batch so the
+    # parent's PageFilter decides them, blank pages are the one call a batch can make alone
+    signed = PageFilter(policy).active
+
+    cached = cache and cache.has(first_page, last_page)
+    if cached:
+        stream = contextlib.nullcontext(cache.pages(first_page, last_page))
+    else:
+        stream = PageStream(source_file, first_page, last_page, RENDER_DPI, grayscale=grayscale,
+                            poppler_path=poppler_path, renderer=renderer)
+
+    rv = []
+    with stream as pages:
+        for page, image in pages:
+            if cache and not cached:
+                cache.put_image(page, image)
+
+            signature = page_signature(image) if signed else None
+            if signature and drops_blank(page, signature, policy):
+                image.close()
+                rv.append((page, None, None, signature))
+                continue
+
+            rv.append(encode_page_in_memory(page, image, options, resize, classify, margin_trim) + (signature,))
+
+    return rv
+
+def encode_page_in_memory(page, image, options, resize, classify, margin_trim=None):
+    """
+    :param page: integer
+    :param image: PIL image, closed when done
+    :param options: dictionary from webp_options
+    :param resize: None or dictionary -> width, quality
+    :param classify: bool
+    :param margin_trim: None or tuple from margins.book_trim
+    :return: tuple -> page, webp_bytes, encoding
+    """
+    original = image
+    if margin_trim:
+        image, _ = trim_page(image, margin_trim)
+
+    if resize:
+        image = downscale(image, width=resize['width'], quality=resize['quality'])
+
+    encoding, save_image, save_options = 'color', image, options
+    if classify:
+        save_image, save_options, encoding = choose_encoding(image, options)
+
+    buffer = io.BytesIO()
+    save_image.save(buffer, 'webp', **save_options)
+    image.close()
+    if original is not image:
+        original.close()
+    return page, buffer.getvalue(), encoding
+
+def is_archive(path):
+    """
+    :param path: string
+    :return: bool, path is converted by convert_cbz
+    """
+    return path.split('.')[-1].lower() in ARCHIVE_EXTENSIONS
+
+def natural_key(name):
+    """
+    page2.jpg before page10.jpg
+    :param name: string
+    :return: list
+    """
+    return [int(x) if x.isdigit() else x.lower() for x in re.split(r'(\d+)', name)]
+
+def archive_pages(path):
+    """
+    :param path: string, cbz
+    :return: tuple -> list with image entry names in reading order, list with every other entry name
+    """
+    with ZipFile(path) as zf:
+        names = [x.filename for x in zf.infolist() if not x.is_dir()]
+
+    images = [x for x in names if x.split('.')[-1].lower() in ARCHIVE_IMAGE_EXTENSIONS]
+    return sorted(images, key=natural_key), [x for x in names if x not in images]
+
+def archive_needs_work(path):
+    """
+    an archive with nothing but webp pages (our own output as a rule) is left alone
+    :param path: string, cbz
+    :return: bool
+    """
+    try:
+        images, _ = archive_pages(path)
+    except BadZipFile:
+        return False
+
+    return any(x.split('.')[-1].lower() != 'webp' for x in images)
+
+def cbz_to_webp_in_memory(job):
+    """
+    process job, entries are decoded straight from the zip stream, nothing is extracted
+    :param job: tuple -> archive_path, list with (page, entry name) tuples, webp_options, resize, classify
+    :return: list with (page, bytes, encoding) tuples, encoding is None for an entry that
+             could not be decoded or encoded (truncated, odd modes), bytes are then the entry as it was
+    """
+    archive_path, entries, options, resize, classify = job
+
+    rv = []
+    with ZipFile(archive_path) as zf:
+        for page, name in entries:
+            try:
+                with zf.open(name) as stream:
+                    image = Image.open(stream)
+                    image.load()
+
+                rv.append(encode_page_in_memory(page, image, options, resize, classify))
+            except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+                rv.append((page, zf.read(name), None,))
+
+    return rv
+
+def page_size_from_pdfinfo(info):
+    """
+    :param info: dictionary from pdfinfo_from_path, 'Page size': '612 x 792 pts (letter)'
+    :return: tuple with width, height in pts
+    """
+    try:
+        width, _, height = str(info['Page size']).split()[0:3]
+        return float(width), float(height)
+    except (KeyError, ValueError):
+        return DEFAULT_PAGE_SIZE
+
+def page_batches(page_count, batch_size):
+    """
+    :param page_count: integer
+    :param batch_size: integer
+    :return: list with (first_page, last_page) tuples, pdf2image counts from 1
+    """
+    return [(x, min(x + batch_size - 1, page_count)) for x in range(1, page_count + 1, batch_size)]
+
+def convert_pages_to_webp(inputpath, tmp_jpeg_folder, tmp_webp_folder, page_count, page_size, settings,
+                          status=None, encodings=None, page_filter=None):
+    """
+    renders page batches into tmp_jpeg_folder and encodes each page into tmp_webp_folder
+    as soon as its batch is rendered. A batch is only started once its estimated tmp
+    footprint fits TMP_BUDGET and the encoders are not falling behind, so a small
+    ramdisk slows the job down instead of aborting it
+    :param inputpath: string
+    :param page_count: integer
+    :param page_size: tuple with width, height in pts
+    :param settings: dictionary -> poppler_path, webp_options, resize, classify, grayscale, pdf_threads, webp_threads,
+                     renderer, margin_trim, page_cache
+    :param status: function(text) or None
+    :param encodings: dictionary or None, filled with page: encoding
+    :param page_filter: PageFilter or None, pages it turns down are not encoded
+    :return: list with webp paths, or False if the tmp folder can never fit a single page
+    """
+    signed = page_filter is not None and page_filter.active
+    footprint = estimate_job_footprint(page_count, page_size, RENDER_DPI, grayscale=settings['grayscale'])
+    job = tmp_jpeg_folder
+
+    if settings['pdf_threads']:
+        render_workers = max(1, psutil.cpu_count(logical=False) or 1)
+    else:
+        render_workers = 1
+
+    encode_workers = (os.cpu_count() or 1) if settings['webp_threads'] else 1
+    encode_backlog = encode_workers * 2
+
+    batch_size = PAGES_PER_BATCH if page_count > PAGES_PER_BATCH * render_workers else max(1, math.ceil(page_count / render_workers))
+    batches = deque(page_batches(page_count, batch_size))
+
+    TMP_BUDGET.register(job, [tmp_jpeg_folder, tmp_webp_folder])
+    if not TMP_BUDGET.admit(job, footprint['webp_total'] + footprint['jpeg']):
+        TMP_BUDGET.finish(job)
+        return False
+
+    TMP_BUDGET.release(job, footprint['jpeg']) # held for the first batch only, webp_total is kept
+
+    def report(text):
+        if status:
+            rv = TMP_BUDGET.report(job)
+            status(f"{text} | TMP {int(rv['used'] / 1000000)}/{int(rv['reserved'] / 1000000)}MB")
+
+    webp_files = {}
+    rendering = {}
+    encoding = {}
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=render_workers) as render_pool, \
+             concurrent.futures.ProcessPoolExecutor(max_workers=encode_workers) as encode_pool:
+
+            while batches or rendering or encoding:
+                while batches and len(rendering) < render_workers and len(encoding) < encode_backlog:
+                    first_page, last_page = batches[0]
+                    need = (last_page - first_page + 1) * footprint['jpeg']
+                    idle = not rendering and not encoding
+
+                    if not TMP_BUDGET.admit(job, need, wait=idle):
+                        if idle and first_page < last_page:
+                            half = first_page + (last_page - first_page) // 2
+                            batches[0] = (half + 1, last_page)
+                            batches.appendleft((first_page, half))
+                            continue
+                        elif idle:
+                            return False
+                        break
 
-def recompress_fucntion(destination_file, tmp_folder):
+                    batches.popleft()
+                    output_file = 'p' + t.zero_prefiller(first_page, lenght=5)
+                    rjob = (inputpath, tmp_jpeg_folder, first_page, last_page, output_file,
+                            settings['poppler_path'], settings['grayscale'], settings['renderer'], settings['page_cache'],)
+                    render = pdf_to_jpeg_signed if signed else pdf_to_jpeg
+                    rendering[render_pool.submit(render, rjob)] = (first_page, last_page)
+
+                report('EXTRACTING' if rendering else 'CONVERTING')
+
+                done, _ = concurrent.futures.wait(
+                    list(rendering) + list(encoding), return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    if future in rendering:
+                        first_page, last_page = rendering.pop(future)
+                        rendered = future.result() if signed else [(x, None) for x in future.result()]
+                        PIPELINE_STATS.count('render', len(rendered))
+                        if settings['page_cache']:
+                            settings['page_cache'].charge(first_page, last_page)
+
+                        for count, (jpeg_image_path, signature) in enumerate(rendered):
+                            page = first_page + count
+                            if signature and not page_filter.keep(page, signature):
+                                os.remove(jpeg_image_path)
+                                TMP_BUDGET.release(job, footprint['jpeg'])
+                                continue
+
+                            filename = t.zero_prefiller(page, lenght=5)
+                            webp_save_path = os.path.abspath(os.path.expanduser(f'{tmp_webp_folder}/{filename}.webp'))
+                            ejob = (jpeg_image_path, webp_save_path, settings['webp_options'],
+                                    settings['resize'], settings['classify'], settings['margin_trim'],)
+                            encoding[encode_pool.submit(jpeg_to_webp, ejob)] = page
+                    else:
+                        page = encoding.pop(future)
+                        rv = future.result()
+                        if rv and os.path.getsize(rv['destination']) > 0:
+                            PIPELINE_STATS.count('encode')
+                            os.remove(rv['source'])
+                            webp_files[page] = rv['destination']
+                            if encodings is not None:
+                                encodings[page] = rv['encoding']
+
+                        TMP_BUDGET.release(job, footprint['jpeg'])
+    finally:
+        TMP_BUDGET.finish(job)
+
+    return [webp_files[x] for x in sorted(webp_files)]
+
+def convert_pages_in_memory(inputpath, store, page_count, settings, status=None, progress=None, encodings=None,
+                            page_filter=None):
+    """
+    in-memory counterpart of convert_pages_to_webp, workers render and encode
+    a couple of pages each and hand back webp buffers that go into store
+    :param inputpath: string
+    :param store: PageStore
+    :param page_count: integer
+    :param settings: dictionary -> poppler_path, webp_options, resize, classify, grayscale, pdf_threads, renderer,
+                     margin_trim, page_cache
+    :param status: function(text) or None
+    :param progress: function(rendered, encoded) or None
+    :param encodings: dictionary or None, filled with page: encoding
+    :param page_filter: PageFilter or None, pages it turns down stay out of store
+    :return: bool
+    """
+    if settings['pdf_threads']:
+        workers = max(1, psutil.cpu_count(logical=False) or 1)
+    else:
+        workers = 1
+
+    jobs = []
+    for first_page, last_page in page_batches(page_count, MEMORY_PAGES_PER_BATCH):
+        jobs.append((inputpath, first_page, last_page, settings['poppler_path'], settings['webp_options'],
+                     settings['resize'], settings['classify'], settings['grayscale'], settings['renderer'],
+                     page_filter.policy if page_filter else DEFAULT_PAGE_POLICY, settings['margin_trim'],
+                     settings['page_cache'],))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for rv in executor.map(pdf_to_webp_in_memory, jobs):
+            PIPELINE_STATS.count('render', len(rv))
+            if settings['page_cache'] and rv:
+                settings['page_cache'].charge(rv[0][0], rv[-1][0])
+
+            PIPELINE_STATS.count('encode', sum(1 for x in rv if x[1] is not None))
+            for page, data, encoding, signature in rv:
+                if signature and page_filter and not page_filter.keep(page, signature):
+                    continue
+
+                store.put(t.zero_prefiller(page, lenght=5) + '.webp', data)
+                if encodings is not None:
+                    encodings[page] = encoding
+
+            if progress:
+                progress(len(store), len(store))
+
+            if status:
+                status(f"CONVERTING | RAM {int(store.memory / 1000000)}MB | SPILLED {len(store.spilled)}")
+
+    skipped = page_filter.counts['skipped'] if page_filter else 0
+    return len(store) + skipped == page_count
+
+def partial_archive(destination_file):
+    """
+    the zip an archive is written to before it is moved into place, named after this host
+    and process so two workers that both think they hold a job never write the same file
+    :param destination_file: string, file.cbz
+    :return: string
+    """
+    return f"{destination_file[0:-(len('.cbz'))]}.{platform.node()}.{os.getpid()}.zip"
+
+def store_to_archive(destination_file, store, verify=False, may_move=None):
+    """
+    writes every page in store into file.cbz without going through a folder
+    :param destination_file: string
+    :param store: PageStore
+    :param verify: bool, CRC check and test-decode every entry before moving into place
+    :param may_move: function() -> bool or None, asked right before the move, False leaves destination alone
+    :return: bool
+    """
+    zipfile = partial_archive(destination_file)
+    names = store.names()
+
+    with ZipFile(zipfile, 'w', compression=ZIP_DEFLATED) as zf:
+        for name in names:
+            zf.writestr(name, store.get(name))
+
+    try:
+        with ZipFile(zipfile) as zf:
+            filecontents = zf.namelist()
+    except BadZipFile:
+        os.remove(zipfile)
+        print('OUTPUT FILE BROKEN')
+        return False
+
+    if len(filecontents) < len(names) or os.path.getsize(zipfile) == 0:
+        os.remove(zipfile)
+        print('FILES MISSING')
+        return False
+
+    if verify and not verify_archive(zipfile):
+        os.remove(zipfile)
+        print('OUTPUT FILE BROKEN')
+        return False
+
+    if may_move and not may_move():
+        os.remove(zipfile)
+        print('LEASE LOST')
+        return False
+
+    shutil.move(zipfile, destination_file)
+    fsync_file_and_folder(destination_file)
+
+    return True
+
+def verify_archive_entries(job):
+    """
+    process job, reads entries (zipfile checks the CRC while reading) and decodes them
+    :param job: tuple -> zip_path, list with entry names
+    :return: list with names that failed
+    """
+    zip_path, names = job
+    failed = []
+    with ZipFile(zip_path) as zf:
+        for name in names:
+            try:
+                image = Image.open(io.BytesIO(zf.read(name)))
+                image.load()
+            except Exception:
+                failed.append(name)
+
+    return failed
+
+def verify_archive(zip_path, workers=None):
+    """
+    CRC check and test-decode of every entry, entries are spread across a process pool
+    :param zip_path: string
+    :param workers: integer or None for every cpu
+    :return: bool
+    """
+    with ZipFile(zip_path) as zf:
+        # ComicInfo.xml and friends from recompressed archives are not images
+        names = [x for x in zf.namelist() if x.split('.')[-1].lower() in ARCHIVE_IMAGE_EXTENSIONS]
+
+    workers = workers or os.cpu_count() or 1
+    chunk = max(1, math.ceil(len(names) / workers))
+    jobs = [(zip_path, names[x:x + chunk],) for x in range(0, len(names), chunk)]
+
+    failed = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for rv in executor.map(verify_archive_entries, jobs):
+            failed += rv
+
+    for name in failed:
+        print('BROKEN ENTRY:', name)
+
+    return not failed
+
+def fsync_file_and_folder(path):
+    """
+    flushes one file and the directory entry pointing at it instead of os.sync() for
+    the whole system, directories cannot be opened for fsync on Windows
+    :param path: string
+    """
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+    if platform.system() != "Windows":
+        folder = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(folder)
+        finally:
+            os.close(folder)
+
+def recompress_fucntion(destination_file, tmp_folder, verify=False, may_move=None):
     """
     compresses the files from tmp_folder into file.cbz
     :param destination_file: string new file.zip
     :param tmp_folder: string
+    :param verify: bool, CRC check and test-decode every entry before moving into place
+    :param may_move: function() -> bool or None, see store_to_archive
     :return: bool
     """
     def confirm_new_files(ziplocation):
@@ -128,17 +605,11 @@ def recompress_fucntion(destination_file, tmp_folder):
 
         return True
 
-    zipfile = destination_file[0:-(len('.cbz'))]
-
-    if platform.system() != "Windows":
-        os.sync()
+    zipfile = partial_archive(destination_file)[0:-(len('.zip'))]
 
     shutil.make_archive(zipfile, 'zip', tmp_folder)
     zipfile += '.zip'
 
-    if platform.system() != "Windows":
-        os.sync()
-
     if not confirm_new_files(zipfile):
         return False
 
@@ -149,10 +620,529 @@ def recompress_fucntion(destination_file, tmp_folder):
 
         return False
 
+    if verify and not verify_archive(zipfile):
+        os.remove(zipfile)
+        print('OUTPUT FILE BROKEN')
+        return False
+
+    if may_move and not may_move():
+        os.remove(zipfile)
+        print('LEASE LOST')
+        return False
+
     shutil.move(zipfile, destination_file)
+    fsync_file_and_folder(destination_file)
 
     return True
 
+def fingerprint(path):
+    """
+    this is not md5, more like a quick-budget checksum
+    :param path: string
+    :return: string
+    """
+    md5 = t.md5_hash_file(path, partial_file=True)
+    md5 += str(os.path.getsize(path))
+    return t.md5_hash_string(md5)
+
+def output_path_for(path, to_dir):
+    """
+    :param path: string, pdf file
+    :param to_dir: string, destination folder
+    :return: string, where its cbz goes
+    """
+    filename = '.'.join(os.path.basename(path).split('.')[0:-1])
+    return os.path.abspath(os.path.expanduser(to_dir + '/' + filename + '.cbz'))
+
+def get_pdf_info(path, poppler_path=None, md5=None):
+    """
+    pdfinfo is only asked once per fingerprint, the answer is kept in files
+    :param path: string
+    :param poppler_path: string or None
+    :param md5: string or None (nothing is cached without it)
+    :return: dictionary with pages and page_size (pts) or False
+    """
+    if md5:
+        rv = sqlite.ro('select pages, page_width, page_height from files where md5 = (?)', md5)
+        if rv and rv[0]:
+            return dict(pages=rv[0], page_size=(rv[1], rv[2]) if rv[1] else DEFAULT_PAGE_SIZE)
+
+    if platform.system() == "Windows":
+        if not poppler_path or not os.path.exists(poppler_path) or len(poppler_path) < 1:
+            return False
+
+    rv = pdfinfo_from_path(path, poppler_path=poppler_path)
+
+    if not rv or not rv.get('Pages'):
+        return False
+
+    info = dict(pages=rv['Pages'], page_size=page_size_from_pdfinfo(rv))
+
+    if md5:
+        query = 'update files set pages = (?), page_width = (?), page_height = (?) where md5 = (?)'
+        sqlite.w(query, (info['pages'], info['page_size'][0], info['page_size'][1], md5,))
+
+    return info
+
+def decide_render_mode(inputpath, page_count, md5, classify, poppler_path=None, status=None):
+    """
+    a render mode set on the file wins, else CLASSIFY PAGES lets a
+    few low dpi samples decide once and the answer is kept in files
+    :param inputpath: string
+    :param page_count: integer
+    :param md5: string
+    :param classify: bool, CLASSIFY PAGES
+    :param poppler_path: string or None
+    :param status: function(text) or None
+    :return: string -> color or grayscale
+    """
+    rv = sqlite.ro('select render_mode, monochrome from files where md5 = (?)', md5)
+    if rv and rv[0] in RENDER_MODES:
+        return rv[0]
+
+    if not classify:
+        return 'color'
+
+    if rv and rv[1] is not None:
+        return 'grayscale' if rv[1] else 'color'
+
+    if status:
+        status('SAMPLING')
+
+    monochrome = is_monochrome_pdf(inputpath, page_count, poppler_path)
+    sqlite.w('update files set monochrome = (?) where md5 = (?)', (monochrome, md5,))
+    return 'grayscale' if monochrome else 'color'
+
+def sample_pages(page_count, samples):
+    """
+    evenly spread pages, the first and last page (covers, full bleed as a rule) are left out when there are more
+    :param page_count: integer
+    :param samples: integer
+    :return: list with page numbers
+    """
+    pages = sorted(set(1 + int(x * page_count / samples) for x in range(min(samples, page_count))))
+    if page_count > 2:
+        pages = [x for x in pages if x not in [1, page_count]] or [2]
+
+    return pages
+
+def sample_margin_trim(source_file, page_count, poppler_path=None, samples=TRIM_SAMPLES):
+    """
+    renders evenly spread pages at a low dpi and lets margins.book_trim agree on one trim
+    :param source_file: string
+    :param page_count: integer
+    :param poppler_path: string or None
+    :param samples: integer
+    :return: tuple from book_trim or None
+    """
+    margins = []
+    for page in sample_pages(page_count, samples):
+        images = convert_from_path(
+            source_file,
+            dpi=TRIM_SAMPLE_DPI,
+            first_page=page,
+            last_page=page,
+            poppler_path=poppler_path,
+        )
+
+        margins += [page_margins(x) for x in images]
+
+    return book_trim(margins)
+
+def decide_margin_trim(inputpath, page_count, md5, poppler_path=None, status=None):
+    """
+    the trim is sampled once per book and kept in files.margin_trim
+    (empty string means sampled, nothing to trim)
+    :param inputpath: string
+    :param page_count: integer
+    :param md5: string
+    :param poppler_path: string or None
+    :param status: function(text) or None
+    :return: tuple -> left, top, right, bottom fractions or None
+    """
+    rv = sqlite.ro('select margin_trim from files where md5 = (?)', md5)
+    if rv and rv[0] is not None:
+        return trim_from_text(rv[0])
+
+    if status:
+        status('SAMPLING')
+
+    trim = sample_margin_trim(inputpath, page_count, poppler_path)
+    sqlite.w('update files set margin_trim = (?) where md5 = (?)', (trim_to_text(trim), md5,))
+    return trim
+
+def autotune_key(settings):
+    """
+    a stored quality is only reused while everything that went into the search is the same
+    :param settings: dictionary from convert_pdf
+    :return: string
+    """
+    resize = settings['resize']['width'] if settings['resize'] else 0
+    return (f"{settings['autotune']}:{settings['autotune_target']}:{settings['webp_options']['method']}:{resize}:"
+            f"{int(settings['classify'])}:{int(settings['grayscale'])}:{trim_to_text(settings['margin_trim'])}")
+
+def decide_quality(inputpath, page_count, md5, settings, status=None):
+    """
+    renders AUTOTUNE_SAMPLES pages at RENDER_DPI (through the page cache when it is on) and lets
+    autotune.tune_quality search them, the result is kept in the files row
+    :param inputpath: string
+    :param page_count: integer
+    :param md5: string
+    :param settings: dictionary from convert_pdf, with grayscale, margin_trim and page_cache decided
+    :param status: function(text) or None
+    :return: dictionary -> quality, summary
+    """
+    key = autotune_key(settings)
+    rv = sqlite.ro('select autotune_key, autotune_quality, autotune_data from files where md5 = (?)', md5)
+    if rv and rv[0] == key and rv[1]:
+        return dict(quality=rv[1], summary=rv[2])
+
+    if status:
+        status('AUTO-TUNING')
+
+    workers = max(1, psutil.cpu_count(logical=False) or 1) if settings['pdf_threads'] else 1
+    tmp_folder = t.tmp_folder(inputpath + 'autotune', hash=True, delete=True)
+
+    jobs = [(inputpath, tmp_folder, x, x, 'tune', settings['poppler_path'], settings['grayscale'], settings['renderer'],
+             settings['page_cache'],) for x in sample_pages(page_count, AUTOTUNE_SAMPLES)]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        image_paths = [x for rendered in executor.map(pdf_to_jpeg, jobs) for x in rendered]
+
+    if settings['page_cache']:
+        for job in jobs:
+            settings['page_cache'].charge(job[2], job[3])
+
+    result = tune_quality(image_paths, settings['webp_options'], settings['autotune'], settings['autotune_target'],
+                          resize=settings['resize'], classify=settings['classify'], margin_trim=settings['margin_trim'],
+                          workers=(os.cpu_count() or 1) if settings['webp_threads'] else 1)
+    shutil.rmtree(tmp_folder)
+
+    summary = autotune_summary(result, settings['autotune'])
+    query = 'update files set autotune_key = (?), autotune_quality = (?), autotune_data = (?) where md5 = (?)'
+    sqlite.w(query, (key, result['quality'], summary, md5,))
+    return dict(quality=result['quality'], summary=summary)
+
+def check_job(inputpath, outputpath, md5, to_dir):
+    """
+    every check that has to pass before a file is converted
+    :param inputpath: string
+    :param outputpath: string
+    :param md5: string
+    :param to_dir: string, destination folder
+    :return: None if the job may start, else tuple -> error text, stylesheet
+    """
+    red = 'background-color: red ; color: white'
+    filename = os.path.basename(outputpath)
+    in_place = os.path.abspath(inputpath) == os.path.abspath(outputpath) # archive recompressed where it is
+
+    if not to_dir:
+        return 'IMPOSSIBLE OUTPUT FOLDER', red
+
+    elif not os.path.exists(inputpath):
+        return 'INPUT FILE MISSING', red
+
+    elif filename.find('/') > -1 or filename.find('\\') > -1:
+        return 'SHITTY OS', red
+
+    if len(to_dir) > 0 and not os.path.exists(to_dir):
+        pathlib.Path(to_dir).mkdir(parents=True, exist_ok=True)
+
+    if not os.path.exists(to_dir):
+        return 'ERROR CREATING FOLDER', red
+
+    if is_archive(inputpath) and not archive_needs_work(inputpath):
+        return 'NOTHING TO RECOMPRESS', 'background-color: darkGreen ; color: white'
+
+    if in_place:
+        return None if os.access(outputpath, os.W_OK) else ('PERMISSION ERROR', red)
+
+    data = sqlite.ro('select converted from files where md5 = (?) and converted = (?)', (md5, True,))
+    if data and os.path.exists(outputpath) and os.path.getsize(outputpath) > 0:
+        return 'FILE ALREADY PROCESSED', red
+
+    elif os.path.exists(outputpath) and os.path.getsize(outputpath) > 0:
+        return 'DESTINATION EXISTS', 'background-color: green ; color: white'
+
+    elif os.path.exists(outputpath) and os.path.getsize(outputpath) == 0:
+        try: os.remove(outputpath)
+        except:
+            return 'PERMISSION ERROR', red
+
+    try:
+        pathlib.Path(outputpath).touch()
+        if os.path.exists(outputpath):
+            try: os.remove(outputpath)
+            except:
+                return 'PERMISSION ERROR', red
+    except:
+        return 'PERMISSION ERROR', red
+
+def apply_duplicate_rule(inputpath, outputpath, to_dir, rule):
+    """
+    runs before a conversion starts, inputpath is hashed first if its hash is missing or old
+    :param inputpath: string
+    :param outputpath: string
+    :param to_dir: string, destination folder
+    :param rule: string, key in DUPLICATE_RULES
+    :return: None if the file should be converted, else tuple -> text, stylesheet (like check_job).
+             A link that cannot be made (the other cbz is not where to_dir puts it, the
+             destination exists) falls back to converting, never to skipping
+    """
+    if rule not in DUPLICATE_RULES or rule == 'convert':
+        return None
+
+    digest = ensure_hash(inputpath, fingerprint)
+    other = digest and converted_duplicate(inputpath, digest)
+    if not other:
+        return None
+
+    green = 'background-color: darkGreen ; color: white'
+    source = output_path_for(other, to_dir)
+
+    if rule == 'skip':
+        return f'DUPLICATE OF {os.path.basename(other)}', green
+
+    if not os.path.exists(source) or not os.path.isdir(to_dir) or os.path.exists(outputpath):
+        return None
+
+    try:
+        link_or_copy(source, outputpath) # copied on another filesystem or where there are no hard links
+    except OSError:
+        if os.path.exists(outputpath):
+            os.remove(outputpath) # half a copy, the conversion writes it properly
+
+        return None
+
+    mark_converted(inputpath)
+    return f'LINKED TO {os.path.basename(source)}', green
+
+def page_cache_folder():
+    """
+    rendered pages live next to the database, the tmp folder is often a small ramdisk
+    :return: string
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(sqlite.ro('pragma database_list')[2])), 'page_cache')
+
+def convert_pdf(inputpath, outputpath, md5, settings, status=None, progress=None):
+    """
+    renders and encodes page batches through convert_pages_to_webp (or in memory),
+    the tmp_budget decides how much of the pdf is in the tmp folder at once
+    :param inputpath: string
+    :param outputpath: string
+    :param md5: string, fingerprint
+    :param settings: dictionary -> poppler_path, webp_options, resize, classify, pdf_threads, webp_threads,
+                     in_memory, memory_cap_mb, verify, renderer, page_policy, trim_margins, page_cache_mb,
+                     autotune, autotune_target
+    :param status: function(text) or None
+    :param progress: function(rendered, encoded) or None, in memory jobs only
+    :return: dictionary -> status, inputpath, tmp_webp_folder, tmp_jpeg_folder, outputpath, encodings, page_filter,
+                           margin_trim, autotune, archive
+    """
+    status = status or (lambda text: None)
+    in_memory = settings['in_memory']
+    tmp_jpeg_folder = t.tmp_folder(inputpath, hash=True, delete=True, create_dir=not in_memory)
+    tmp_folder = t.tmp_folder(outputpath, hash=True, delete=True, create_dir=not in_memory)
+
+    encodings = {}
+    page_filter = PageFilter(settings['page_policy'])
+    rv = dict(status=False, inputpath=inputpath, tmp_webp_folder=tmp_folder, tmp_jpeg_folder=tmp_jpeg_folder,
+              outputpath=outputpath, encodings=encodings, page_filter=page_filter, margin_trim=None, autotune=None,
+              archive=False)
+
+    info = get_pdf_info(inputpath, settings['poppler_path'], md5)
+    if not info:
+        return rv
+
+    settings = dict(settings)
+    render_mode = decide_render_mode(inputpath, info['pages'], md5, settings['classify'], settings['poppler_path'], status)
+    settings['grayscale'] = render_mode == 'grayscale'
+
+    if settings.get('trim_margins'):
+        rv['margin_trim'] = decide_margin_trim(inputpath, info['pages'], md5, settings['poppler_path'], status)
+
+    settings['margin_trim'] = rv['margin_trim']
+
+    settings['page_cache'] = None
+    if settings.get('page_cache_mb'):
+        cache_folder = page_cache_folder()
+        settings['page_cache'] = PageCache(cache_folder, md5 or fingerprint(inputpath), RENDER_DPI, settings['grayscale'],
+                                           renderer=settings['renderer'], budget_mb=settings['page_cache_mb'])
+
+    if settings.get('autotune') in AUTOTUNE_MODES[1:]:
+        rv['autotune'] = decide_quality(inputpath, info['pages'], md5, settings, status)
+        settings['webp_options'] = dict(settings['webp_options'], quality=rv['autotune']['quality'])
+
+    status('EXTRACTING')
+
+    if in_memory:
+        store = PageStore(settings['memory_cap_mb'], spill_folder=tmp_folder)
+        try:
+            if convert_pages_in_memory(inputpath, store, info['pages'], settings,
+                                       status=status, progress=progress, encodings=encodings, page_filter=page_filter):
+                status('RECOMPRESSING')
+                rv['status'] = store_to_archive(outputpath, store, verify=settings['verify'],
+                                                may_move=settings.get('may_move'))
+                PIPELINE_STATS.count('archive', len(store) if rv['status'] else 0)
+        finally:
+            store.clear() # spilled pages never outlive the job, crashed or not
+
+        if settings['page_cache']:
+            evict_pages(cache_folder, settings['page_cache_mb'])
+
+        return rv
+
+    webp_files = convert_pages_to_webp(
+        inputpath, tmp_jpeg_folder, tmp_folder, info['pages'], info['page_size'],
+        settings, status=status, encodings=encodings, page_filter=page_filter,
+    )
+
+    if settings['page_cache']:
+        evict_pages(cache_folder, settings['page_cache_mb'])
+
+    if not webp_files:
+        return rv
+
+    status('RECOMPRESSING')
+    rv['status'] = recompress_fucntion(outputpath, tmp_folder, verify=settings['verify'], may_move=settings.get('may_move'))
+    PIPELINE_STATS.count('archive', len(webp_files) if rv['status'] else 0)
+
+    return rv
+
+def convert_cbz(inputpath, outputpath, md5, settings, status=None, progress=None):
+    """
+    recompresses a comic archive: image entries are read from the zip as streams and
+    encoded on the process pool, entries that already are webp (and anything that isnt
+    an image) go into the new archive untouched, which is written from memory and may
+    replace inputpath. Takes the same arguments as convert_pdf
+    :return: dictionary (see convert_pdf)
+    """
+    status = status or (lambda text: None)
+    tmp_folder = t.tmp_folder(outputpath, hash=True, delete=True, create_dir=False)
+
+    encodings = {}
+    rv = dict(status=False, inputpath=inputpath, tmp_webp_folder=tmp_folder, tmp_jpeg_folder=tmp_folder,
+              outputpath=outputpath, encodings=encodings, page_filter=PageFilter(DEFAULT_PAGE_POLICY), margin_trim=None,
+              autotune=None, archive=True)
+
+    try:
+        images, others = archive_pages(inputpath)
+    except BadZipFile:
+        return rv
+
+    todo = [(page, name,) for page, name in enumerate(images, start=1) if name.split('.')[-1].lower() != 'webp']
+    if not todo:
+        return rv # check_job turns these down, nothing would change but the zip
+
+    store = PageStore(settings['memory_cap_mb'], spill_folder=tmp_folder)
+    try:
+        with ZipFile(inputpath) as zf:
+            for name in others:
+                store.put(name.replace('/', '_').replace('\\', '_'), zf.read(name))
+
+            for page, name in enumerate(images, start=1):
+                if name.split('.')[-1].lower() == 'webp':
+                    store.put(t.zero_prefiller(page, lenght=5) + '.webp', zf.read(name))
+
+        workers = (os.cpu_count() or 1) if settings['webp_threads'] else 1
+        jobs = [(inputpath, todo[x:x + MEMORY_PAGES_PER_BATCH], settings['webp_options'], settings['resize'],
+                 settings['classify'],) for x in range(0, len(todo), MEMORY_PAGES_PER_BATCH)]
+
+        status('CONVERTING')
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            for batch in executor.map(cbz_to_webp_in_memory, jobs):
+                PIPELINE_STATS.count('encode', sum(1 for x in batch if x[2]))
+                for page, data, encoding in batch:
+                    if encoding:
+                        store.put(t.zero_prefiller(page, lenght=5) + '.webp', data)
+                        encodings[page] = encoding
+                    else:
+                        # copied unchanged like the webp entries, keeps its own extension
+                        store.put(t.zero_prefiller(page, lenght=5) + '.' + images[page - 1].split('.')[-1].lower(), data)
+
+                if progress:
+                    progress(len(store), len(store))
+
+                status(f"CONVERTING | RAM {int(store.memory / 1000000)}MB | SPILLED {len(store.spilled)}")
+
+        if len(store) == len(images) + len(others):
+            status('RECOMPRESSING')
+            rv['status'] = store_to_archive(outputpath, store, verify=settings['verify'],
+                                            may_move=settings.get('may_move'))
+            PIPELINE_STATS.count('archive', len(images) if rv['status'] else 0)
+    finally:
+        store.clear()
+
+    return rv
+
+def convert_file(inputpath, outputpath, md5, settings, status=None, progress=None):
+    """
+    :return: dictionary from convert_cbz for archives, else from convert_pdf
+    """
+    convert = convert_cbz if is_archive(inputpath) else convert_pdf
+    return convert(inputpath, outputpath, md5, settings, status=status, progress=progress)
+
+def enqueue_archives(queue, folder):
+    """
+    every cbz below folder that isnt converted goes into the queue,
+    the image count is stored as pages for the ordering policy
+    :param queue: PersistentQueue
+    :param folder: string
+    :return: integer, files queued
+    """
+    count = 0
+    for walk in os.walk(folder):
+        for f in walk[2]:
+            path = os.path.abspath(os.path.expanduser(walk[0] + '/' + f))
+            if not is_archive(path):
+                continue
+
+            if not archive_needs_work(path):
+                continue # webp only, our own output when the destination is below the source folder
+
+            md5 = fingerprint(path)
+            rv = sqlite.ro('select converted from files where md5 = (?)', md5)
+            if rv and rv[0] and same_content_converted(path, md5) is not False:
+                continue
+
+            images, _ = archive_pages(path)
+
+            sqlite.w('insert or ignore into files (md5) values (?)', md5)
+            sqlite.w('update files set pages = (?) where md5 = (?)', (len(images), md5,))
+            queue.enqueue(path, md5)
+            count += 1
+
+    return count
+
+def record_conversion(md5, rv):
+    """
+    bookkeeping once a file has been converted successfully
+    :param md5: string
+    :param rv: dictionary from convert_pdf
+    """
+    for folder in [rv['tmp_webp_folder'], rv['tmp_jpeg_folder']]:
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+
+    sqlite.w('update files set converted = (?) where md5 = (?)', (True, md5,))
+    mark_converted(rv['inputpath'])
+
+    if rv['archive']:
+        # the new archive can sit where the old one was (or in a scanned folder), it is done as well
+        output_md5 = fingerprint(rv['outputpath'])
+        sqlite.w('insert or ignore into files (md5) values (?)', output_md5)
+        sqlite.w('update files set converted = (?) where md5 = (?)', (True, output_md5,))
+
+    if rv['encodings']:
+        codes = ''.join(ENCODING_CODES[rv['encodings'][x]] for x in sorted(rv['encodings']))
+        sqlite.w('update files set page_encodings = (?) where md5 = (?)', (codes, md5,))
+
+    if rv['page_filter'].active:
+        counts = rv['page_filter'].counts
+        query = 'update files set blank_pages = (?), duplicate_pages = (?), skipped_pages = (?) where md5 = (?)'
+        sqlite.w(query, (counts['blank'], counts['duplicate'], counts['skipped'], md5,))
+
 class PDF2CBZmain(QtWidgets.QMainWindow):
     def __init__(self):
         super(PDF2CBZmain, self).__init__()
@@ -166,6 +1156,15 @@ class PDF2CBZmain(QtWidgets.QMainWindow):
 
         self.setFixedSize(1800, 1000)
         self.widgets = dict(main=[], pdf=[], cbz=[])
+        self.thumbnails = ThumbnailPipeline()
+        self.cover_widgets = {} # path: widget waiting for its cover from self.thumbnails
+        self.prefetcher = ThumbnailPipeline(workers=1, low_priority=True)
+        self.prefetched = {} # path: render_thumbnail result for a file that isnt drawn yet
+        self.throughput = ThroughputMeter()
+        self.queue = PersistentQueue()
+        self.queue.resume()
+        self.headless_job = None
+        self.library_enqueued = False
 
         self.wt = 3
         self.ht = 3
@@ -254,8 +1253,20 @@ class PDF2CBZmain(QtWidgets.QMainWindow):
         self.check_4k.stateChanged.connect(partial(
             self.save_setting, self.delete_source_pdf, 'resize_4k'))
 
+        self.in_memory = QtWidgets.QCheckBox(self, text="IN MEMORY")
+        self.in_memory.setStyleSheet('background-color: rgb(30,30,30) ; color: rgb(235,235,235)')
+        self.in_memory.setToolTip('Pages are kept in RAM and only spill into the working dir when the RAM cap is hit')
+        self.in_memory.move(self.check_4k.geometry().right() + 3, 3)
+
+        rv = t.retrieve_setting(DB.settings.in_memory)
+        if rv:
+            self.in_memory.setChecked(rv)
+
+        self.in_memory.stateChanged.connect(partial(
+            self.save_setting, self.in_memory, 'in_memory'))
+
         self.btn_more = QtWidgets.QPushButton(self, text='NEXT')
-        self.btn_more.move(self.check_4k.geometry().right() + 3, 3)
+        self.btn_more.move(self.in_memory.geometry().right() + 3, 3)
         self.btn_more.setFixedWidth(int(self.btn_more.width() * 0.7))
         self.btn_more.clicked.connect(self.draw_more_pdf_files)
 
@@ -269,11 +1280,72 @@ class PDF2CBZmain(QtWidgets.QMainWindow):
         self.poppler_path.setStyleSheet('background-color: rgb(30,30,30) ; color: rgb(235,235,235)')
         x = self.webp_slider.geometry().right() + 3
         y = self.webp_slider.geometry().top()
-        w = self.btn_refresh.geometry().right() - self.continous_convertion.geometry().left()
+        w = POPPLER_PATH_WIDTH
         h = self.webp_label.height()
         self.poppler_path.setGeometry(x, y, w, h)
         self.poppler_path.textChanged.connect(self.poppler_path_changed)
 
+        self.classify_pages = QtWidgets.QCheckBox(self, text="CLASSIFY PAGES")
+        self.classify_pages.setStyleSheet('background-color: rgb(30,30,30) ; color: rgb(235,235,235)')
+        self.classify_pages.setToolTip('Grayscale pages are encoded without color, line-art and flat colored pages lossless.\n'
+                                       'Black and white books are detected up front and rendered in grayscale')
+        self.classify_pages.setFixedWidth(self.classify_pages.width() + 30)
+        self.classify_pages.move(self.poppler_path.geometry().right() + 3, y)
+
+        rv = t.retrieve_setting(DB.settings.classify_pages)
+        if rv:
+            self.classify_pages.setChecked(rv)
+
+        self.classify_pages.stateChanged.connect(partial(
+            self.save_setting, self.classify_pages, 'classify_pages'))
+
+        self.verify_cbz = QtWidgets.QCheckBox(self, text="VERIFY CBZ")
+        self.verify_cbz.setStyleSheet('background-color: rgb(30,30,30) ; color: rgb(235,235,235)')
+        self.verify_cbz.setToolTip('CRC check and test-decode every page of the new CBZ before it is moved into place')
+        self.verify_cbz.move(self.classify_pages.geometry().right() + 3, y)
+
+        rv = t.retrieve_setting(DB.settings.verify_cbz)
+        if rv:
+            self.verify_cbz.setChecked(rv)
+
+        self.verify_cbz.stateChanged.connect(partial(
+            self.save_setting, self.verify_cbz, 'verify_cbz'))
+
+        self.trim_margins = QtWidgets.QCheckBox(self, text="TRIM MARGINS")
+        self.trim_margins.setStyleSheet('background-color: rgb(30,30,30) ; color: rgb(235,235,235)')
+        self.trim_margins.setToolTip('Uniform page margins are cropped before encoding, the same crop for the whole book.\n'
+                                     'Pages with ink inside the margin are kept whole')
+        self.trim_margins.move(self.verify_cbz.geometry().right() + 3, y)
+
+        rv = t.retrieve_setting(DB.settings.trim_margins)
+        if rv:
+            self.trim_margins.setChecked(rv)
+
+        self.trim_margins.stateChanged.connect(partial(
+            self.save_setting, self.trim_margins, 'trim_margins'))
+
+        self.webp_preset = QtWidgets.QComboBox(self)
+        self.webp_preset.addItems([x.upper() for x in WEBP_PRESETS])
+        self.webp_preset.setToolTip('WEBP encoder preset, FAST trades a few percent size for speed')
+        self.webp_preset.setStyleSheet('background-color: rgb(30,30,30) ; color: rgb(235,235,235)')
+        self.webp_preset.setFixedWidth(140)
+        self.webp_preset.move(self.trim_margins.geometry().right() + 3, y)
+
+        rv = t.retrieve_setting(DB.settings.webp_preset)
+        self.webp_preset.setCurrentText((rv or DEFAULT_PRESET).upper())
+        self.webp_preset.currentTextChanged.connect(self.preset_changed)
+
+        self.job_order = QtWidgets.QComboBox(self)
+        self.job_order.addItems([x.upper() for x in ORDERING_POLICIES])
+        self.job_order.setToolTip('Which file CONTINOUS picks next, SHORTEST-FIRST uses pages x page area')
+        self.job_order.setStyleSheet('background-color: rgb(30,30,30) ; color: rgb(235,235,235)')
+        self.job_order.setFixedWidth(140)
+        self.job_order.move(self.webp_preset.geometry().right() + 3, y)
+
+        rv = t.retrieve_setting(DB.settings.job_order)
+        self.job_order.setCurrentText((rv or DEFAULT_ORDERING).upper())
+        self.job_order.currentTextChanged.connect(self.job_order_changed)
+
         cyd = {
             'PDF SOURCE FOLDER': self.from_dir,
             'CBZ DESTINATION FOLDER': self.to_dir,
@@ -296,11 +1368,19 @@ class PDF2CBZmain(QtWidgets.QMainWindow):
             bg.lower()
 
         self.show()
+        self.setWindowTitle(TITLE)
+
+        # scanning the source folder can take a while on a large library, the window paints first
+        t.schedule(self.restore_saved_paths, msec=100, name='restore paths')
 
+    def restore_saved_paths(self):
+        """
+        saved folders go back into their plaintextedits, which triggers the scan and drawing
+        """
         setting_plaintext_label = {
-            DB.settings.source_path: self.from_dir,
-            DB.settings.destination_path: self.to_dir,
             DB.settings.poppler_path: self.poppler_path,
+            DB.settings.destination_path: self.to_dir,
+            DB.settings.source_path: self.from_dir,
          }
 
         for key, label in setting_plaintext_label.items():
@@ -308,7 +1388,8 @@ class PDF2CBZmain(QtWidgets.QMainWindow):
             if rv:
                 label.setPlainText(rv.rstrip('\n'))
 
-        self.setWindowTitle(TITLE)
+        if self.queue.counts().get('queued'):
+            t.schedule(self.start_next_job, msec=1000, name='next job')
 
     def show_hdd_spaces(self):
         if 'space_timer' not in dir(self):
@@ -327,6 +1408,8 @@ class PDF2CBZmain(QtWidgets.QMainWindow):
             title += f" | WORKING DIR SIZE: {int(tmp_total/1000000)}mb | "
             title += f"USED: {int(tmp_used/1000000)}mb | FREE: {int(tmp_free/1000000)}mb"
 
+            title += f" | RESERVED: {int(TMP_BUDGET.reserved()/1000000)}mb"
+
         to_dir = self.to_dir.toPlainText().strip()
         if os.path.exists(to_dir):
             to_total, to_used, to_free = shutil.disk_usage(to_dir)
@@ -342,104 +1425,42 @@ class PDF2CBZmain(QtWidgets.QMainWindow):
 
         return poppler_path
 
-    def convert_pdf_to_images(self, inputpath, outputpath, widget):
+    def job_settings(self, widget=None):
         """
-        if large pdf job is spread across cpu's else just one cpu-job
-        extract jpeg files into a tmp_folder and then convert them to webp
-        :param inputpath: string
-        :param outputpath: string
-        :return: dictionary
+        :param widget: PDFWidget or None
+        :return: dictionary for convert_pdf
         """
-        tmp_jpeg_folder = t.tmp_folder(inputpath, hash=True, delete=True)
-        tmp_folder = t.tmp_folder(outputpath, hash=True, delete=True)
-
-        image_list = []
-
-        poppler_path = self.get_poppler_path()
-        widget.status_label.setText('EXTRACTING')
-        if self.pdf_threads.isChecked():
-            rv = self.decide_pages_per_cpu(inputpath)
-            if rv:
-                image_list = convert_files_to_jpeg(
-                    rv, inputpath, tmp_jpeg_folder, poppler_path)
-
-        if not image_list:
-            image_list = pdf_to_jpeg((inputpath, tmp_jpeg_folder, None, None, None, poppler_path,))
-
-        if not image_list:
-            return False
-
-        jobs = []
-
-        for count, jpeg_image_path in enumerate(image_list):
-            filename = t.zero_prefiller(count, lenght=5)
-            webp_save_path = f'{tmp_folder}/{filename}.webp'
-            webp_save_path = os.path.abspath(os.path.expanduser(webp_save_path))
-
-            jobs.append(
-                (jpeg_image_path, webp_save_path, outputpath, self.webp_slider.value(), self.check_4k.isChecked(),)
-            )
-
-        widget.status_label.setText('CONVERTING')
-        if not self.wepb_threads.isChecked():
-            for i in jobs:
-                convert_files_to_webp([i])
-        else:
-            convert_files_to_webp(jobs)
-
-        widget.status_label.setText('RECOMPRESSING')
-        rv = recompress_fucntion(outputpath, tmp_folder)
-
-        return dict(status=rv, tmp_webp_folder=tmp_folder, tmp_jpeg_folder=tmp_jpeg_folder, outputpath=outputpath)
-
-    def decide_pages_per_cpu(self, inputpath):
+        return dict(
+            poppler_path=self.get_poppler_path(),
+            webp_options=webp_options(self.get_webp_preset(widget), self.webp_slider.value()),
+            resize=dict(width=MAX_WIDTH_4K, quality=self.get_resize_quality()) if self.check_4k.isChecked() else None,
+            classify=self.classify_pages.isChecked(),
+            pdf_threads=self.pdf_threads.isChecked(),
+            webp_threads=self.wepb_threads.isChecked(),
+            in_memory=self.in_memory.isChecked(),
+            memory_cap_mb=self.get_memory_cap(),
+            verify=self.verify_cbz.isChecked(),
+            renderer=self.get_renderer(),
+            page_policy=self.get_page_policy(),
+            trim_margins=self.trim_margins.isChecked(),
+            page_cache_mb=self.get_page_cache_mb(),
+            autotune=self.get_autotune(),
+            autotune_target=self.get_autotune_target(),
+        )
+
+    def convert_pdf_to_images(self, inputpath, outputpath, widget=None, md5=None):
         """
-        counts physical cores and calculates a fair amount of images per core, a
-        dictionary is created with letter (key) that will be used to save the temporary
-        jpeg files. If the pdf has to less files, then job ignores multiple cpu's
         :param inputpath: string
-        :return: dictionary or bool
-        """
-
-        def correct_rvdict(rv):
-            """
-            rv['a'] cannot be less than 2 (begin and end)
-            this investegates, interfers and corrects that
-            """
-            if rv['a'] == []:
-                rv.pop('a')
-
-            elif rv['a'] == [0]:
-                rv['b'].append(0)
-                rv.pop('a')
-
-            for i in rv:
-                rv[i].sort()
-
-        page_count = self.get_page_count_for_pdf(inputpath)
-        cpu_count = psutil.cpu_count(logical=False)
-        alphabet = list(string.ascii_lowercase)
-
-        if cpu_count >= len(alphabet):
-            cpu_count = len(alphabet) - 1
-
-        if page_count and page_count / 3 > cpu_count:
-            rv = {}
-            pages_per_cpu = math.ceil(page_count / cpu_count)
-            pages_per_cpu = int(pages_per_cpu)
-            for c in range(cpu_count - 1, -1, -1):
-                letter = alphabet[c]
-                rv[letter] = []
-                for cc in range(pages_per_cpu):
-                    if page_count < 0:
-                        break
-                    rv[letter].append(page_count)
-                    page_count -= 1
-
-            correct_rvdict(rv)
-            return rv
+        :param outputpath: string
+        :param widget: PDFWidget or None when the job runs without one
+        :param md5: string, fingerprint (taken from widget when None)
+        :return: dictionary (see convert_pdf)
+        """
+        md5 = md5 or widget.data['md5']
+        status = widget.status_label.setText if widget else None
+        progress = lambda rendered, encoded: widget and widget.data.update(progress=(rendered, encoded))
 
-        return False
+        return convert_file(inputpath, outputpath, md5, self.job_settings(widget), status=status, progress=progress)
 
     def deside_figure_size(self):
         """
@@ -475,15 +1496,11 @@ class PDF2CBZmain(QtWidgets.QMainWindow):
         """
         draws widgets from self.pdf_files, if present
         """
-        def thread_extract_image(self, widget, tmp_folder):
-            images = pdf_to_jpeg((widget.data['path'], tmp_folder, 0, 1, 'Cover', self.get_poppler_path()))
-            if t.retrieve_setting(DB.settings.store_covers):
-                t.save_image_as_blob(images[0], height=self.figure_height, md5=widget.data['md5'])
-
-        def thread_set_blob_image(rv, tmp_folder):
+        def thread_set_blob_image(md5, tmp_folder):
+            rv = sqlite.ro('select cover from covers where md5 = (?)', md5)
             tmp_cover = os.path.abspath(os.path.expanduser(tmp_folder + '/cover.webp'))
             with open(tmp_cover, 'wb') as output_file:
-                output_file.write(rv[DB.files.cover])
+                output_file.write(rv[0])
 
         if 'pdf_files' not in dir(self):
             return
@@ -498,11 +1515,13 @@ class PDF2CBZmain(QtWidgets.QMainWindow):
             if self.pdf_files[path]['drawn']:
                 continue
 
-            # this is not md5, more like a quick-budget checksum
-            md5 = t.md5_hash_file(path, partial_file=True)
-            md5 += str(os.path.getsize(path))
-            md5 = t.md5_hash_string(md5)
+            md5 = self.pdf_files[path].get('md5') or self.fingerprint(path)
+
+            rv = sqlite.ro('select converted from files where md5 = (?)', md5)
 
+            if not rv:
+                # row first, post_init caches the page count into it
+                sqlite.w('insert or ignore into files (md5) values (?)', md5)
 
             self.pdf_files[path]['drawn'] = True
             widget = PDFWidget(self.canvas, self, type='PDF')
@@ -513,40 +1532,293 @@ class PDF2CBZmain(QtWidgets.QMainWindow):
             widget.data['error'] = False
             widget.post_init()
 
-            rv = sqlite.ro('select * from files where md5 = (?)', md5)
-            tmp_folder = t.tmp_folder()
-
-            if rv and rv[DB.files.converted]:
+            if rv and rv[0]:
                 widget.status_label.setText('SIMILAR FILE PROCESSED')
                 widget.status_label.setStyleSheet('background-color: darkGreen ; color: white')
 
-            if not rv:
-                query, values = sqlite.empty_insert_query(table='files')
-                values[DB.files.md5] = widget.data['md5']
-                sqlite.w(query, values)
-
-            if rv and rv[DB.files.cover]:
+            if sqlite.ro('select 1 from covers where md5 = (?)', md5):
+                tmp_folder = t.tmp_folder()
                 t.start_thread(
-                    thread_set_blob_image, worker_arguments=(rv, tmp_folder,),
+                    thread_set_blob_image, worker_arguments=(md5, tmp_folder,),
                     finished_function=widget.set_pixmap, finished_arguments=(tmp_folder, True,),
                     threads=4, name='refresh'
                 )
+            elif self.prefetched.get(path, {}).get('cover'):
+                self.show_cover(widget, self.prefetched.pop(path)['cover'])
             else:
-                t.start_thread(
-                    thread_extract_image, worker_arguments=(self, widget, tmp_folder,),
-                    finished_function=widget.set_pixmap, finished_arguments=(tmp_folder, True,),
-                    threads=4, name='refresh'
-                )
+                self.cover_widgets[path] = widget
 
-            if self.dev_mode:
+            if not self.dev_mode:
+                # one widget per event loop pass keeps the window responsive while drawing
+                t.schedule(self.draw_pdf_files, name='draw')
                 return
 
-            t.start_thread(self.dummy, finished_function=self.draw_pdf_files, name='gui', priority=1)
             break
 
-    def dummy(self, sleep=None):
-        if sleep:
-            time.sleep(sleep)
+        self.request_covers()
+        t.schedule(self.prefetch_next_screens, msec=PREFETCH_DELAY, name='prefetch')
+
+    def request_covers(self):
+        """
+        widgets drawn without a stored cover go to the thumbnail workers as one batch
+        """
+        widgets = [x for x in self.cover_widgets.values() if 'pixmap_label' not in dir(x)]
+        # the prefetcher may already be rendering some of them, those are left to it
+        widgets = [x for x in widgets if self.prefetcher.release(x.data['path'])]
+
+        if widgets:
+            poppler_path, renderer = self.get_poppler_path(), self.get_renderer()
+            jobs = [(x.data['path'], x.data['md5'], self.figure_height, poppler_path, renderer,) for x in widgets]
+            self.thumbnails.submit(jobs)
+
+        if self.cover_widgets:
+            t.schedule(self.collect_covers, msec=50, name='covers')
+
+    def collect_covers(self):
+        """
+        hands finished covers to their widgets, runs on the gui thread until the batch is done
+        """
+        store_covers = None
+        for rv in self.thumbnails.drain() + self.prefetcher.drain():
+            widget = self.cover_widgets.pop(rv['path'], None)
+            if rv['pages']:
+                query = 'update files set pages = (?), page_width = (?), page_height = (?) where md5 = (?)'
+                sqlite.w(query, (rv['pages'], *(rv['page_size'] or (None, None)), rv['md5'],))
+
+            if not rv['cover']:
+                continue
+
+            if store_covers is None:
+                store_covers = t.retrieve_setting(DB.settings.store_covers)
+
+            if store_covers:
+                sqlite.w('insert or replace into covers (cover, md5) values (?,?)', values=rv['md5'], blob=rv['cover'])
+
+            if widget and widget in self.widgets['main']:
+                self.show_cover(widget, rv['cover'])
+            elif not self.pdf_files.get(rv['path'], {}).get('drawn'):
+                self.prefetched[rv['path']] = rv
+
+        if self.thumbnails.busy or self.prefetcher.busy:
+            t.schedule(self.collect_covers, msec=50, name='covers')
+
+    def closeEvent(self, event):
+        """
+        the cover processes would otherwise outlive the window until their batch is done
+        """
+        self.thumbnails.shutdown()
+        self.prefetcher.shutdown()
+        super(PDF2CBZmain, self).closeEvent(event)
+
+    def show_cover(self, widget, cover):
+        """
+        :param widget: PDFWidget
+        :param cover: bytes, webp
+        """
+        tmp_folder = t.tmp_folder()
+        with open(os.path.abspath(os.path.expanduser(tmp_folder + '/cover.webp')), 'wb') as output_file:
+            output_file.write(cover)
+
+        widget.set_pixmap(tmp_folder, delete=True)
+
+    def prefetch_candidates(self):
+        """
+        :return: list with paths from self.pdf_files that the next PREFETCH_SCREENS screens will draw
+        """
+        if platform.system() == "Windows" and not self.get_poppler_path():
+            return []
+
+        columns = max(1, int((self.canvas.width() - 3) // (self.figure_width + 3)))
+        rows = max(1, int((self.canvas.height() - 3) // (self.figure_height + 3)))
+
+        rv = []
+        for path, data in self.pdf_files.items():
+            if len(rv) >= columns * rows * PREFETCH_SCREENS:
+                break
+
+            if not data['drawn']:
+                rv.append(path)
+
+        return rv
+
+    def prefetch_next_screens(self):
+        """
+        idle time work so NEXT (and continous) draws instantly: one fingerprint per event loop
+        pass, then the covers and page counts still missing go to the low priority prefetcher.
+        Drawing pushes it back by PREFETCH_DELAY, a folder change cancels it
+        """
+        if 'pdf_files' not in dir(self):
+            return
+
+        if self.thumbnails.busy:
+            t.schedule(self.prefetch_next_screens, msec=PREFETCH_DELAY, name='prefetch')
+            return
+
+        candidates = self.prefetch_candidates()
+        for path in candidates:
+            if not self.pdf_files[path].get('md5'):
+                md5 = self.fingerprint(path)
+                self.pdf_files[path]['md5'] = md5
+                sqlite.w('insert or ignore into files (md5) values (?)', md5)
+                t.schedule(self.prefetch_next_screens, name='prefetch')
+                return
+
+        poppler_path, renderer = self.get_poppler_path(), self.get_renderer()
+        jobs = []
+        for path in candidates:
+            md5 = self.pdf_files[path]['md5']
+            if path in self.prefetched or path in self.prefetcher.pending:
+                continue
+
+            rv = sqlite.ro('select pages from files where md5 = (?)', md5)
+            if rv and rv[0] and sqlite.ro('select 1 from covers where md5 = (?)', md5):
+                continue
+
+            jobs.append((path, md5, self.figure_height, poppler_path, renderer,))
+
+        if jobs:
+            self.prefetcher.submit(jobs)
+
+        if self.prefetcher.busy:
+            t.schedule(self.collect_covers, msec=50, name='covers')
+
+    def fingerprint(self, path):
+        return fingerprint(path)
+
+    def output_path_for(self, path):
+        return output_path_for(path, self.to_dir.toPlainText())
+
+    def check_job(self, inputpath, outputpath, md5):
+        return check_job(inputpath, outputpath, md5, self.to_dir.toPlainText())
+
+    def check_duplicate(self, inputpath, outputpath):
+        return apply_duplicate_rule(inputpath, outputpath, self.to_dir.toPlainText(), self.get_duplicate_rule())
+
+    def complete_job(self, inputpath, md5, rv, started):
+        """
+        bookkeeping once a file has been converted successfully
+        :param inputpath: string
+        :param md5: string
+        :param rv: dictionary from convert_pdf_to_images
+        :param started: float, time.time() when the conversion started
+        """
+        record_conversion(md5, rv)
+
+        info = None if rv['archive'] else self.get_pdf_info(inputpath)
+        if info:
+            self.throughput.record(job_cost(info['pages'], info['page_size']), info['pages'], time.time() - started)
+
+        if self.delete_source_pdf.isChecked() and inputpath != rv['outputpath']:
+            os.remove(inputpath)
+
+    def run_queued_job(self, path, md5):
+        """
+        converts a queued file that has no widget on screen
+        :param path: string
+        :param md5: string
+        """
+        if not self.queue.claim(path):
+            return # a worker process got to it first
+
+        outputpath = self.output_path_for(path)
+
+        rv = self.check_job(path, outputpath, md5)
+        if rv:
+            self.queue.finish(path, ok=False, error=rv[0], retry=False)
+            return
+
+        rv = self.check_duplicate(path, outputpath)
+        if rv:
+            self.queue.finish(path, ok=True, error=rv[0])
+            return
+
+        started = time.time()
+        rv = self.convert_pdf_to_images(path, outputpath, md5=md5)
+
+        if rv['status']:
+            self.complete_job(path, md5, rv, started)
+            if 'pdf_files' in dir(self) and path in self.pdf_files:
+                self.pdf_files[path]['processed'] = True
+
+        self.queue.finish(path, ok=rv['status'], error=None if rv['status'] else 'HDD FULL')
+
+    def job_running(self):
+        """
+        :return: bool, a widget or a queued job without widget is being converted
+        """
+        if self.headless_job:
+            return True
+
+        for widget in self.widgets['main']:
+            if widget.data['work'] or widget.status_label.text() == 'QUEUED':
+                return True
+
+        return False
+
+    def enqueue_library(self):
+        """
+        every pdf in the source folder that isnt converted goes into the queue,
+        not only the ones drawn on screen, pdfinfo is cached on the way so the
+        ordering policy has something to work with
+        """
+        for path in list(self.pdf_files):
+            if not os.path.exists(path):
+                continue
+
+            md5 = self.pdf_files[path].get('md5') or self.fingerprint(path)
+            self.pdf_files[path]['md5'] = md5
+
+            rv = sqlite.ro('select converted from files where md5 = (?)', md5)
+            if not rv:
+                sqlite.w('insert or ignore into files (md5) values (?)', md5)
+
+            elif rv[0] and same_content_converted(path, md5) is not False:
+                continue
+
+            self.get_pdf_info(path)
+            self.queue.enqueue(path, md5)
+
+        self.library_enqueued = True
+
+    def enqueue_archives(self, folder):
+        """
+        cbz files in folder go into the queue to be recompressed, when it is
+        the destination folder they are replaced by their recompressed version
+        :param folder: string, source folder
+        """
+        if os.path.exists(folder):
+            enqueue_archives(self.queue, folder)
+
+    def start_next_job(self):
+        """
+        CONTINOUS drains the persistent queue, files drawn on screen are processed
+        through their widget and everything else without one
+        """
+        if not self.continous_convertion.isChecked() or self.job_running():
+            return
+
+        if 'pdf_files' in dir(self) and self.pdf_files and not self.library_enqueued:
+            t.start_thread(self.enqueue_library, finished_function=self.start_next_job, name='queue')
+            return
+
+        row = self.queue.next_queued(self.get_job_order())
+        if not row:
+            return
+
+        for widget in self.widgets['main']:
+            if widget.data['path'] == row['path']:
+                widget.data['processed'] = False
+                widget.preprocess_file()
+                return
+
+        self.headless_job = row['path']
+        t.start_thread(self.run_queued_job, worker_arguments=(row['path'], row['md5'],),
+                       finished_function=[partial(self.queue.settle, row['path']), self.headless_job_finished])
+
+    def headless_job_finished(self):
+        self.headless_job = None
+        self.show_hdd_spaces()
+        self.start_next_job()
 
     def from_dir_changed(self):
         """
@@ -555,12 +1827,19 @@ class PDF2CBZmain(QtWidgets.QMainWindow):
         text = self.from_dir.toPlainText().strip()
         if os.path.exists(text):
             sqlite.w('update settings set source_path = (?) where id is 1', text)
+            t.cancel('prefetch')
+            self.prefetcher.cancel()
+            self.prefetched.clear()
             all_files = self.get_all_files_from_path(text, extension='PDF')
             self.pdf_files = self.make_all_files_dictionary(all_files)
+            self.library_enqueued = False
 
             if not self.pdf_files:
                 return
 
+            if self.get_duplicate_rule() != 'convert':
+                t.start_thread(self.hash_library, name='hashing')
+
             self.reset_widgets(all=True)
             self.draw_pdf_files()
 
@@ -597,17 +1876,411 @@ class PDF2CBZmain(QtWidgets.QMainWindow):
         :param path: string
         :return: integer or False
         """
-        poppler_path = self.get_poppler_path()
-        if platform.system() == "Windows":
-            if not poppler_path or not os.path.exists(poppler_path) or len(poppler_path) < 1:
-                return False
+        rv = self.get_pdf_info(path)
+        if rv:
+            return rv['pages']
+        else:
+            return False
+
+    def get_webp_preset(self, widget=None):
+        """
+        a preset chosen on the widget wins over the global one
+        :param widget: PDFWidget or None
+        :return: string
+        """
+        if widget and widget.data.get('preset'):
+            return widget.data['preset']
+
+        return self.webp_preset.currentText().lower()
+
+    def preset_changed(self):
+        sqlite.w('update settings set webp_preset = (?) where id is 1', self.get_webp_preset())
+
+    def render_sample_pages(self, tmp_folder, samples=4):
+        """
+        renders the middle page from a few pdf files spread over the current library
+        :param tmp_folder: string
+        :param samples: integer, number of pdf files to take a page from
+        :return: list with jpeg paths
+        """
+        if 'pdf_files' not in dir(self) or not self.pdf_files:
+            return []
+
+        paths = list(self.pdf_files)
+        paths = [paths[int(x * len(paths) / samples)] for x in range(min(samples, len(paths)))]
+
+        image_paths = []
+        for count, path in enumerate(paths):
+            page_count = self.get_page_count_for_pdf(path)
+            if not page_count:
+                continue
+
+            page = max(1, page_count // 2)
+            output_file = 'bench' + t.zero_prefiller(count, lenght=3)
+            job = (path, tmp_folder, page, page, output_file, self.get_poppler_path(), False, self.get_renderer(), None,)
+            image_paths += pdf_to_jpeg(job)
+
+        close_documents() # this runs in the gui process, which shouldnt keep a pdf open
+        return image_paths
+
+    def benchmark_webp_presets(self):
+        """
+        encodes sample pages from the current library with every preset,
+        report is stored in self.benchmark_result
+        """
+        tmp_folder = t.tmp_folder('benchmark', hash=True, delete=True)
+        image_paths = self.render_sample_pages(tmp_folder)
+        if not image_paths:
+            self.benchmark_result = 'NOTHING TO BENCHMARK'
+            shutil.rmtree(tmp_folder)
+            return
+
+        results = benchmark_presets(image_paths, self.webp_slider.value())
+        self.benchmark_result = f'{len(image_paths)} SAMPLE PAGES AT QUALITY {self.webp_slider.value()}\n\n'
+        self.benchmark_result += benchmark_report(results)
+        shutil.rmtree(tmp_folder)
+
+    def benchmark_resize_quality(self):
+        """
+        downscales sample pages to 4K with every resize quality and the old full decode
+        path, report (time and peak memory per page) is stored in self.benchmark_result
+        """
+        tmp_folder = t.tmp_folder('benchmark', hash=True, delete=True)
+        image_paths = self.render_sample_pages(tmp_folder)
+        if not image_paths:
+            self.benchmark_result = 'NOTHING TO BENCHMARK'
+            shutil.rmtree(tmp_folder)
+            return
+
+        self.benchmark_result = f'{len(image_paths)} SAMPLE PAGES DOWNSCALED TO {MAX_WIDTH_4K} WIDE\n\n'
+        self.benchmark_result += benchmark_resize(image_paths, width=MAX_WIDTH_4K)
+        shutil.rmtree(tmp_folder)
+
+    def benchmark_render_backends(self):
+        """
+        renders a few pages from the middle of some pdf files in the current library with
+        every renderer, to files and into memory, report is stored in self.benchmark_result
+        """
+        if 'pdf_files' not in dir(self) or not self.pdf_files:
+            self.benchmark_result = 'NOTHING TO BENCHMARK'
+            return
+
+        paths = list(self.pdf_files)
+        paths = [paths[int(x * len(paths) / 4)] for x in range(min(4, len(paths)))]
+
+        samples = []
+        for path in paths:
+            page_count = self.get_page_count_for_pdf(path)
+            if page_count:
+                first_page = max(1, page_count // 2 - 1)
+                samples.append((path, first_page, min(page_count, first_page + 3),))
+
+        if not samples:
+            self.benchmark_result = 'NOTHING TO BENCHMARK'
+            return
+
+        tmp_folder = t.tmp_folder('benchmark', hash=True, delete=True)
+        self.benchmark_result = f'{len(samples)} PDF FILES, UP TO 4 PAGES EACH AT {RENDER_DPI} DPI\n\n'
+        self.benchmark_result += benchmark_renderers(samples, RENDER_DPI, tmp_folder, self.get_poppler_path())
+        shutil.rmtree(tmp_folder)
+
+    def show_benchmark_result(self):
+        QtWidgets.QMessageBox.information(self, 'BENCHMARK', self.benchmark_result)
+
+    def start_quality_preview(self, widget, page):
+        """
+        settings are read here in the gui thread, the render and encodes run on the threadpool
+        :param widget: PDFWidget
+        :param page: integer
+        """
+        page_count = self.get_page_count_for_pdf(widget.data['path'])
+        if not page_count:
+            return
+
+        variants = preview_variants(self.get_webp_preset(widget), self.webp_slider.value())
+        self.setWindowTitle('PREVIEWING...')
+        t.start_thread(self.preview_quality, worker_arguments=(widget, page, page_count, self.job_settings(widget), variants),
+                       finished_function=[self.show_quality_preview, self.show_hdd_spaces], name='preview')
+
+    def preview_quality(self, widget, page, page_count, settings, variants):
+        """
+        renders one page once (through the page cache when it is on) and encodes it with
+        every variant in parallel, result is stored in self.preview_result
+        :param widget: PDFWidget
+        :param page: integer
+        :param page_count: integer
+        :param settings: dictionary from job_settings
+        :param variants: list from preview_variants
+        """
+        path, md5 = widget.data['path'], widget.data['md5']
+        self.preview_result = dict(widget=widget, page=page, pages=page_count, render_seconds=0, results=[])
+
+        rv = sqlite.ro('select render_mode, margin_trim from files where md5 = (?)', md5)
+        grayscale = bool(rv and rv[0] == 'grayscale')
+        margin_trim = trim_from_text(rv[1]) if rv and settings['trim_margins'] else None
+
+        cache = None
+        if settings['page_cache_mb']:
+            cache = PageCache(page_cache_folder(), md5, RENDER_DPI, grayscale,
+                              renderer=settings['renderer'], budget_mb=settings['page_cache_mb'])
+
+        tmp_folder = t.tmp_folder('preview', hash=True, delete=True)
+        started = time.time()
+        job = (path, tmp_folder, page, page, 'preview', settings['poppler_path'], grayscale, settings['renderer'], cache,)
+        image_paths = pdf_to_jpeg(job)
+        close_documents()
+        if cache:
+            cache.charge(page, page)
+
+        self.preview_result['render_seconds'] = round(time.time() - started, 2)
+
+        if image_paths:
+            self.preview_result['results'] = preview_page(
+                image_paths[0], variants, page_count, resize=settings['resize'], classify=settings['classify'],
+                margin_trim=margin_trim)
+
+        shutil.rmtree(tmp_folder)
+
+    def show_quality_preview(self):
+        """
+        crops of every variant side by side, clicking the text under a crop puts its
+        quality on the slider and its preset on the file
+        """
+        rv = self.preview_result
+        if not rv['results']:
+            QtWidgets.QMessageBox.information(self, 'PREVIEW', 'NOTHING TO PREVIEW')
+            return
+
+        self.preview_dialog = QtWidgets.QDialog(self)
+        self.preview_dialog.setWindowTitle(
+            f"{rv['widget'].data['filename']} | PAGE {rv['page']} OF {rv['pages']} | RENDERED IN {rv['render_seconds']}s")
+
+        layout = QtWidgets.QGridLayout(self.preview_dialog)
+        for count, result in enumerate(rv['results']):
+            row, column = (count // PREVIEW_COLUMNS) * 2, count % PREVIEW_COLUMNS
+
+            pixmap = QPixmap()
+            pixmap.loadFromData(result['crop'])
+            crop = QtWidgets.QLabel(self.preview_dialog)
+            crop.setPixmap(pixmap)
+            layout.addWidget(crop, row, column)
+
+            button = QtWidgets.QPushButton(preview_caption(result), self.preview_dialog)
+            button.clicked.connect(partial(self.use_preview_result, rv['widget'], result))
+            layout.addWidget(button, row + 1, column)
+
+        self.preview_dialog.show()
 
-        rv = pdfinfo_from_path(path, poppler_path=poppler_path)
+    def use_preview_result(self, widget, result):
+        """
+        :param widget: PDFWidget
+        :param result: dictionary from preview_page
+        """
+        self.webp_slider.setValue(result['quality'])
+        if result['preset'] != self.get_webp_preset():
+            widget.data['preset'] = result['preset']
+        else:
+            widget.data['preset'] = None
+
+        self.preview_dialog.close()
+
+    def get_resize_quality(self):
+        """
+        :return: string, key in RESIZE_QUALITY
+        """
+        rv = t.retrieve_setting(DB.settings.resize_quality)
+        return rv if rv in RESIZE_QUALITY else DEFAULT_RESIZE_QUALITY
+
+    def get_page_policy(self):
+        """
+        :return: string, key in PAGE_POLICIES
+        """
+        rv = t.retrieve_setting(DB.settings.page_policy)
+        return rv if rv in PAGE_POLICIES else DEFAULT_PAGE_POLICY
+
+    def get_duplicate_rule(self):
+        """
+        :return: string, key in DUPLICATE_RULES
+        """
+        rv = t.retrieve_setting(DB.settings.duplicate_rule)
+        return rv if rv in DUPLICATE_RULES else DEFAULT_DUPLICATE_RULE
+
+    def hash_library(self):
+        """
+        full content hashes for every pdf in the source folder, only new and changed files are read
+        """
+        if 'pdf_files' in dir(self):
+            hash_files(list(self.pdf_files), fingerprint)
+
+    def find_duplicates(self):
+        self.hash_library()
+        self.benchmark_result = duplicates_report()
+
+    def show_duplicates_report(self):
+        QtWidgets.QMessageBox.information(self, 'DUPLICATES', self.benchmark_result)
 
-        if rv and rv['Pages']:
-            return rv['Pages']
+    def get_renderer(self):
+        """
+        :return: string, key in RENDERERS that can run here
+        """
+        return renderer_or_default(t.retrieve_setting(DB.settings.renderer))
+
+    def get_memory_cap(self):
+        """
+        :return: integer, megabytes a job may keep in RAM before spilling
+        """
+        rv = t.retrieve_setting(DB.settings.memory_cap_mb)
+        return rv or DEFAULT_MEMORY_CAP_MB
+
+    def get_page_cache_mb(self):
+        """
+        :return: integer, megabytes of rendered pages kept between jobs, 0 is off
+        """
+        rv = t.retrieve_setting(DB.settings.page_cache_mb)
+        return rv or DEFAULT_PAGE_CACHE_MB
+
+    def get_autotune(self):
+        """
+        :return: string, key in AUTOTUNE_MODES
+        """
+        rv = t.retrieve_setting(DB.settings.autotune)
+        return rv if rv in AUTOTUNE_MODES else DEFAULT_AUTOTUNE
+
+    def get_autotune_target(self, mode=None):
+        """
+        :param mode: string or None for the current mode
+        :return: float, mean ssim for ssim, MB per page for size
+        """
+        if (mode or self.get_autotune()) == 'size':
+            return t.retrieve_setting(DB.settings.autotune_mb_page) or DEFAULT_TARGET_MB_PAGE
+
+        return t.retrieve_setting(DB.settings.autotune_ssim) or DEFAULT_TARGET_SSIM
+
+    def evict_page_cache(self):
+        """
+        shrinks the page cache to the current setting, everything goes when it is off
+        """
+        evict_pages(page_cache_folder(), self.get_page_cache_mb())
+
+    def get_pdf_info(self, path):
+        """
+        :param path: string
+        :return: dictionary with pages and page_size (pts) or False
+        """
+        md5 = None
+        if 'pdf_files' in dir(self) and path in self.pdf_files:
+            md5 = self.pdf_files[path].get('md5')
+
+        return get_pdf_info(path, self.get_poppler_path(), md5)
+
+    def job_candidates(self, widgets):
+        """
+        :param widgets: list with PDFWidgets
+        :return: list with dictionaries for order_jobs -> widget, cost, mtime, priority
+        """
+        rv = []
+        for widget in widgets:
+            info = self.get_pdf_info(widget.data['path'])
+            if not info or not os.path.exists(widget.data['path']):
+                continue
+
+            rv.append(dict(
+                widget=widget,
+                cost=job_cost(info['pages'], info['page_size']),
+                mtime=os.path.getmtime(widget.data['path']),
+                priority=widget.data.get('priority', 0),
+            ))
+
+        return rv
+
+    def ordered_jobs(self):
+        """
+        the persistent queue when it holds anything, else the unprocessed widgets on screen
+        :return: list with candidates (dictionaries with cost and widget or None) in the order CONTINOUS takes them
+        """
+        rv = self.queue.ordered(self.get_job_order())
+        if rv:
+            widgets = {x.data['path']: x for x in self.widgets['main']}
+            for job in rv:
+                job['widget'] = widgets.get(job['path'])
+            return rv
+
+        widgets = [x for x in self.widgets['main'] if not x.data['processed']]
+        return order_jobs(self.job_candidates(widgets), self.get_job_order())
+
+    def get_job_order(self):
+        return self.job_order.currentText().lower()
+
+    def job_order_changed(self):
+        sqlite.w('update settings set job_order = (?) where id is 1', self.get_job_order())
+        self.show_projection(dialog=False)
+
+    def show_dashboard(self):
+        if 'dashboard' not in dir(self):
+            self.process_monitor = ProcessMonitor()
+            self.dashboard = Dashboard(self)
+
+        self.dashboard.show()
+        self.dashboard.raise_()
+
+    def dashboard_text(self):
+        """
+        called by the dashboard on its timer, only the queue projection touches
+        the database and that one is refreshed every DASHBOARD_ETA_SECONDS
+        :return: string
+        """
+        rates, totals = PIPELINE_STATS.rates(), PIPELINE_STATS.totals()
+        lines = ['PAGES/SEC: ' + ' | '.join(f'{x.upper()} {round(rates[x], 2)} ({totals[x]})' for x in STAGES)]
+
+        if 'dashboard_eta' not in dir(self) or time.time() - self.dashboard_eta['updated'] > DASHBOARD_ETA_SECONDS:
+            projection = self.throughput.project(self.ordered_jobs())
+            self.dashboard_eta = dict(
+                updated=time.time(),
+                finished=projection[-1][1] if projection else None,
+                counts=self.queue.counts(),
+            )
+
+        working = sum(1 for x in self.widgets['main'] if x.data.get('work'))
+        counts = ' | '.join(f'{k.upper()} {v}' for k, v in self.dashboard_eta['counts'].items())
+        lines.append(f'JOBS: {working} RUNNING IN THIS WINDOW | QUEUE {counts or "EMPTY"}')
+
+        finished = self.dashboard_eta['finished']
+        if finished and math.isfinite(finished):
+            lines.append(f"ETA: {format_seconds(finished - time.time())} "
+                         f"(AROUND {time.strftime('%H:%M', time.localtime(finished))}) | "
+                         f"{round(self.throughput.items_per_hour(), 1)} ITEMS/HOUR")
         else:
-            return False
+            lines.append('ETA: UNKNOWN')
+
+        lines.append('')
+        for process in self.process_monitor.sample():
+            lines.append(f"{'MAIN' if process['main'] else 'WORKER'} {process['pid']}: "
+                         f"CPU {round(process['cpu'])}% | RAM {int(process['rss'] / 1000000)}mb")
+
+        lines.append('')
+        lines.append(disk_text('WORKING DIR', t.tmp_folder(create_dir=False, return_base=True)) or 'WORKING DIR: MISSING')
+        lines[-1] += f" | RESERVED {int(TMP_BUDGET.reserved() / 1000000)}mb"
+        lines.append(disk_text('DESTINATION', self.to_dir.toPlainText().strip()) or 'DESTINATION: MISSING')
+        return '\n'.join(lines)
+
+    def show_projection(self, dialog=True):
+        """
+        every waiting widget gets its place and projected finishing time as tooltip
+        :param dialog: bool, also list the whole projection in a messagebox
+        """
+        projection = self.throughput.project(self.ordered_jobs())
+        lines = []
+        for count, (job, finished) in enumerate(projection):
+            text = f"#{count + 1} DONE AROUND {time.strftime('%H:%M', time.localtime(finished))}"
+            if job['widget']:
+                job['widget'].status_label.setToolTip(text)
+            lines.append(f"{text} | {os.path.basename(job.get('path') or job['widget'].data['path'])}")
+
+        if dialog:
+            counts = ' | '.join(f'{k.upper()}: {v}' for k, v in self.queue.counts().items())
+            text = f"{round(self.throughput.items_per_hour(), 1)} ITEMS/HOUR SO FAR | {counts}\n\n"
+            text += '\n'.join(lines[0:40])
+            QtWidgets.QMessageBox.information(self, 'PROJECTED COMPLETION', text)
 
     def make_all_files_dictionary(self, all_files, append_to_this=False):
         """
@@ -688,6 +2361,10 @@ class PDF2CBZmain(QtWidgets.QMainWindow):
                 self.widgets[key].pop(count)
 
         if all:
+            t.cancel('draw')
+            t.cancel('covers')
+            self.thumbnails.cancel()
+            self.cover_widgets.clear()
             for key in self.widgets:
                 close_and_pop(self, key)
 
@@ -0,0 +1,123 @@
+try:
+    from scripts.margins_cy import ink_bounds as compiled_ink_bounds # python3 launcher.py compile
+except ImportError:
+    compiled_ink_bounds = None
+
+TRIM_WIDTH = 512 # margins are measured on a copy about this wide
+TRIM_TOLERANCE = 32 # luma distance from the paper color that counts as ink
+TRIM_INK = 0.004 # fraction of a row or column that has to be ink, specks and scanner dust stay margin
+TRIM_PADDING = 0.01 # fraction of the page left around the content
+TRIM_MIN = 0.01 # a side with less margin than this is not touched
+TRIM_MAX = 0.15 # no side ever loses more than this fraction of the page
+TRIM_SAMPLES = 12
+TRIM_SAMPLE_DPI = 48
+
+def ink_bounds_numpy(luma, paper, tolerance, ink):
+    """
+    :param luma: numpy uint8 array (height, width)
+    :param paper: integer, luma of the margin
+    :param tolerance: integer
+    :param ink: float, fraction of a row or column that makes it content
+    :return: tuple -> left, top, right, bottom in pixels (right and bottom exclusive) or None without ink
+    """
+    import numpy as np
+
+    mask = np.abs(luma.astype(np.int16) - paper) > tolerance
+    rows = np.flatnonzero(np.count_nonzero(mask, axis=1) > ink * luma.shape[1])
+    columns = np.flatnonzero(np.count_nonzero(mask, axis=0) > ink * luma.shape[0])
+
+    if not len(rows) or not len(columns):
+        return None
+
+    return int(columns[0]), int(rows[0]), int(columns[-1]) + 1, int(rows[-1]) + 1
+
+def page_margins(image):
+    """
+    the margin color is the most common luma along the four edges, a page whose
+    edges are not uniform (art to the border) ends up with no margins at all
+    :param image: PIL image
+    :return: tuple -> left, top, right, bottom margins as fractions of the page or None for a blank page
+    """
+    import numpy as np
+
+    factor = max(1, image.size[0] // TRIM_WIDTH)
+    small = (image.reduce(factor) if factor > 1 else image).convert('L')
+    luma = np.ascontiguousarray(np.asarray(small, dtype=np.uint8))
+
+    edges = np.concatenate([luma[0], luma[-1], luma[:, 0], luma[:, -1]])
+    paper = int(np.argmax(np.bincount(edges, minlength=256)))
+
+    box = (compiled_ink_bounds or ink_bounds_numpy)(luma, paper, TRIM_TOLERANCE, TRIM_INK)
+    if not box:
+        return None
+
+    height, width = luma.shape
+    left, top, right, bottom = box
+    return left / width, top / height, 1 - right / width, 1 - bottom / height
+
+def book_trim(margins):
+    """
+    one trim for the whole book so the pages keep the same size, each side gets the
+    smallest margin any sampled page has, less TRIM_PADDING and never more than TRIM_MAX
+    :param margins: list with page_margins results, blank pages (None) are ignored
+    :return: tuple -> left, top, right, bottom fractions or None when nothing is worth trimming
+    """
+    margins = [x for x in margins if x]
+    if not margins:
+        return None
+
+    rv = []
+    for side in range(4):
+        value = min(x[side] for x in margins) - TRIM_PADDING
+        rv.append(round(min(TRIM_MAX, value), 4) if value >= TRIM_MIN else 0.0)
+
+    return tuple(rv) if any(rv) else None
+
+def trim_page(image, trim):
+    """
+    crops the book trim off image, a page that has ink inside the trim (a spread,
+    art bleeding into the margin) is returned untouched instead of being cut
+    :param image: PIL image
+    :param trim: tuple from book_trim
+    :return: tuple -> PIL image, bool trimmed
+    """
+    margins = page_margins(image)
+    if margins and any(margins[x] < trim[x] for x in range(4)):
+        return image, False
+
+    width, height = image.size
+    box = (
+        round(width * trim[0]),
+        round(height * trim[1]),
+        width - round(width * trim[2]),
+        height - round(height * trim[3]),
+    )
+    return image.crop(box), True
+
+def trim_to_text(trim):
+    """
+    :param trim: tuple from book_trim or None
+    :return: string for files.margin_trim, empty when the book has nothing to trim
+    """
+    return ','.join(str(x) for x in trim) if trim else ''
+
+def trim_from_text(text):
+    """
+    :param text: string from files.margin_trim
+    :return: tuple -> left, top, right, bottom or None
+    """
+    try:
+        rv = tuple(float(x) for x in text.split(','))
+        return rv if len(rv) == 4 and any(rv) else None
+    except (AttributeError, ValueError):
+        return None
+
+def trim_summary(trim):
+    """
+    :param trim: tuple from book_trim or None
+    :return: string -> 'TRIM L:4% T:6% R:4% B:7%'
+    """
+    if not trim:
+        return 'TRIM: NONE'
+
+    return 'TRIM ' + ' '.join(f'{x}:{round(y * 100)}%' for x, y in zip('LTRB', trim))
@@ -0,0 +1,53 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+from libc.stdlib cimport calloc, free
+
+def ink_bounds(const unsigned char[:, ::1] luma, int paper, int tolerance, double ink):
+    """
+    compiled twin of margins.ink_bounds_numpy, one pass over the pixels
+    instead of a temporary array per numpy step
+    :param luma: contiguous uint8 buffer (height, width)
+    :param paper: integer, luma of the margin
+    :param tolerance: integer
+    :param ink: float, fraction of a row or column that makes it content
+    :return: tuple -> left, top, right, bottom in pixels (right and bottom exclusive) or None without ink
+    """
+    cdef Py_ssize_t height = luma.shape[0]
+    cdef Py_ssize_t width = luma.shape[1]
+    cdef Py_ssize_t x, y
+    cdef Py_ssize_t left = -1, top = -1, right = -1, bottom = -1
+    cdef int value
+    cdef int *rows = <int *> calloc(height, sizeof(int))
+    cdef int *columns = <int *> calloc(width, sizeof(int))
+
+    if rows == NULL or columns == NULL:
+        free(rows)
+        free(columns)
+        raise MemoryError()
+
+    try:
+        for y in range(height):
+            for x in range(width):
+                value = luma[y, x] - paper
+                if value > tolerance or value < -tolerance:
+                    rows[y] += 1
+                    columns[x] += 1
+
+        for y in range(height):
+            if rows[y] > ink * width:
+                if top < 0:
+                    top = y
+                bottom = y + 1
+
+        for x in range(width):
+            if columns[x] > ink * height:
+                if left < 0:
+                    left = x
+                right = x + 1
+    finally:
+        free(rows)
+        free(columns)
+
+    if top < 0 or left < 0:
+        return None
+
+    return left, top, right, bottom
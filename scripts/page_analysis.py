@@ -0,0 +1,200 @@
+from PIL import Image
+
+ANALYSIS_WIDTH = 1024 # pages are judged on a box-reduced copy, not the 485 dpi original
+GRAY_TOLERANCE = 12 # max channel spread (0-255) a pixel may have and still count as gray
+GRAY_PERCENTILE = 99.5 # jpeg noise and stray colored specks are allowed below this
+BILEVEL_MIDTONES = 0.04 # fraction of pixels between DARK and LIGHT allowed for line-art
+DARK, LIGHT = 48, 208
+PALETTE_COLORS = 64 # distinct colors (5 bits per channel) for a page to count as flat colored
+
+ENCODING_CODES = dict(color='C', grayscale='G', bilevel='B', palette='P')
+
+def analysis_array(image):
+    """
+    :param image: PIL image
+    :return: numpy int16 array (height, width, 3) no wider than ANALYSIS_WIDTH
+    """
+    import numpy as np # imported on first use, it is not needed to bring up the window
+
+    if image.mode not in ['L', 'RGB']:
+        # reduce refuses palette, bilevel and 16 bit pages from archives, the gray ones stay gray
+        image = image.convert('L' if image.mode in ['1', 'I', 'I;16', 'F'] else 'RGB')
+
+    factor = max(1, image.size[0] // ANALYSIS_WIDTH)
+    small = image.reduce(factor) if factor > 1 else image
+    return np.asarray(small.convert('RGB'), dtype=np.int16)
+
+def classify_array(rgb):
+    """
+    :param rgb: numpy array (height, width, 3)
+    :return: string -> bilevel, grayscale, palette or color
+    """
+    import numpy as np
+
+    spread = rgb.max(axis=2) - rgb.min(axis=2)
+
+    if np.percentile(spread, GRAY_PERCENTILE) <= GRAY_TOLERANCE:
+        luma = rgb.mean(axis=2)
+        midtones = np.count_nonzero((luma > DARK) & (luma < LIGHT)) / luma.size
+        return 'bilevel' if midtones <= BILEVEL_MIDTONES else 'grayscale'
+
+    packed = (rgb[..., 0] >> 3) << 10 | (rgb[..., 1] >> 3) << 5 | (rgb[..., 2] >> 3)
+    counts = np.bincount(packed.ravel(), minlength=32768)
+    # colors covering less than 0.01% of the page are jpeg fringes, not palette entries
+    if np.count_nonzero(counts > packed.size * 0.0001) <= PALETTE_COLORS:
+        return 'palette'
+
+    return 'color'
+
+def classify_page(image):
+    """
+    :param image: PIL image
+    :return: string -> bilevel, grayscale, palette or color
+    """
+    return classify_array(analysis_array(image))
+
+def choose_encoding(image, options):
+    """
+    picks the cheapest adequate webp encoding for image
+    :param image: PIL image
+    :param options: dictionary from webp_presets.webp_options (lossy settings)
+    :return: tuple -> image to save, options to save with, encoding string
+    """
+    encoding = classify_page(image)
+
+    if encoding == 'grayscale':
+        # chroma planes end up flat, libwebp spends next to nothing on them
+        return image.convert('L'), options, encoding
+
+    lossless = dict(lossless=True, method=options['method'], quality=60, exact=False)
+
+    if encoding == 'bilevel':
+        image = image.convert('L').point(lambda x: 255 if x >= 128 else 0)
+        return image, lossless, encoding
+
+    if encoding == 'palette':
+        return image.convert('RGB').quantize(colors=PALETTE_COLORS * 2), lossless, encoding
+
+    return image, options, encoding
+
+def encodings_summary(codes):
+    """
+    :param codes: string with one ENCODING_CODES letter per page
+    :return: string -> 'C:3 G:120 B:40'
+    """
+    return ' '.join(f'{x}:{codes.count(x)}' for x in ENCODING_CODES.values() if codes.count(x))
+
+BLANK_WIDTH = 256 # blank and duplicate checks run on a copy about this wide
+BLANK_TOLERANCE = 24 # luma distance from the most common value that still counts as paper
+BLANK_INK = 0.002 # fraction of pixels allowed to be ink (specks, scanner dust) on a blank page
+HASH_SIZE = 8 # difference hash of 8x8 = 64 bits
+DUPLICATE_DISTANCE = 5 # differing bits out of 64 for two pages to be the same page
+
+# keep: nothing is analyzed, skip-blank: blank pages (never the first) are left out,
+# skip-duplicates: blank pages and pages looking like an earlier page are left out
+PAGE_POLICIES = ['keep', 'skip-blank', 'skip-duplicates']
+DEFAULT_PAGE_POLICY = 'keep'
+
+def page_signature(image):
+    """
+    :param image: PIL image
+    :return: dictionary -> blank (bool), hash (integer, 64 bit difference hash)
+    """
+    import numpy as np
+
+    if image.mode not in ['L', 'RGB']:
+        image = image.convert('L') # see analysis_array
+
+    factor = max(1, image.size[0] // BLANK_WIDTH)
+    small = (image.reduce(factor) if factor > 1 else image).convert('L')
+    luma = np.asarray(small, dtype=np.int16)
+
+    paper = int(np.argmax(np.bincount(luma.ravel(), minlength=256)))
+    ink = np.count_nonzero(np.abs(luma - paper) > BLANK_TOLERANCE) / luma.size
+
+    thumb = np.asarray(small.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX), dtype=np.int16)
+    bits = (thumb[:, 1:] > thumb[:, :-1]).ravel()
+
+    return dict(blank=bool(ink <= BLANK_INK), hash=int(np.packbits(bits).view('>u8')[0]))
+
+def signature_from_file(path):
+    """
+    jpegs are decoded in draft mode, libjpeg scales them down while decoding
+    :param path: string
+    :return: dictionary from page_signature
+    """
+    image = Image.open(path)
+    if image.format == 'JPEG':
+        image.draft('L', (BLANK_WIDTH * 2, BLANK_WIDTH * 2))
+
+    return page_signature(image)
+
+def drops_blank(page, signature, policy):
+    """
+    the part of PageFilter.keep that doesnt depend on the rest of the book,
+    a worker that only sees a batch may act on it
+    :param page: integer, counting from 1
+    :param signature: dictionary from page_signature
+    :param policy: string, key in PAGE_POLICIES
+    :return: bool, True when the page is blank and left out
+    """
+    return signature['blank'] and page != 1 and policy != 'keep'
+
+class PageFilter:
+    def __init__(self, policy=DEFAULT_PAGE_POLICY):
+        """
+        decides per book which pages go into the archive, pages can be offered in any
+        order, the first of a set of duplicates offered is the one that is kept
+        :param policy: string, key in PAGE_POLICIES
+        """
+        self.policy = policy if policy in PAGE_POLICIES else DEFAULT_PAGE_POLICY
+        self.hashes = []
+        self.counts = dict(pages=0, blank=0, duplicate=0, skipped=0)
+
+    @property
+    def active(self):
+        return self.policy != 'keep'
+
+    def distance(self, value):
+        """
+        :param value: integer hash
+        :return: integer, fewest differing bits to any hash kept so far (65 if none)
+        """
+        import numpy as np
+
+        if not self.hashes:
+            return HASH_SIZE * HASH_SIZE + 1
+
+        xor = np.array(self.hashes, dtype=np.uint64) ^ np.uint64(value)
+        return int(np.unpackbits(xor.view(np.uint8)).reshape(len(self.hashes), -1).sum(axis=1).min())
+
+    def keep(self, page, signature):
+        """
+        :param page: integer, counting from 1
+        :param signature: dictionary from page_signature
+        :return: bool, False when the page should be left out
+        """
+        self.counts['pages'] += 1
+        rv = True
+
+        if signature['blank']:
+            self.counts['blank'] += 1
+            rv = not drops_blank(page, signature, self.policy)
+
+        elif self.distance(signature['hash']) <= DUPLICATE_DISTANCE:
+            self.counts['duplicate'] += 1
+            rv = self.policy != 'skip-duplicates'
+
+        else:
+            self.hashes.append(signature['hash'])
+
+        if not rv:
+            self.counts['skipped'] += 1
+
+        return rv
+
+    def summary(self):
+        """
+        :return: string -> 'BLANK:2 DUPLICATE:4 SKIPPED:6'
+        """
+        return f"BLANK:{self.counts['blank']} DUPLICATE:{self.counts['duplicate']} SKIPPED:{self.counts['skipped']}"
@@ -0,0 +1,198 @@
+from PIL import Image
+import os
+import pathlib
+import shutil
+
+DEFAULT_PAGE_CACHE_MB = 0 # off
+PNG_OPTIONS = dict(compress_level=1) # lossless, fast to write, still about a third of the raw pixels
+
+def link_or_copy(source, destination):
+    """
+    :param source: string
+    :param destination: string
+    """
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination) # other filesystem (ramdisk) or no hard links there
+
+class PageCache:
+    def __init__(self, folder, md5, dpi, grayscale=False, renderer='poppler', budget_mb=DEFAULT_PAGE_CACHE_MB):
+        """
+        rendered pages of one book at one dpi and color mode, kept on disk between jobs so
+        a re-encode with other webp or resize settings never renders again. Pages rendered
+        to files are kept as the jpeg poppler wrote (a cache hit is bit for bit what a new
+        render gives), pages rendered in memory as lossless png. Used from the render
+        processes: every page is written under a temporary name and renamed into place,
+        a hit refreshes its mtime, evict_pages drops the oldest mtimes first. The parent
+        charges every batch that comes back, so while rendering the cache is over budget by
+        the batches still in flight at most, a book that alone outgrows it stops being cached
+        :param folder: string, cache root
+        :param md5: string, fingerprint
+        :param dpi: integer
+        :param grayscale: bool
+        :param renderer: string, poppler and pdfium pages differ, a hit must come from the same one
+        :param budget_mb: integer
+        """
+        self.root = folder
+        self.folder = os.path.join(folder, md5)
+        self.prefix = f"{renderer}-{dpi}{'g' if grayscale else 'c'}-"
+        self.budget_mb = budget_mb
+        self.marker = os.path.join(self.folder, f'{self.prefix}over-{budget_mb}mb')
+        self.ledger = None # path: (mtime, size) of every file in the cache, parent side only
+
+    def __getstate__(self):
+        return dict(self.__dict__, ledger=None) # render workers only write, the ledger stays with the parent
+
+    def path(self, page, ext):
+        return os.path.join(self.folder, f'{self.prefix}{str(page).zfill(5)}.{ext}')
+
+    def get(self, page):
+        """
+        :param page: integer
+        :return: string, path of the cached page or None
+        """
+        for ext in ['jpg', 'png']:
+            path = self.path(page, ext)
+            try:
+                os.utime(path)
+                return path
+            except OSError:
+                continue
+
+        return None
+
+    def has(self, first_page, last_page):
+        """
+        :return: bool, every page in the range is cached
+        """
+        return all(self.get(x) for x in range(first_page, last_page + 1))
+
+    def pages(self, first_page, last_page):
+        """
+        :return: generator with (page, PIL image) tuples, like renderers.PageStream
+        """
+        for page in range(first_page, last_page + 1):
+            yield page, Image.open(self.get(page))
+
+    def put_file(self, page, source_path):
+        """
+        :param page: integer
+        :param source_path: string, jpeg from renderers.render_to_files
+        """
+        self.store(page, 'jpg', lambda tmp: link_or_copy(source_path, tmp))
+
+    def put_image(self, page, image):
+        """
+        :param page: integer
+        :param image: PIL image
+        """
+        self.store(page, 'png', lambda tmp: image.save(tmp, 'png', **PNG_OPTIONS))
+
+    def store(self, page, ext, write):
+        if os.path.exists(self.marker):
+            return # charge found this book bigger than the whole budget
+
+        destination = self.path(page, ext)
+        tmp = f'{destination}.{os.getpid()}.tmp'
+        try:
+            pathlib.Path(self.folder).mkdir(parents=True, exist_ok=True)
+            write(tmp)
+            os.replace(tmp, destination)
+        except OSError:
+            # full disk and friends, the cache is only a shortcut
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def charge(self, first_page, last_page):
+        """
+        parent side, called for every batch back from a render worker. The whole cache is walked
+        once per job, after that only the pages of the batch are looked at: new ones are added
+        to the ledger and the least recently used pages of other books make room for them
+        :param first_page: integer
+        :param last_page: integer
+        """
+        if self.ledger is None:
+            self.ledger = {}
+            for walk in os.walk(self.root):
+                for f in walk[2]:
+                    self.account(os.path.join(walk[0], f))
+
+        for page in range(first_page, last_page + 1):
+            for ext in ['jpg', 'png']:
+                if self.path(page, ext) not in self.ledger:
+                    self.account(self.path(page, ext))
+
+        budget = self.budget_mb * 1000000
+        mine = {x for x in self.ledger if os.path.basename(x).startswith(self.prefix) and os.path.dirname(x) == self.folder}
+        if sum(self.ledger[x][1] for x in mine) > budget:
+            for path in mine:
+                self.forget(path) # would push everything else out and still not fit
+
+            pathlib.Path(self.marker).touch()
+            return
+
+        total = sum(x[1] for x in self.ledger.values())
+        for _, size, path in sorted((x[0], x[1], path) for path, x in self.ledger.items() if path not in mine):
+            if total <= budget:
+                break
+
+            self.forget(path)
+            total -= size
+
+    def account(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+
+        self.ledger[path] = (stat.st_mtime, stat.st_size,)
+
+    def forget(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+        self.ledger.pop(path, None)
+
+def evict_pages(folder, budget_mb):
+    """
+    deletes the least recently used pages until folder fits budget_mb
+    :param folder: string, cache root
+    :param budget_mb: integer
+    :return: integer, bytes freed
+    """
+    files = []
+    for walk in os.walk(folder):
+        for f in walk[2]:
+            path = os.path.join(walk[0], f)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            files.append((stat.st_mtime, stat.st_size, path,))
+
+    total = sum(x[1] for x in files)
+    freed = 0
+    for _, size, path in sorted(files):
+        if total <= budget_mb * 1000000:
+            break
+
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+
+        total -= size
+        freed += size
+
+    for walk in list(os.walk(folder))[1:]:
+        try:
+            if not os.listdir(walk[0]):
+                os.rmdir(walk[0])
+        except OSError:
+            continue # emptied or filled by another process meanwhile
+
+    return freed
@@ -0,0 +1,79 @@
+from collections import OrderedDict
+import os
+import pathlib
+import threading
+
+class PageStore:
+    def __init__(self, ram_cap_mb, spill_folder):
+        """
+        keeps encoded pages in memory buffers, once ram_cap_mb is reached the
+        oldest buffers are written to spill_folder and read back on demand
+        :param ram_cap_mb: integer
+        :param spill_folder: string (created first time something spills)
+        """
+        self.ram_cap = ram_cap_mb * 1000000
+        self.spill_folder = spill_folder
+        self.buffers = OrderedDict()
+        self.spilled = {}
+        self.memory = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.buffers) + len(self.spilled)
+
+    def put(self, name, data):
+        """
+        :param name: string, filename inside the archive
+        :param data: bytes
+        """
+        with self.lock:
+            self.buffers[name] = data
+            self.memory += len(data)
+
+            while self.memory > self.ram_cap and len(self.buffers) > 1:
+                self.spill_oldest()
+
+    def spill_oldest(self):
+        name, data = self.buffers.popitem(last=False)
+        self.memory -= len(data)
+
+        if not os.path.exists(self.spill_folder):
+            pathlib.Path(self.spill_folder).mkdir(parents=True)
+
+        path = os.path.abspath(os.path.expanduser(f'{self.spill_folder}/{name}'))
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        self.spilled[name] = path
+
+    def get(self, name):
+        """
+        :param name: string
+        :return: bytes
+        """
+        with self.lock:
+            if name in self.buffers:
+                return self.buffers[name]
+
+        with open(self.spilled[name], 'rb') as f:
+            return f.read()
+
+    def names(self):
+        """
+        :return: list with every name, sorted (archive order)
+        """
+        with self.lock:
+            return sorted(list(self.buffers) + list(self.spilled))
+
+    def spilled_bytes(self):
+        return sum(os.path.getsize(x) for x in self.spilled.values() if os.path.exists(x))
+
+    def clear(self):
+        with self.lock:
+            for path in self.spilled.values():
+                if os.path.exists(path):
+                    os.remove(path)
+
+            self.buffers.clear()
+            self.spilled.clear()
+            self.memory = 0
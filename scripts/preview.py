@@ -0,0 +1,133 @@
+from PIL import Image, ImageFilter, ImageStat
+from scripts.margins import trim_page
+from scripts.page_analysis import choose_encoding
+from scripts.resize import downscale, open_for_size
+from scripts.webp_presets import WEBP_PRESETS, webp_options
+import concurrent.futures
+import io
+import os
+import time
+
+PREVIEW_QUALITIES = [40, 55, 70, 85]
+PREVIEW_CROP = 320 # pixels, square cut out of every encoded page at 1:1
+PREVIEW_GRID = 6 # the page is split into this many rows and columns to find the busiest tile
+PREVIEW_COLUMNS = 4
+
+def preview_variants(preset, quality, qualities=None):
+    """
+    the chosen preset at a spread of qualities plus every other preset at the chosen quality
+    :param preset: string, key in WEBP_PRESETS
+    :param quality: integer from the slider
+    :param qualities: list or None for PREVIEW_QUALITIES
+    :return: list with (preset, quality) tuples
+    """
+    rv = [(preset, x) for x in sorted(set((qualities or PREVIEW_QUALITIES) + [quality]))]
+    rv += [(x, quality) for x in WEBP_PRESETS if x != preset]
+    return rv
+
+def busiest_box(image, size=PREVIEW_CROP, grid=PREVIEW_GRID):
+    """
+    artifacts show first where the page has the most edges, so that is where the crop goes
+    :param image: PIL image
+    :param size: integer, pixels
+    :param grid: integer
+    :return: tuple -> left, top, right, bottom in pixels of image
+    """
+    small = image.convert('L')
+    small = small.reduce(max(1, small.size[0] // 256)).filter(ImageFilter.FIND_EDGES)
+    width, height = small.size
+
+    best, center = -1, (0.5, 0.5)
+    for row in range(grid):
+        for column in range(grid):
+            tile = (column * width // grid, row * height // grid, (column + 1) * width // grid, (row + 1) * height // grid)
+            if tile[2] <= tile[0] or tile[3] <= tile[1]:
+                continue
+
+            score = ImageStat.Stat(small.crop(tile)).mean[0]
+            if score > best:
+                best = score
+                center = (tile[0] + tile[2]) / 2 / width, (tile[1] + tile[3]) / 2 / height
+
+    size = min(size, image.size[0], image.size[1])
+    left = min(max(0, int(center[0] * image.size[0]) - size // 2), image.size[0] - size)
+    top = min(max(0, int(center[1] * image.size[1]) - size // 2), image.size[1] - size)
+    return left, top, left + size, top + size
+
+def prepare_page(image_path, resize=None, margin_trim=None):
+    """
+    opens a rendered page and trims and downscales it like jpeg_to_webp does before encoding
+    :param image_path: string
+    :param resize: None or dictionary -> width, quality
+    :param margin_trim: None or tuple from margins.book_trim
+    :return: PIL image
+    """
+    if resize:
+        image = open_for_size(image_path, width=resize['width'], quality=resize['quality'])
+    else:
+        image = Image.open(image_path)
+
+    if margin_trim:
+        image, _ = trim_page(image, margin_trim)
+
+    if resize:
+        image = downscale(image, width=resize['width'], quality=resize['quality'])
+
+    return image
+
+def preview_encode(job):
+    """
+    process job, the page goes through the same trim, resize and classify steps as in a
+    real conversion and is encoded into memory, the crop is cut from the decoded webp
+    :param job: tuple -> image_path, preset, quality, resize (None or dictionary -> width, quality), classify,
+                         margin_trim (None or tuple)
+    :return: dictionary -> preset, quality, encoding, seconds (cpu time), bytes, crop (png bytes)
+    """
+    image_path, preset, quality, resize, classify, margin_trim = job
+    image = prepare_page(image_path, resize, margin_trim)
+
+    box = busiest_box(image)
+    options, encoding = webp_options(preset, quality), 'color'
+    if classify:
+        image, options, encoding = choose_encoding(image, options)
+
+    buffer = io.BytesIO()
+    started = time.process_time()
+    image.save(buffer, 'webp', **options)
+    seconds = time.process_time() - started
+
+    crop = io.BytesIO()
+    with Image.open(io.BytesIO(buffer.getvalue())) as encoded:
+        encoded.crop(box).save(crop, 'png', compress_level=1)
+
+    return dict(preset=preset, quality=options['quality'], encoding=encoding, seconds=seconds,
+                bytes=len(buffer.getvalue()), crop=crop.getvalue())
+
+def preview_page(image_path, variants, page_count, resize=None, classify=False, margin_trim=None):
+    """
+    encodes one rendered page with every variant at once on a process pool
+    :param image_path: string, rendered page
+    :param variants: list from preview_variants
+    :param page_count: integer, pages in the book
+    :param resize: None or dictionary -> width, quality
+    :param classify: bool
+    :param margin_trim: None or tuple from margins.book_trim
+    :return: list with preview_encode dictionaries, each with book_bytes (this page times page_count)
+    """
+    jobs = [(image_path, preset, quality, resize, classify, margin_trim,) for preset, quality in variants]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, min(len(jobs), os.cpu_count() or 1))) as executor:
+        rv = list(executor.map(preview_encode, jobs))
+
+    for result in rv:
+        result['book_bytes'] = result['bytes'] * page_count
+
+    return rv
+
+def preview_caption(result):
+    """
+    :param result: dictionary from preview_page
+    :return: string -> 'Q70 BALANCED | 212kb | 0.41s | BOOK ~61MB'
+    """
+    return (f"Q{result['quality']} {result['preset'].upper()} | {round(result['bytes'] / 1000)}kb | "
+            f"{round(result['seconds'], 2)}s | BOOK ~{round(result['book_bytes'] / 1000000)}MB")
@@ -0,0 +1,346 @@
+from PIL       import Image
+from pdf2image import convert_from_path
+import concurrent.futures
+import importlib.util
+import os
+import platform
+import queue
+import subprocess
+import threading
+import time
+
+# poppler: pdf2image runs pdftoppm, every call reparses the pdf and the pages go through files
+# pdfium: pypdfium2 renders inside the worker process straight into memory, the document is
+#         opened once per process and kept for the following batches of the same job
+RENDERERS = ['poppler', 'pdfium']
+DEFAULT_RENDERER = 'poppler'
+JPEG_OPTIONS = dict(quality=100, optimize=True) # same as the jpegopt given to pdftoppm
+STREAM_LOOKAHEAD = 1 # pages rendered ahead of the consumer, each is ~60mb at 485 dpi
+
+_documents = {}
+_documents_lock = threading.RLock() # pdfium is not thread safe, within a process one thread at a time uses it
+
+def available_renderers():
+    """
+    :return: list with renderers that can run here
+    """
+    return [x for x in RENDERERS if x != 'pdfium' or importlib.util.find_spec('pypdfium2')]
+
+def renderer_or_default(renderer):
+    """
+    :param renderer: string or None
+    :return: string, renderer if it can run here else DEFAULT_RENDERER
+    """
+    return renderer if renderer in available_renderers() else DEFAULT_RENDERER
+
+def pdfium_document(source_file):
+    """
+    :param source_file: string
+    :return: pdfium.PdfDocument, cached for this process (one document at a time),
+             only to be used while holding _documents_lock
+    """
+    import pypdfium2 as pdfium # loads pdfium, only worth it once a job uses it
+
+    with _documents_lock:
+        if source_file not in _documents:
+            close_documents()
+            _documents[source_file] = pdfium.PdfDocument(source_file)
+
+        return _documents[source_file]
+
+def close_documents():
+    """
+    closes the cached document, for processes that render now and then (the gui) instead of a whole job
+    """
+    with _documents_lock:
+        for document in _documents.values():
+            document.close()
+
+        _documents.clear()
+
+def pdfium_pages(source_file, first_page, last_page, dpi, grayscale=False):
+    """
+    :param source_file: string
+    :param first_page: integer, counting from 1 like pdf2image
+    :param last_page: integer
+    :param dpi: integer
+    :param grayscale: bool
+    :return: generator with (page, PIL image) tuples
+    """
+    with _documents_lock:
+        page_count = len(pdfium_document(source_file))
+
+    last_page = min(last_page or page_count, page_count)
+
+    for page_number in range(max(1, first_page or 1), last_page + 1):
+        # the lock is never held across a yield, another thread may have switched documents meanwhile
+        with _documents_lock:
+            page = pdfium_document(source_file)[page_number - 1]
+            image = page.render(scale=dpi / 72, grayscale=grayscale).to_pil()
+            page.close()
+
+        yield page_number, image
+
+def render_pages(source_file, first_page, last_page, dpi, grayscale=False, poppler_path=None, renderer=DEFAULT_RENDERER):
+    """
+    :param source_file: string
+    :param first_page: integer
+    :param last_page: integer
+    :param dpi: integer
+    :param grayscale: bool
+    :param poppler_path: string or None
+    :param renderer: string, key in RENDERERS
+    :return: list with PIL images
+    """
+    if renderer_or_default(renderer) == 'pdfium':
+        return [image for _, image in pdfium_pages(source_file, first_page, last_page, dpi, grayscale)]
+
+    return convert_from_path(
+        source_file,
+        dpi=dpi,
+        first_page=first_page,
+        last_page=last_page,
+        grayscale=grayscale,
+        poppler_path=poppler_path,
+    )
+
+def read_ppm(stream):
+    """
+    reads one binary ppm/pgm image (P6/P5, what pdftoppm writes to stdout) from stream
+    :param stream: binary file object
+    :return: PIL image or None at end of stream
+    """
+    magic = stream.read(2)
+    if len(magic) < 2:
+        return None
+
+    header = []
+    while len(header) < 3:
+        token = b''
+        while True:
+            char = stream.read(1)
+            if not char:
+                return None
+            elif char == b'#' and not token:
+                stream.readline()
+            elif char.isspace():
+                if token:
+                    break
+            else:
+                token += char
+
+        header.append(int(token))
+
+    width, height, _ = header
+    mode = 'L' if magic == b'P5' else 'RGB'
+    size = width * height * (1 if mode == 'L' else 3)
+
+    data = stream.read(size)
+    if len(data) < size:
+        return None
+
+    return Image.frombuffer(mode, (width, height), data, 'raw', mode, 0, 1)
+
+def pdftoppm_pages(source_file, first_page, last_page, dpi, grayscale=False, poppler_path=None):
+    """
+    one pdftoppm process renders the whole range to stdout and pages are read off the
+    pipe one by one, pdftoppm blocks on the full pipe while nobody is reading
+    :param source_file: string
+    :param first_page: integer
+    :param last_page: integer
+    :param dpi: integer
+    :param grayscale: bool
+    :param poppler_path: string or None
+    :return: generator with (page, PIL image) tuples
+    """
+    command = os.path.join(poppler_path, 'pdftoppm') if poppler_path else 'pdftoppm'
+    command = [command, '-r', str(dpi), '-f', str(max(1, first_page or 1)), '-l', str(last_page)]
+    if grayscale:
+        command.append('-gray')
+
+    startupinfo = None
+    if platform.system() == 'Windows':
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+    process = subprocess.Popen(command + [source_file], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                               startupinfo=startupinfo)
+    try:
+        page = max(1, first_page or 1)
+        while True:
+            image = read_ppm(process.stdout)
+            if image is None:
+                break
+
+            yield page, image
+            page += 1
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+
+class PageStream:
+    def __init__(self, source_file, first_page, last_page, dpi, grayscale=False, poppler_path=None,
+                 renderer=DEFAULT_RENDERER, lookahead=STREAM_LOOKAHEAD):
+        """
+        iterates over rendered pages one at a time, a thread keeps rendering up to
+        lookahead pages ahead of the consumer and then waits, so a worker can encode
+        page n while page n+1 renders without a tmp folder or a whole batch in memory
+        :param source_file: string
+        :param first_page: integer, counting from 1
+        :param last_page: integer
+        :param dpi: integer
+        :param grayscale: bool
+        :param poppler_path: string or None
+        :param renderer: string, key in RENDERERS
+        :param lookahead: integer
+        """
+        if renderer_or_default(renderer) == 'pdfium':
+            self.pages = pdfium_pages(source_file, first_page, last_page, dpi, grayscale)
+        else:
+            self.pages = pdftoppm_pages(source_file, first_page, last_page, dpi, grayscale, poppler_path)
+
+        self.buffer = queue.Queue(maxsize=max(1, lookahead))
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.produce, daemon=True)
+        self.thread.start()
+
+    def produce(self):
+        try:
+            for item in self.pages:
+                while not self.stopped.is_set():
+                    try:
+                        self.buffer.put(item, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+
+                if self.stopped.is_set():
+                    break
+
+        except Exception as error:
+            self.buffer.put(error)
+        finally:
+            self.pages.close()
+            self.buffer.put(None)
+
+    def __iter__(self):
+        while True:
+            item = self.buffer.get()
+            if item is None:
+                return
+            elif isinstance(item, Exception):
+                raise item
+
+            yield item
+
+    def close(self):
+        """
+        stops the renderer early, pages still in the buffer are dropped
+        """
+        self.stopped.set()
+        while self.thread.is_alive():
+            try:
+                self.buffer.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def render_to_files(source_file, output_folder, first_page, last_page, output_file, dpi,
+                    grayscale=False, poppler_path=None, renderer=DEFAULT_RENDERER):
+    """
+    :param source_file: string
+    :param output_folder: string
+    :param first_page: integer
+    :param last_page: integer
+    :param output_file: string, filename prefix
+    :param dpi: integer
+    :param grayscale: bool
+    :param poppler_path: string or None
+    :param renderer: string, key in RENDERERS
+    :return: list with jpeg paths in page order
+    """
+    if renderer_or_default(renderer) == 'pdfium':
+        image_list = []
+        for page, image in pdfium_pages(source_file, first_page, last_page, dpi, grayscale):
+            path = os.path.join(output_folder, f'{output_file}-{str(page).zfill(5)}.jpg')
+            image.save(path, 'jpeg', **JPEG_OPTIONS)
+            image.close()
+            image_list.append(path)
+
+        return image_list
+
+    return convert_from_path(
+        source_file,
+        dpi=dpi,
+        first_page=first_page,
+        last_page=last_page,
+        fmt='jpeg',
+        output_file=output_file,
+        output_folder=output_folder,
+        paths_only=True,
+        jpegopt=JPEG_OPTIONS,
+        grayscale=grayscale,
+        poppler_path=poppler_path,
+    )
+
+def benchmark_render(job):
+    """
+    process job, renders the same pages to files and into memory with one renderer
+    :param job: tuple -> renderer, source_file, first_page, last_page, dpi, poppler_path, tmp_folder
+    :return: dictionary with renderer, pages, files_seconds, memory_seconds
+    """
+    renderer, source_file, first_page, last_page, dpi, poppler_path, tmp_folder = job
+
+    started = time.perf_counter()
+    paths = render_to_files(source_file, tmp_folder, first_page, last_page, renderer, dpi,
+                            poppler_path=poppler_path, renderer=renderer)
+    files_seconds = time.perf_counter() - started
+
+    for path in paths:
+        os.remove(path)
+
+    started = time.perf_counter()
+    images = render_pages(source_file, first_page, last_page, dpi, poppler_path=poppler_path, renderer=renderer)
+    memory_seconds = time.perf_counter() - started
+
+    return dict(renderer=renderer, pages=len(images), files_seconds=files_seconds, memory_seconds=memory_seconds)
+
+def benchmark_renderers(samples, dpi, tmp_folder, poppler_path=None):
+    """
+    every sample is rendered by every available renderer, one fresh process per run
+    so caches and document handles from the previous run dont help the next one
+    :param samples: list with (source_file, first_page, last_page) tuples
+    :param dpi: integer
+    :param tmp_folder: string
+    :param poppler_path: string or None
+    :return: string report
+    """
+    lines = []
+    for renderer in available_renderers():
+        pages, files_seconds, memory_seconds = 0, 0, 0
+        for source_file, first_page, last_page in samples:
+            job = (renderer, source_file, first_page, last_page, dpi, poppler_path, tmp_folder,)
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+                rv = executor.submit(benchmark_render, job).result()
+
+            pages += rv['pages']
+            files_seconds += rv['files_seconds']
+            memory_seconds += rv['memory_seconds']
+
+        pages = pages or 1
+        lines.append(f"{renderer.upper()}: {round(files_seconds / pages, 3)}s/page to jpeg files | "
+                     f"{round(memory_seconds / pages, 3)}s/page into memory")
+
+    if 'pdfium' not in available_renderers():
+        lines.append('PDFIUM: pypdfium2 is not installed')
+
+    return '\n'.join(lines)
@@ -0,0 +1,120 @@
+from PIL import Image
+import concurrent.futures
+import platform
+import psutil
+import time
+
+# every level decodes jpegs in draft mode (libjpeg scales by 1/2, 1/4 or 1/8 while
+# decoding) and lets Image.resize reduce by an integer factor before the final filter
+RESIZE_QUALITY = {
+    'fast': dict(resample=Image.Resampling.BILINEAR, reducing_gap=2.0),
+    'balanced': dict(resample=Image.Resampling.BICUBIC, reducing_gap=2.5),
+    'high': dict(resample=Image.Resampling.LANCZOS, reducing_gap=3.0),
+}
+
+DEFAULT_RESIZE_QUALITY = 'high'
+MAX_WIDTH_4K = 3840
+
+def fit_size(image_size, width=None, height=None):
+    """
+    :param image_size: tuple with width, height
+    :param width: integer or None
+    :param height: integer or None
+    :return: tuple with width, height keeping aspect ratio, never larger than image_size
+    """
+    w, h = image_size
+    if width and w > width:
+        return width, max(1, round(h * (width / w)))
+    elif height and h > height:
+        return max(1, round(w * (height / h))), height
+
+    return w, h
+
+def open_for_size(path, width=None, height=None, quality=DEFAULT_RESIZE_QUALITY):
+    """
+    opens an image and lets jpegs decode straight into a smaller bitmap when that is
+    enough for the requested size (kept reducing_gap times larger than the target)
+    :param path: string
+    :param width: integer or None
+    :param height: integer or None
+    :param quality: string, key in RESIZE_QUALITY
+    :return: PIL image
+    """
+    image = Image.open(path)
+    target = fit_size(image.size, width=width, height=height)
+
+    if image.format == 'JPEG' and target != image.size:
+        gap = RESIZE_QUALITY.get(quality, RESIZE_QUALITY[DEFAULT_RESIZE_QUALITY])['reducing_gap']
+        image.draft(image.mode, (int(target[0] * gap), int(target[1] * gap)))
+
+    return image
+
+def downscale(image, width=None, height=None, quality=DEFAULT_RESIZE_QUALITY):
+    """
+    :param image: PIL image
+    :param width: integer or None
+    :param height: integer or None
+    :param quality: string, key in RESIZE_QUALITY
+    :return: PIL image (the same image if it is already small enough)
+    """
+    target = fit_size(image.size, width=width, height=height)
+    if target == image.size:
+        return image
+
+    options = RESIZE_QUALITY.get(quality, RESIZE_QUALITY[DEFAULT_RESIZE_QUALITY])
+    return image.resize(target, **options)
+
+def peak_memory():
+    """
+    :return: integer, peak resident bytes of this process so far
+    """
+    if platform.system() == 'Windows':
+        return psutil.Process().memory_info().peak_wset
+
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if platform.system() == 'Darwin' else peak * 1024
+
+def benchmark_downscale(job):
+    """
+    process job, meant for a fresh process so the peak memory belongs to this run only
+    :param job: tuple -> image_path, width, quality ('legacy' means full decode + LANCZOS)
+    :return: dictionary with quality, seconds and peak_bytes
+    """
+    image_path, width, quality = job
+    baseline = peak_memory()
+    started = time.perf_counter()
+
+    if quality == 'legacy':
+        image = Image.open(image_path)
+        image = image.resize(fit_size(image.size, width=width), Image.Resampling.LANCZOS)
+    else:
+        image = downscale(open_for_size(image_path, width=width, quality=quality), width=width, quality=quality)
+
+    image.load()
+    seconds = time.perf_counter() - started
+
+    return dict(quality=quality, seconds=seconds, peak_bytes=max(0, peak_memory() - baseline))
+
+def benchmark_resize(image_paths, width=MAX_WIDTH_4K):
+    """
+    every sample is downscaled with every quality level plus the legacy path,
+    each run in its own single worker process
+    :param image_paths: list
+    :param width: integer
+    :return: string report
+    """
+    lines = []
+    for quality in ['legacy'] + list(RESIZE_QUALITY):
+        seconds, peak = 0, 0
+        for path in image_paths:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+                rv = executor.submit(benchmark_downscale, (path, width, quality,)).result()
+
+            seconds += rv['seconds']
+            peak = max(peak, rv['peak_bytes'])
+
+        count = len(image_paths) or 1
+        lines.append(f"{quality.upper()}: {round(seconds / count, 3)}s/page | peak {int(peak / 1000000)}mb")
+
+    return '\n'.join(lines)
@@ -0,0 +1,31 @@
+import sys
+import time
+
+# modules that are expensive to import and should not be loaded before the window shows
+HEAVY_MODULES = ['numpy', 'PIL', 'pdf2image', 'psutil', 'pypdfium2']
+
+class StartupProfiler:
+    def __init__(self):
+        """
+        collects named timestamps from the start of launcher.py until the window is up,
+        python -X importtime launcher.py gives the per-module details
+        """
+        self.started = time.perf_counter()
+        self.marks = []
+
+    def mark(self, name):
+        self.marks.append((name, time.perf_counter()))
+
+    def report(self):
+        """
+        :return: string, one line per mark with its own and the accumulated time
+        """
+        lines = []
+        previous = self.started
+        for name, moment in self.marks:
+            lines.append(f'{name}: {int((moment - previous) * 1000)}ms (total {int((moment - self.started) * 1000)}ms)')
+            previous = moment
+
+        loaded = [x for x in HEAVY_MODULES if x in sys.modules]
+        lines.append(f"HEAVY MODULES LOADED: {', '.join(loaded) or 'NONE'}")
+        return '\n'.join(lines)
@@ -0,0 +1,161 @@
+from pdf2image         import convert_from_path, pdfinfo_from_path
+from scripts.renderers import pdfium_document, renderer_or_default
+import concurrent.futures
+import io
+import os
+import platform
+import psutil
+import queue
+import threading
+
+THUMBNAIL_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1)) # leaves a core for the window
+THUMBNAIL_OPTIONS = dict(quality=70, method=1) # same as the covers stored in the database
+
+def render_thumbnail(job):
+    """
+    process job, renders the first page straight at thumbnail height (poppler scales
+    while rendering, pdfium renders at the matching scale) and encodes it to webp
+    :param job: tuple -> path, md5, height, poppler_path, renderer
+    :return: dictionary -> path, md5, cover (webp bytes or None), pages, page_size (pts or None)
+    """
+    path, md5, height, poppler_path, renderer = job
+    rv = dict(path=path, md5=md5, cover=None, pages=None, page_size=None)
+
+    if renderer_or_default(renderer) == 'pdfium':
+        document = pdfium_document(path)
+        page = document[0]
+        rv['pages'] = len(document)
+        rv['page_size'] = page.get_size()
+        image = page.render(scale=height / rv['page_size'][1]).to_pil()
+        page.close()
+    else:
+        info = pdfinfo_from_path(path, poppler_path=poppler_path)
+        rv['pages'] = info.get('Pages')
+        try:
+            width, _, page_height = str(info['Page size']).split()[0:3]
+            rv['page_size'] = float(width), float(page_height)
+        except (KeyError, ValueError):
+            pass
+
+        images = convert_from_path(path, first_page=1, last_page=1, size=(None, height), poppler_path=poppler_path)
+        if not images:
+            return rv
+
+        image = images[0]
+
+    buffer = io.BytesIO()
+    image.save(buffer, 'webp', **THUMBNAIL_OPTIONS)
+    image.close()
+    rv['cover'] = buffer.getvalue()
+    return rv
+
+def lower_priority():
+    """
+    process initializer, these workers give way to conversions and the gui
+    """
+    psutil.Process().nice(psutil.BELOW_NORMAL_PRIORITY_CLASS if platform.system() == 'Windows' else 10)
+
+class ThumbnailPipeline:
+    def __init__(self, workers=THUMBNAIL_WORKERS, low_priority=False):
+        """
+        covers are rendered and encoded in worker processes, away from the gui and its GIL.
+        A screen of files goes in as one batch, finished covers come out of results in
+        the order they complete, the gui drains them on a timer. pending is shared by the
+        gui thread and the executor's callback thread, lock guards it
+        :param workers: integer
+        :param low_priority: bool, workers run niced (prefetching)
+        """
+        self.workers = workers
+        self.low_priority = low_priority
+        self.executor = None
+        self.pending = {}
+        self.lock = threading.RLock() # release cancels under it, a cancelled future calls collect on the spot
+        self.results = queue.Queue()
+        self.generation = 0 # bumped by cancel, results of an older generation are dropped
+
+    @property
+    def busy(self):
+        """
+        :return: bool, covers are rendering or waiting to be drained
+        """
+        with self.lock:
+            return bool(self.pending) or not self.results.empty()
+
+    def submit(self, jobs):
+        """
+        :param jobs: list with render_thumbnail jobs, a path already pending is not submitted again
+        """
+        if not self.executor:
+            # kept between batches, paging through the library doesnt pay for new processes
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers, initializer=lower_priority if self.low_priority else None)
+
+        for job in jobs:
+            with self.lock:
+                if job[0] in self.pending:
+                    continue
+
+                future = self.executor.submit(render_thumbnail, job)
+                future.path, future.generation = job[0], self.generation
+                self.pending[job[0]] = future
+
+            future.add_done_callback(self.collect) # runs right here when the future is done already
+
+    def collect(self, future):
+        """
+        runs on the executor's thread, the result is only queued
+        """
+        with self.lock:
+            if self.pending.get(future.path) is future:
+                self.pending.pop(future.path, None)
+
+        if future.cancelled() or future.exception() or future.generation != self.generation:
+            return
+
+        self.results.put(future.result())
+
+    def release(self, path):
+        """
+        gives up path if it hasnt started rendering yet
+        :param path: string
+        :return: bool, False when path is rendering already and its result is still coming
+        """
+        with self.lock:
+            future = self.pending.get(path)
+            if future and not future.cancel():
+                return False
+
+            self.pending.pop(path, None)
+            return True
+
+    def drain(self):
+        """
+        :return: list with render_thumbnail results that arrived since the last drain
+        """
+        rv = []
+        while True:
+            try:
+                rv.append(self.results.get_nowait())
+            except queue.Empty:
+                return rv
+
+    def cancel(self):
+        """
+        drops everything not started yet and whatever is waiting in results,
+        covers already rendering finish but are never handed out
+        """
+        with self.lock:
+            self.generation += 1
+            futures = list(self.pending.values())
+            self.pending.clear()
+
+        for future in futures:
+            future.cancel() # outside the lock, a cancelled future calls collect right away
+
+        self.drain()
+
+    def shutdown(self):
+        if self.executor:
+            self.cancel()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
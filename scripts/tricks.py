@@ -1,7 +1,8 @@
 from PyQt5.Qt               import QObject, QRunnable, QThreadPool
-from PyQt5.QtCore           import pyqtSignal, pyqtSlot
+from PyQt5.QtCore           import QTimer, pyqtSignal, pyqtSlot
 from functools              import partial
 from scripts.database_stuff import sqlite, DB
+from scripts.resize         import downscale, open_for_size
 import hashlib
 import os
 import pathlib
@@ -10,7 +11,6 @@ import sys
 import tempfile
 import time
 import traceback
-from PIL import Image
 
 class ViktorinoxTechClass:
     def __init__(self):
@@ -18,25 +18,15 @@ class ViktorinoxTechClass:
 
     @staticmethod
     def save_image_as_blob(image_path, md5, width=None, height=None, quality=70, method=1):
-        image = Image.open(image_path)
-
-        if width:
-            height = round(image.size[1] * (width / image.size[0]))
-        elif height:
-            width = round(image.size[0] * (height / image.size[1]))
-        else:
-            width = image.size[0]
-            height = image.size[1]
-
-        image_size = width, height
-        image.thumbnail(image_size, Image.ANTIALIAS)
+        image = open_for_size(image_path, width=width, height=height)
+        image = downscale(image, width=width, height=height)
 
         tmp_file = tech.tmp_file(part1='webpcover_', part2='.webp', new=True)
         image.save(tmp_file, 'webp', method=method, quality=quality)
 
         with open(tmp_file, 'rb') as file:
             blob = file.read()
-            query = 'update files set cover = (?) where md5 = (?)'
+            query = 'insert or replace into covers (cover, md5) values (?,?)'
             sqlite.w(query, values=md5, blob=blob)
 
         os.remove(tmp_file)
@@ -113,6 +103,35 @@ class ViktorinoxTechClass:
         threadpool = tech.threadpool(name=name, threads=threads)
         threadpool.start(thread, priority=priority)
 
+    def schedule(self, function, msec=0, name=None):
+        """
+        runs function on the gui thread once the event loop is free and msec has passed,
+        nothing sleeps in a threadpool for it. A named schedule replaces the pending one
+        with the same name instead of stacking up, cancel(name) drops it
+        :param function: callable
+        :param msec: integer
+        :param name: string or None
+        """
+        if not name:
+            QTimer.singleShot(msec, function)
+            return
+
+        self.cancel(name)
+
+        timer = QTimer(singleShot=True, interval=msec)
+        timer.timeout.connect(function)
+        timer.start()
+        self.techdict.setdefault('timers', {})[name] = timer
+
+    def cancel(self, name):
+        """
+        :param name: string given to schedule
+        """
+        timer = self.techdict.get('timers', {}).pop(name, None)
+        if timer:
+            timer.stop()
+            timer.deleteLater()
+
     @staticmethod
     def retrieve_setting(index):
         """
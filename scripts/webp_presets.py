@@ -0,0 +1,88 @@
+from PIL import Image
+import concurrent.futures
+import io
+import time
+
+# named webp encoder settings, quality None means the WEBP QUALITY slider decides,
+# method is libwebp's speed/size tradeoff (0 fastest, 6 smallest). Method is the only
+# knob that changes anything here: Pillow's lossy still image encoder takes quality,
+# method and the alpha/transparency options (exact, alpha_quality) and rendered pages
+# have no alpha, minimize_size, kmin and kmax only apply to animations
+WEBP_PRESETS = {
+    'fast': dict(method=2, quality=None),
+    'balanced': dict(method=4, quality=None),
+    'max-compression': dict(method=6, quality=None),
+}
+
+DEFAULT_PRESET = 'max-compression' # method=6 is what every job used before presets
+
+def webp_options(preset, quality):
+    """
+    :param preset: string, key in WEBP_PRESETS (unknown falls back to DEFAULT_PRESET)
+    :param quality: integer from the slider
+    :return: dictionary ready for image.save(..., 'webp', **options)
+    """
+    options = dict(WEBP_PRESETS.get(preset, WEBP_PRESETS[DEFAULT_PRESET]))
+
+    if options['quality'] is None:
+        options['quality'] = quality
+
+    return options
+
+def benchmark_encode(job):
+    """
+    process job, encodes one page with one preset into memory
+    :param job: tuple -> image_path, preset, quality
+    :return: dictionary with preset, seconds (cpu time) and bytes
+    """
+    image_path, preset, quality = job
+    image = Image.open(image_path)
+    image.load()
+
+    buffer = io.BytesIO()
+    started = time.process_time()
+    image.save(buffer, 'webp', **webp_options(preset, quality))
+    seconds = time.process_time() - started
+
+    return dict(preset=preset, seconds=seconds, bytes=len(buffer.getvalue()))
+
+def benchmark_presets(image_paths, quality, presets=None):
+    """
+    encodes every sample page with every preset on a process pool, cpu time is
+    measured inside the worker so parallel runs dont skew each other much
+    :param image_paths: list with rendered sample pages
+    :param quality: integer
+    :param presets: list or None for every preset
+    :return: list with dictionaries -> preset, seconds, bytes, pages (totals per preset)
+    """
+    presets = presets or list(WEBP_PRESETS)
+    jobs = [(path, preset, quality,) for preset in presets for path in image_paths]
+
+    totals = {x: dict(preset=x, seconds=0, bytes=0, pages=0) for x in presets}
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        for rv in executor.map(benchmark_encode, jobs):
+            totals[rv['preset']]['seconds'] += rv['seconds']
+            totals[rv['preset']]['bytes'] += rv['bytes']
+            totals[rv['preset']]['pages'] += 1
+
+    return [totals[x] for x in presets]
+
+def benchmark_report(results):
+    """
+    :param results: list from benchmark_presets
+    :return: string, one line per preset relative to the smallest output
+    """
+    if not results:
+        return 'NOTHING TO BENCHMARK'
+
+    smallest = min(x['bytes'] for x in results) or 1
+    lines = []
+    for rv in results:
+        pages = rv['pages'] or 1
+        lines.append(
+            f"{rv['preset'].upper()}: {round(rv['seconds'] / pages, 2)}s/page | "
+            f"{round(rv['bytes'] / pages / 1000)}kb/page | "
+            f"{round(rv['bytes'] / smallest * 100 - 100, 1)}% larger than smallest"
+        )
+
+    return '\n'.join(lines)
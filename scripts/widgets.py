@@ -1,12 +1,18 @@
 from PyQt5                  import QtCore, QtGui, QtWidgets
 from PyQt5.QtGui            import QPixmap
-from pathlib                import Path
-from scripts.database_stuff import DB, sqlite
+from functools              import partial
+from scripts.autotune       import AUTOTUNE_MODES
+from scripts.content_hash   import DUPLICATE_RULES
+from scripts.dashboard      import DASHBOARD_INTERVAL
+from scripts.database_stuff import sqlite
+from scripts.margins        import trim_summary
+from scripts.page_analysis  import ENCODING_CODES, PAGE_POLICIES, encodings_summary
+from scripts.renderers      import RENDERERS, available_renderers
+from scripts.resize         import RESIZE_QUALITY
 from scripts.tricks         import tech as t
+from scripts.webp_presets   import WEBP_PRESETS
 import math
 import os
-import pathlib
-import random
 import shutil
 import time
 
@@ -35,11 +41,126 @@ class DevLabel(QtWidgets.QLabel):
             menu = QtWidgets.QMenu()
             yes_store_covers = menu.addAction('Store covers in database (quicker browsing, larger database)')
             no_store_covers = menu.addAction('Dont store covers in database (default)')
+            menu.addSeparator()
+            memory_cap = menu.addAction(f'RAM cap for IN MEMORY jobs ({self.main.get_memory_cap()}mb)')
+            page_cache = menu.addAction(f'Rendered page cache, re-encodes skip rendering ({self.main.get_page_cache_mb()}mb)')
+            resize_menu = menu.addMenu('RESIZE < 4K quality')
+            resize_qualities = {}
+            for quality in RESIZE_QUALITY:
+                resize_action = resize_menu.addAction(quality.upper())
+                resize_action.setCheckable(True)
+                resize_action.setChecked(self.main.get_resize_quality() == quality)
+                resize_qualities[resize_action] = quality
+
+            policy_menu = menu.addMenu('Blank and duplicate pages')
+            policies = {}
+            for policy in PAGE_POLICIES:
+                policy_action = policy_menu.addAction(policy.upper())
+                policy_action.setCheckable(True)
+                policy_action.setChecked(self.main.get_page_policy() == policy)
+                policies[policy_action] = policy
+
+            autotune_menu = menu.addMenu('Auto-tune quality per book')
+            autotune_modes = {}
+            for mode in AUTOTUNE_MODES:
+                autotune_action = autotune_menu.addAction(mode.upper())
+                autotune_action.setCheckable(True)
+                autotune_action.setChecked(self.main.get_autotune() == mode)
+                autotune_modes[autotune_action] = mode
+
+            autotune_menu.addSeparator()
+            target_ssim = autotune_menu.addAction(f"SSIM target ({self.main.get_autotune_target('ssim')})")
+            target_size = autotune_menu.addAction(f"MB per page target ({self.main.get_autotune_target('size')})")
+
+            duplicate_menu = menu.addMenu('Duplicate files (full content hash)')
+            duplicate_rules = {}
+            for rule in DUPLICATE_RULES:
+                rule_action = duplicate_menu.addAction(rule.upper())
+                rule_action.setCheckable(True)
+                rule_action.setChecked(self.main.get_duplicate_rule() == rule)
+                duplicate_rules[rule_action] = rule
+
+            duplicate_menu.addSeparator()
+            duplicates = duplicate_menu.addAction('Duplicates report for source folder')
+
+            renderer_menu = menu.addMenu('Renderer')
+            renderers = {}
+            for renderer in RENDERERS:
+                renderer_action = renderer_menu.addAction(renderer.upper())
+                renderer_action.setCheckable(True)
+                renderer_action.setChecked(self.main.get_renderer() == renderer)
+                renderer_action.setEnabled(renderer in available_renderers())
+                renderers[renderer_action] = renderer
+
+            menu.addSeparator()
+            projection = menu.addAction('Projected completion of visible files')
+            dashboard = menu.addAction('Live dashboard (pages/sec, workers, disks, ETA)')
+            archives = menu.addAction('Queue CBZ archives in source folder for recompression (CONTINOUS runs them)')
+            benchmark = menu.addAction('Benchmark WEBP presets on pages from current library')
+            benchmark_resize = menu.addAction('Benchmark 4K downscale on pages from current library')
+            benchmark_render = menu.addAction('Benchmark renderers on pages from current library')
             action = menu.exec_(self.mapToGlobal(ev.pos()))
             if action == yes_store_covers:
                 sqlite.w('update settings set store_covers = (?)', True)
             elif action == no_store_covers:
                 sqlite.w('update settings set store_covers = (?)', False)
+            elif action == memory_cap:
+                value, ok = QtWidgets.QInputDialog.getInt(
+                    self.main, 'IN MEMORY', 'Megabytes per job before spilling:',
+                    value=self.main.get_memory_cap(), min=50, max=1000000)
+                if ok:
+                    sqlite.w('update settings set memory_cap_mb = (?)', value)
+            elif action == page_cache:
+                value, ok = QtWidgets.QInputDialog.getInt(
+                    self.main, 'PAGE CACHE', 'Megabytes of rendered pages kept between jobs (0 is off):',
+                    value=self.main.get_page_cache_mb(), min=0, max=10000000)
+                if ok:
+                    sqlite.w('update settings set page_cache_mb = (?)', value)
+                    t.start_thread(self.main.evict_page_cache, name='page_cache')
+            elif action == projection:
+                self.main.show_projection()
+            elif action == dashboard:
+                self.main.show_dashboard()
+            elif action == archives:
+                t.start_thread(self.main.enqueue_archives, worker_arguments=self.main.from_dir.toPlainText().strip(),
+                               finished_function=self.main.start_next_job, name='queue')
+            elif action in resize_qualities:
+                sqlite.w('update settings set resize_quality = (?)', resize_qualities[action])
+            elif action in policies:
+                sqlite.w('update settings set page_policy = (?)', policies[action])
+            elif action in renderers:
+                sqlite.w('update settings set renderer = (?)', renderers[action])
+            elif action in autotune_modes:
+                sqlite.w('update settings set autotune = (?)', autotune_modes[action])
+            elif action == target_ssim:
+                value, ok = QtWidgets.QInputDialog.getDouble(
+                    self.main, 'AUTO-TUNE', 'Lowest mean SSIM the sample pages may score:',
+                    value=self.main.get_autotune_target('ssim'), min=0.5, max=0.999, decimals=3)
+                if ok:
+                    sqlite.w('update settings set autotune_ssim = (?)', value)
+            elif action == target_size:
+                value, ok = QtWidgets.QInputDialog.getDouble(
+                    self.main, 'AUTO-TUNE', 'Megabytes per page the sample pages may average:',
+                    value=self.main.get_autotune_target('size'), min=0.01, max=100, decimals=2)
+                if ok:
+                    sqlite.w('update settings set autotune_mb_page = (?)', value)
+            elif action in duplicate_rules:
+                sqlite.w('update settings set duplicate_rule = (?)', duplicate_rules[action])
+                if duplicate_rules[action] != 'convert':
+                    t.start_thread(self.main.hash_library, name='hashing')
+            elif action == duplicates:
+                self.main.setWindowTitle('HASHING...')
+                t.start_thread(self.main.find_duplicates, name='hashing',
+                               finished_function=[self.main.show_duplicates_report, self.main.show_hdd_spaces])
+            elif action in [benchmark, benchmark_resize, benchmark_render]:
+                self.main.setWindowTitle('BENCHMARKING...')
+                fn = {
+                    benchmark: self.main.benchmark_webp_presets,
+                    benchmark_resize: self.main.benchmark_resize_quality,
+                    benchmark_render: self.main.benchmark_render_backends,
+                }[action]
+                t.start_thread(fn, finished_function=[self.main.show_benchmark_result, self.main.show_hdd_spaces],
+                               name='benchmark')
 
 
 class VerticalLabel(QtWidgets.QWidget):
@@ -66,6 +187,36 @@ class VerticalLabel(QtWidgets.QWidget):
     def paintEvent(self, event):
         self.draw()
 
+class Dashboard(QtWidgets.QDialog):
+    def __init__(self, main):
+        """
+        live numbers from main.dashboard_text, the timer only runs while the window is shown
+        """
+        super().__init__(main)
+        self.main = main
+        self.setWindowTitle('DASHBOARD')
+        self.label = QtWidgets.QLabel(self)
+        self.label.setStyleSheet('font: 9pt monospace')
+        self.label.setTextInteractionFlags(QtCore.Qt.TextSelectableByMouse)
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addWidget(self.label)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+
+    def refresh(self):
+        self.label.setText(self.main.dashboard_text())
+        self.adjustSize()
+
+    def showEvent(self, ev: QtGui.QShowEvent) -> None:
+        self.refresh()
+        self.timer.start(DASHBOARD_INTERVAL)
+        super().showEvent(ev)
+
+    def hideEvent(self, ev: QtGui.QHideEvent) -> None:
+        self.timer.stop()
+        super().hideEvent(ev)
+
 class PDFWidget(GOD):
     def make_labels(self):
         """
@@ -163,9 +314,9 @@ class PDFWidget(GOD):
         self.setToolTip(self.data['path'])
 
     def set_cover_details_instead(self, file):
-        rv = sqlite.ro('select * from files where md5 = (?)', self.data['md5'])
-        if rv and rv[DB.files.cover_data]:
-            self.name_label.setText(rv[DB.files.cover_data])
+        rv = sqlite.ro('select cover_data from files where md5 = (?)', self.data['md5'])
+        if rv and rv[0]:
+            self.name_label.setText(rv[0])
         else:
             _pixmap = QPixmap(file)
             pixels_size = f"{_pixmap.width()} x {_pixmap.height()}"
@@ -251,18 +402,32 @@ class PDFWidget(GOD):
     def change_process_label_two(self, current, total):
         self.change_process_label(self.progress_label_two, self.backlabel_two, current=current, total=total)
 
-    def pre_thread_show_progress(self):
+    def start_progress_timer(self):
+        """
+        progress is polled by a timer owned by this widget, it stops itself once
+        show_progress says the job is over and dies with the widget
+        """
+        if 'progress_timer' not in dir(self):
+            self.progress_timer = QtCore.QTimer(self, interval=500)
+            self.progress_timer.timeout.connect(self.progress_tick)
+
+        self.progress_timer.start()
+        self.progress_tick()
+
+    def progress_tick(self):
+        if not self.show_progress():
+            self.progress_timer.stop()
+
+    def show_progress(self):
         """
-        '''
-        every 0.5s the thread is counting the files in the working directories
-        and making progresslabels relative to that percentage once self.data['work']
-        is set to False the thread exits.
-        '''
-        if 'ERROR' in self.data self.status_label text and stylesheet are set here
+        counts the files in the working directories and makes progresslabels
+        relative to that percentage, if 'ERROR' in self.data self.status_label
+        text and stylesheet are set here
+        :return: bool, False once there is nothing more to show
         """
         def inactive_job_thread_killer(self, checker):
             """
-            as long as the filecount is changing thread stays alive but once filecount
+            as long as the filecount is changing the timer stays alive but once filecount
             is unchanged and one minute have passed Ceasar gives a thumb down
             :param checker [jpeg-files and webp-files9]
             """
@@ -277,12 +442,12 @@ class PDFWidget(GOD):
                 self.inactive_checker = dict(time=time.time() - 1, checklist=checker)
                 return True
             else:
-                print("KILLING THREAD!")
+                print("KILLING PROGRESS TIMER!")
 
         if self.data['error']:
             self.status_label.setText(self.data['error']['text'])
             self.status_label.setStyleSheet(self.data['error']['style'])
-            return
+            return False
 
         inputpath, outputpath = self.generate_dirs()
         tmp_jpeg = t.tmp_folder(inputpath, hash=True, create_dir=False, reuse=True)
@@ -292,34 +457,37 @@ class PDFWidget(GOD):
             self.page_count = self.main.get_page_count_for_pdf(inputpath)
 
         if not self.page_count:
-            return
+            return False
 
         if not self.data['work']:
             if os.path.exists(outputpath):
                 self.change_process_label_one(current=1, total=1)
                 self.change_process_label_two(current=1, total=1)
-            return
+            return False
 
         check_file_list = []
-        for path, fn in {tmp_jpeg: self.change_process_label_one, tmp_webp: self.change_process_label_two}.items():
+        filecounts = {}
+        for path in [tmp_jpeg, tmp_webp]:
+            filecounts[path] = 0
             if os.path.exists(path):
                 for walk in os.walk(path):
-                    filecount = len(walk[2])
-                    if filecount > 0:
-                        fn(current=filecount, total=self.page_count)
+                    filecounts[path] = len(walk[2])
                     check_file_list += walk[2]
                     break
 
-        if not inactive_job_thread_killer(self, check_file_list):
-            return
-
-        t.start_thread(self.main.dummy,
-                       worker_arguments=0.5,
-                       finished_function=self.pre_thread_show_progress,
-                       name='gui', priority=1,
-                       )
+        if self.data.get('progress'):
+            # in-memory jobs have no files to count
+            rendered, encoded = self.data['progress']
+            filecounts = {tmp_jpeg: rendered - encoded, tmp_webp: encoded}
+            check_file_list.append(self.data['progress'])
 
+        # jpegs are deleted once encoded, so rendered pages are jpegs + webps
+        if filecounts[tmp_jpeg] + filecounts[tmp_webp] > 0:
+            self.change_process_label_one(current=filecounts[tmp_jpeg] + filecounts[tmp_webp], total=self.page_count)
+        if filecounts[tmp_webp] > 0:
+            self.change_process_label_two(current=filecounts[tmp_webp], total=self.page_count)
 
+        return bool(inactive_job_thread_killer(self, check_file_list))
 
     def preprocess_file(self):
         if self.data['processed']:
@@ -328,6 +496,7 @@ class PDFWidget(GOD):
         self.data['processed'] = True
         self.data['work'] = True
         self.data['error'] = False
+        self.data['progress'] = None
 
         self.status_label.setText('QUEUED')
         self.status_label.setStyleSheet('background-color: darkMagenta ; color: white')
@@ -353,9 +522,12 @@ class PDFWidget(GOD):
             i.show()
             j.show()
 
-        t.start_thread(self.main.dummy, worker_arguments=0.1)
-        t.start_thread(self.process_file, finished_function=[self.set_vertical_label, self.load_next_job])
-        self.pre_thread_show_progress()
+        self.main.queue.enqueue(self.data['path'], self.data['md5'], self.data.get('priority', 0), force=True)
+
+        t.start_thread(self.process_file, finished_function=[
+            self.set_vertical_label, partial(self.main.queue.settle, self.data['path']),
+            self.progress_tick, self.load_next_job])
+        self.start_progress_timer()
 
     def generate_dirs(self):
         """
@@ -378,69 +550,35 @@ class PDFWidget(GOD):
         def error(self, text, stylesheet='background-color: red ; color: white'):
             self.data['work'] = False
             self.data['error'] = dict(text=text, style=stylesheet)
+            self.main.queue.finish(self.data['path'], ok=False, error=text, retry=False)
+
+        if not self.main.queue.claim(self.data['path']):
+            error(self, 'RUNNING ON ANOTHER WORKER', 'background-color: darkMagenta ; color: white')
+            return False
 
         self.status_label.setText('PROCESSING')
         self.status_label.setStyleSheet('background-color: magenta ; color: white')
 
-        to_dir = self.main.to_dir.toPlainText()
-        filename = self.data['filename']
         inputpath, outputpath = self.generate_dirs()
 
-        if not to_dir:
-            error(self, 'IMPOSSIBLE OUTPUT FOLDER')
+        rv = self.main.check_job(inputpath, outputpath, self.data['md5'])
+        if rv:
+            error(self, *rv)
             return False
 
-        elif not os.path.exists(self.data['path']):
-            error(self, 'INPUT FILE MISSING')
-            return False
-
-        elif filename.find('/') > -1 or filename.find('\\') > -1:
-            error(self, 'SHITTY OS')
-            return False
-
-        if len(to_dir) > 0 and not os.path.exists(to_dir):
-            pathlib.Path(to_dir).mkdir(parents=True)
-
-        if not os.path.exists(to_dir):
-            error(self, 'ERROR CREATING FOLDER')
-            return False
-
-        data = sqlite.ro('select * from files where md5 = (?) and converted = (?)', (self.data['md5'], True,))
-        if data and os.path.exists(outputpath) and os.path.getsize(outputpath) > 0:
-            error(self, 'FILE ALREADY PROCESSED')
-            return False
-
-        elif os.path.exists(outputpath) and os.path.getsize(outputpath) > 0:
-            error(self, 'DESTINATION EXISTS', 'background-color: green ; color: white')
-            return False
-
-        elif os.path.exists(outputpath) and os.path.getsize(outputpath) == 0:
-            try: os.remove(outputpath)
-            except:
-                error(self, 'PERMISSION ERROR')
-                return False
-
-        try:
-            Path(outputpath).touch()
-            if os.path.exists(outputpath):
-                try: os.remove(outputpath)
-                except:
-                    error(self, 'PERMISSION ERROR')
-                    return False
-        except:
-            error(self, 'PERMISSION ERROR')
+        rv = self.main.check_duplicate(inputpath, outputpath)
+        if rv:
+            self.data['work'] = False
+            self.data['error'] = dict(text=rv[0], style=rv[1])
+            self.main.queue.finish(self.data['path'], ok=True, error=rv[0])
             return False
 
+        started = time.time()
         rv = self.main.convert_pdf_to_images(inputpath=self.data['path'], outputpath=outputpath, widget=self)
 
         if rv['status']:
             self.set_pixmap(rv['tmp_webp_folder'])
-
-            if os.path.exists(rv['tmp_webp_folder']):
-                shutil.rmtree(rv['tmp_webp_folder'])
-
-            if os.path.exists(rv['tmp_jpeg_folder']):
-                shutil.rmtree(rv['tmp_jpeg_folder'])
+            self.main.complete_job(inputpath, self.data['md5'], rv, started)
 
             self.status_label.setText('PROCESSED')
             self.status_label.setStyleSheet('background-color: green ; color: white')
@@ -452,35 +590,32 @@ class PDFWidget(GOD):
             filesize = int(filesize)
             self.size_label.setText(str(self.size_label.text()) + ' to ' + str(filesize) + 'MB')
 
-            sqlite.w('update files set converted = (?) where md5 = (?)', (True, self.data['md5'],))
+            if rv['encodings']:
+                codes = ''.join(ENCODING_CODES[rv['encodings'][x]] for x in sorted(rv['encodings']))
+                self.size_label.setToolTip(encodings_summary(codes))
+
+            if rv['page_filter'].active:
+                self.size_label.setToolTip((self.size_label.toolTip() + '\n' + rv['page_filter'].summary()).strip())
 
-            if self.main.delete_source_pdf.isChecked():
-                os.remove(self.data['path'])
+            if rv['margin_trim']:
+                self.size_label.setToolTip((self.size_label.toolTip() + '\n' + trim_summary(rv['margin_trim'])).strip())
+
+            if rv['autotune']:
+                self.size_label.setToolTip((self.size_label.toolTip() + '\n' + rv['autotune']['summary']).strip())
 
         elif not rv['status']:
             self.status_label.setText('HDD FULL')
             self.status_label.setStyleSheet('background-color: red ; color: black')
 
+        self.main.queue.finish(self.data['path'], ok=rv['status'], error=None if rv['status'] else 'HDD FULL')
         self.data['work'] = False
 
     def load_next_job(self):
         """
-        if self.main.continous_convertion is checked another
-        job is added as long as there are files to job from
+        if self.main.continous_convertion is checked another job is taken
+        from the persistent queue as long as there are files to job from
         """
-        for count in range(3):
-            random.shuffle(self.main.widgets['main'])
-            if self.main.continous_convertion.isChecked():
-                for i in self.main.widgets['main']:
-                    if count == 0 and i.status_label.text() == 'QUEUED':
-                        return
-
-                    if count > 0 and not i.data['processed']:
-                        i.preprocess_file()
-                        return True
-
-                if count == 1:
-                    self.main.draw_more_pdf_files()
+        self.main.start_next_job()
 
     def mousePressEvent(self, ev: QtGui.QMouseEvent) -> None:
         class ShadeLabel(QtWidgets.QLabel):
@@ -508,12 +643,55 @@ class PDFWidget(GOD):
             else:
                 menu.addAction('FILE GONE!')
 
+            preset_menu = menu.addMenu('WEBP PRESET FOR THIS FILE')
+            presets = {preset_menu.addAction('USE GLOBAL SETTING'): None}
+            for preset in WEBP_PRESETS:
+                presets[preset_menu.addAction(preset.upper())] = preset
+
+            for preset_action, preset in presets.items():
+                preset_action.setCheckable(True)
+                preset_action.setChecked(self.data.get('preset') == preset)
+
+            preview = menu.addAction('QUALITY PREVIEW OF ONE PAGE') if os.path.exists(self.data['path']) else False
+
+            priority = self.data.get('priority', 0)
+            priority_up = menu.addAction(f'PRIORITY UP ({priority})')
+            priority_down = menu.addAction(f'PRIORITY DOWN ({priority})')
+
+            render_menu = menu.addMenu('RENDER MODE FOR THIS FILE')
+            rv = sqlite.ro('select render_mode from files where md5 = (?)', self.data['md5'])
+            render_modes = {}
+            for mode in ['auto', 'color', 'grayscale']:
+                render_action = render_menu.addAction(mode.upper())
+                render_action.setCheckable(True)
+                render_action.setChecked((rv and rv[0] or 'auto') == mode)
+                render_modes[render_action] = mode
+
             menu.addSeparator()
 
             delete_file = menu.addAction('DELETE FILE (WITHOUT CONFIRMATION!)')
 
             action = menu.exec_(self.mapToGlobal(ev.pos()))
 
+            if action in presets:
+                self.data['preset'] = presets[action]
+
+            elif action in [priority_up, priority_down]:
+                self.data['priority'] = priority + (1 if action == priority_up else -1)
+                sqlite.w('update queue set priority = (?) where path = (?)', (self.data['priority'], self.data['path'],))
+                self.main.show_projection(dialog=False)
+
+            elif action in render_modes:
+                sqlite.w('update files set render_mode = (?) where md5 = (?)', (render_modes[action], self.data['md5'],))
+
+            elif preview and action == preview:
+                page_count = self.main.get_page_count_for_pdf(self.data['path']) or 1
+                page, ok = QtWidgets.QInputDialog.getInt(
+                    self.main, 'QUALITY PREVIEW', f'Page (1 - {page_count}):',
+                    value=max(1, page_count // 2), min=1, max=page_count)
+                if ok:
+                    self.main.start_quality_preview(self, page)
+
             if action == process_file:
                 self.data['processed'] = False
                 self.preprocess_file()
@@ -0,0 +1,274 @@
+from scripts.autotune       import AUTOTUNE_MODES, DEFAULT_AUTOTUNE, DEFAULT_TARGET_MB_PAGE, DEFAULT_TARGET_SSIM
+from scripts.content_hash   import DEFAULT_DUPLICATE_RULE, duplicates_report, hash_files, same_content_converted
+from scripts.database_stuff import DB, sqlite
+from scripts.job_queue      import DEFAULT_ORDERING, LEASE_SECONDS, PersistentQueue
+from scripts.main           import DEFAULT_MEMORY_CAP_MB, TMP_BUDGET, apply_duplicate_rule, check_job, convert_file, enqueue_archives, fingerprint, get_pdf_info, output_path_for, record_conversion
+from scripts.page_analysis  import DEFAULT_PAGE_POLICY
+from scripts.page_cache     import DEFAULT_PAGE_CACHE_MB
+from scripts.renderers      import renderer_or_default
+from scripts.resize         import DEFAULT_RESIZE_QUALITY, MAX_WIDTH_4K, RESIZE_QUALITY
+from scripts.webp_presets   import DEFAULT_PRESET, webp_options
+import multiprocessing
+import os
+import platform
+import threading
+import time
+import traceback
+
+# any number of these can drain the queue table at once, on one machine or on several
+# hosts that open the same database file (point settings.ini at it) and see the pdf
+# and cbz folders under the same paths. Nothing talks to anything but the database:
+# a job is claimed atomically, its lease renewed every HEARTBEAT_SECONDS and a lease
+# that runs out puts the job back within reach of every other worker. A worker that lost
+# its lease never moves its cbz into place. The tmp space admission (TmpBudget) only
+# knows the jobs of its own process: workers started by run_coordinator split the tmp
+# folder between them, workers started by hand on one machine should get a tmp folder each
+
+HEARTBEAT_SECONDS = LEASE_SECONDS // 4
+POLL_SECONDS = 5
+
+def worker_name():
+    return f'{platform.node()}:{os.getpid()}'
+
+def headless_settings():
+    """
+    the same settings the gui would use, read from the settings row
+    :return: dictionary for convert_pdf plus to_dir and del_source
+    """
+    data = sqlite.ro('select * from settings where id is 1')
+
+    poppler_path = data[DB.settings.poppler_path]
+    if not poppler_path or not os.path.exists(poppler_path.strip()):
+        poppler_path = None
+    else:
+        poppler_path = poppler_path.strip()
+
+    resize_quality = data[DB.settings.resize_quality]
+    if resize_quality not in RESIZE_QUALITY:
+        resize_quality = DEFAULT_RESIZE_QUALITY
+
+    quality = data[DB.settings.webp_slider]
+    if quality is None:
+        quality = 70
+
+    autotune = data[DB.settings.autotune]
+    if autotune not in AUTOTUNE_MODES:
+        autotune = DEFAULT_AUTOTUNE
+
+    if autotune == 'size':
+        autotune_target = data[DB.settings.autotune_mb_page] or DEFAULT_TARGET_MB_PAGE
+    else:
+        autotune_target = data[DB.settings.autotune_ssim] or DEFAULT_TARGET_SSIM
+
+    return dict(
+        poppler_path=poppler_path,
+        webp_options=webp_options(data[DB.settings.webp_preset] or DEFAULT_PRESET, quality),
+        resize=dict(width=MAX_WIDTH_4K, quality=resize_quality) if data[DB.settings.resize_4k] else None,
+        classify=bool(data[DB.settings.classify_pages]),
+        pdf_threads=True,
+        webp_threads=True,
+        in_memory=bool(data[DB.settings.in_memory]),
+        memory_cap_mb=data[DB.settings.memory_cap_mb] or DEFAULT_MEMORY_CAP_MB,
+        verify=bool(data[DB.settings.verify_cbz]),
+        renderer=renderer_or_default(data[DB.settings.renderer]),
+        page_policy=data[DB.settings.page_policy] or DEFAULT_PAGE_POLICY,
+        trim_margins=bool(data[DB.settings.trim_margins]),
+        duplicate_rule=data[DB.settings.duplicate_rule] or DEFAULT_DUPLICATE_RULE,
+        page_cache_mb=data[DB.settings.page_cache_mb] or DEFAULT_PAGE_CACHE_MB,
+        autotune=autotune,
+        autotune_target=autotune_target,
+        to_dir=(data[DB.settings.destination_path] or '').strip(),
+        source_path=(data[DB.settings.source_path] or '').strip(),
+        del_source=bool(data[DB.settings.del_source]),
+        job_order=data[DB.settings.job_order] or DEFAULT_ORDERING,
+    )
+
+class Heartbeat(threading.Thread):
+    def __init__(self, queue, path):
+        """
+        renews the lease on path until stopped, lost tells if another worker took it over
+        :param queue: PersistentQueue
+        :param path: string
+        """
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.path = path
+        self.stopped = threading.Event()
+        self.lost = False
+
+    def run(self):
+        while not self.stopped.wait(HEARTBEAT_SECONDS):
+            if not self.queue.renew(self.path):
+                self.lost = True
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def hold(self):
+        """
+        renews right away, asked before the finished cbz is moved into place
+        :return: bool, this worker still holds the job
+        """
+        if not self.lost and not self.queue.renew(self.path):
+            self.lost = True
+
+        return not self.lost
+
+def run_job(queue, job, settings):
+    """
+    :param queue: PersistentQueue, job is already claimed by it
+    :param job: dictionary -> path, md5
+    :param settings: dictionary from headless_settings
+    """
+    path, md5 = job['path'], job['md5'] or fingerprint(job['path'])
+    outputpath = output_path_for(path, settings['to_dir'])
+
+    rv = apply_duplicate_rule(path, outputpath, settings['to_dir'], settings['duplicate_rule'])
+    if rv:
+        print(queue.worker, rv[0], path)
+        queue.finish(path, ok=True, error=rv[0])
+        return
+
+    data = sqlite.ro('select converted from files where md5 = (?)', md5)
+    if data and data[0] and same_content_converted(path, md5) is not False:
+        print(queue.worker, 'SIMILAR FILE PROCESSED', path)
+        queue.finish(path, ok=True, error='SIMILAR FILE PROCESSED')
+        return
+
+    rv = check_job(path, outputpath, md5, settings['to_dir'])
+    if rv:
+        print(queue.worker, rv[0], path)
+        queue.finish(path, ok=False, error=rv[0], retry=False)
+        return
+
+    heartbeat = Heartbeat(queue, path)
+    heartbeat.start()
+
+    try:
+        print(queue.worker, 'CONVERTING', path)
+        rv = convert_file(path, outputpath, md5, dict(settings, may_move=heartbeat.hold))
+    finally:
+        heartbeat.stop()
+
+    if heartbeat.lost:
+        # someone else thought we were dead and has the job now, our cbz was never moved into place
+        print(queue.worker, 'LEASE LOST', path)
+        return
+
+    if rv['status']:
+        record_conversion(md5, rv)
+        if settings['del_source'] and path != rv['outputpath']:
+            os.remove(path)
+
+    queue.finish(path, ok=rv['status'], error=None if rv['status'] else 'HDD FULL')
+    print(queue.worker, 'DONE' if rv['status'] else 'HDD FULL', path)
+
+def run_worker(once=False, tmp_share=1):
+    """
+    claims and converts jobs until the process is stopped
+    :param once: bool, return as soon as the queue has nothing left to claim
+    :param tmp_share: integer, workers on this machine sharing the tmp folder
+    """
+    TMP_BUDGET.share = tmp_share
+    queue = PersistentQueue(worker=worker_name())
+    print(queue.worker, 'WAITING FOR JOBS')
+
+    while True:
+        settings = headless_settings()
+        job = queue.claim_next(settings['job_order'])
+
+        if not job:
+            if once:
+                return
+
+            time.sleep(POLL_SECONDS)
+            continue
+
+        try:
+            run_job(queue, job, settings)
+        except Exception:
+            traceback.print_exc()
+            queue.finish(job['path'], ok=False, error='CRASHED')
+
+def enqueue_folder(queue, folder, poppler_path=None):
+    """
+    every pdf below folder that isnt converted goes into the queue
+    :param queue: PersistentQueue
+    :param folder: string
+    :param poppler_path: string or None
+    :return: integer, files queued
+    """
+    count = 0
+    for walk in os.walk(folder):
+        for f in walk[2]:
+            if f.split('.')[-1].lower() != 'pdf':
+                continue
+
+            path = os.path.abspath(os.path.expanduser(walk[0] + '/' + f))
+            md5 = fingerprint(path)
+
+            rv = sqlite.ro('select converted from files where md5 = (?)', md5)
+            if not rv:
+                sqlite.w('insert or ignore into files (md5) values (?)', md5)
+
+            elif rv[0] and same_content_converted(path, md5) is not False:
+                continue
+
+            get_pdf_info(path, poppler_path, md5)
+            queue.enqueue(path, md5)
+            count += 1
+
+    return count
+
+def run_duplicates_report():
+    """
+    hashes every pdf and cbz in the source folder (only new and changed files are read) and prints the report
+    """
+    settings = headless_settings()
+    paths = []
+    for walk in os.walk(settings['source_path']):
+        paths += [os.path.join(walk[0], f) for f in walk[2] if f.split('.')[-1].lower() in ['pdf', 'cbz']]
+
+    print('HASHED', hash_files([os.path.abspath(x) for x in paths], fingerprint), 'FILES')
+    print(duplicates_report())
+
+def run_coordinator(workers=0, archives=False):
+    """
+    queues the source folder, optionally starts local workers and reports
+    until nothing is queued or running anymore
+    :param workers: integer, worker processes to start on this machine
+    :param archives: bool, cbz files in the source folder are queued for recompression as well
+    """
+    queue = PersistentQueue(worker=worker_name())
+    settings = headless_settings()
+
+    if not os.path.exists(settings['source_path']):
+        print('SOURCE FOLDER MISSING:', settings['source_path'])
+        return
+
+    print('QUEUED', enqueue_folder(queue, settings['source_path'], settings['poppler_path']), 'FILES')
+    if archives:
+        print('QUEUED', enqueue_archives(queue, settings['source_path']), 'ARCHIVES')
+
+    # spawned, a forked child would inherit the sqlite handle without the thread serving it
+    context = multiprocessing.get_context('spawn')
+    processes = []
+    for _ in range(workers):
+        process = context.Process(target=run_worker, kwargs=dict(tmp_share=workers))
+        process.start()
+        processes.append(process)
+
+    while True:
+        counts = queue.counts()
+        print(' | '.join(f'{k.upper()}: {v}' for k, v in counts.items()))
+
+        if not counts.get('queued') and not counts.get('running'):
+            break
+
+        time.sleep(POLL_SECONDS * 6)
+
+    for process in processes:
+        process.terminate() # idle, there is nothing left to claim
+        process.join()